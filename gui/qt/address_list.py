@@ -23,12 +23,13 @@
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+from collections import namedtuple
 from functools import partial
 
-from .util import MyTreeWidget, MONOSPACE_FONT, SortableTreeWidgetItem, rate_limited, webopen
-from PyQt5.QtCore import Qt
+from .util import MONOSPACE_FONT, rate_limited, webopen
+from PyQt5.QtCore import Qt, QAbstractItemModel, QModelIndex
 from PyQt5.QtGui import QFont, QColor, QKeySequence
-from PyQt5.QtWidgets import QTreeWidgetItem, QAbstractItemView, QMenu
+from PyQt5.QtWidgets import QTreeView, QAbstractItemView, QHeaderView, QMenu
 from electroncash.i18n import _
 from electroncash.address import Address
 from electroncash.plugins import run_hook
@@ -37,21 +38,429 @@ from electroncash.util import profiler
 from electroncash import networks
 
 
-class AddressList(MyTreeWidget):
-    filter_columns = [0, 1, 2]  # Address, Label, Balance
+AddressInfo = namedtuple('AddressInfo', 'balance, num_tx, is_hidden')
+
+
+class AddressNode:
+    ''' A row of an AddressModel with rows under it: the Receiving or Change
+    addresses, or the used (or empty) ones of those. '''
+
+    __slots__ = ('name', 'parent', 'children')
+
+    def __init__(self, name, parent):
+        self.name = name
+        self.parent = parent
+        self.children = []  # AddressNodes first, then Addresses
+
+
+class AddressModel(QAbstractItemModel):
+    ''' The rows of an AddressList: the wallet's receiving and change
+    addresses (under a node each if there are change addresses), with the
+    used receiving and empty change addresses under a node of their own at
+    the top.
+
+    The indexes point to the AddressNode they are under. What it takes to
+    place an address is looked up from the wallet once, and again only when
+    the wallet says the address changed. Its cells are only formatted when
+    the view asks for them, that is when the row is on screen. '''
+
+    LABEL_COLUMN = 2
+    NODE_FLAGS = Qt.ItemIsSelectable | Qt.ItemIsEnabled
+    ADDRESS_FLAGS = NODE_FLAGS | Qt.ItemNeverHasChildren
+    LABEL_FLAGS = ADDRESS_FLAGS | Qt.ItemIsEditable
+    VALUE_COLUMNS = ('balance', 'fiat', 'tx')  # sorted by the AddressInfo
+
+    def __init__(self, address_list):
+        super().__init__(address_list)
+        self.al = address_list
+        self.headers, self.columns = [], []
+        self.root = AddressNode('', None)
+        self.nodes = {}  # (is_change, is_hidden, has_groups) -> AddressNode, kept so that they stay expanded
+        self.sequences = []  # [(is_change, addresses)] as in the wallet
+        self.position = {}  # address -> (is_change, index in its sequence)
+        self.info = {}  # address -> AddressInfo
+        self.beyond_limit = {}  # address -> wallet.is_beyond_limit(), until addresses are added
+        self.cells = {}  # address -> {column: text}, for the rows displayed since the last update
+        self.tree_position = {}  # AddressNode or Address -> (parent AddressNode, row), of the displayed rows
+        self.address_texts, self.address_format = {}, None
+        self.storage_strings = {}  # address -> key of its label
+        self.sort_column, self.sort_order = 0, Qt.AscendingOrder
+        self.filter_text = ''
+
+    # QAbstractItemModel interface
+
+    def node(self, index):
+        ''' Returns the AddressNode of index, the root node for the invalid
+        index, or None for an address row. '''
+        if not index.isValid():
+            return self.root
+        if index.column() != 0:
+            return None
+        item = self.item(index)
+        return item if isinstance(item, AddressNode) else None
+
+    def item(self, index):
+        ''' Returns the AddressNode or Address of a valid index. '''
+        return index.internalPointer().children[index.row()]
+
+    def index(self, row, column, parent=QModelIndex()):
+        node = self.node(parent)
+        if node is None or not (0 <= row < len(node.children) and 0 <= column < len(self.headers)):
+            return QModelIndex()
+        return self.createIndex(row, column, node)
+
+    def parent(self, index):
+        return self.node_index(index.internalPointer()) if index.isValid() else QModelIndex()
+
+    def rowCount(self, parent=QModelIndex()):
+        node = self.node(parent)
+        return len(node.children) if node else 0
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(self.headers)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole and section < len(self.headers):
+            return self.headers[section]
+        return None
+
+    def flags(self, index):
+        # called for every row when the view lays them out: telling it the
+        # address rows never have rows under them saves it asking rowCount()
+        if not index.isValid():
+            return Qt.NoItemFlags
+        if isinstance(self.item(index), AddressNode):
+            return self.NODE_FLAGS
+        return self.LABEL_FLAGS if index.column() == self.LABEL_COLUMN else self.ADDRESS_FLAGS
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        item, column = self.item(index), index.column()
+        if isinstance(item, AddressNode):
+            return item.name if role == Qt.DisplayRole and column == 0 else None
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            return self.get_text(item, column)
+        if role == Qt.UserRole:
+            return item
+        key = self.columns[column]
+        if role == Qt.FontRole:
+            if key in ('address', 'balance', 'fiat'):
+                return self.al.monospaceFont
+        elif role == Qt.TextAlignmentRole:
+            if key in ('balance', 'fiat'):
+                return int(Qt.AlignRight | Qt.AlignVCenter)
+        elif role == Qt.BackgroundRole:
+            if key == 'address':
+                if self.is_beyond_limit(item):
+                    return self.al.red
+                if self.al.wallet.is_frozen(item):
+                    return self.al.lightBlue
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if role != Qt.EditRole or index.column() != self.LABEL_COLUMN:
+            return False
+        address = self.item(index)
+        if value == self.get_text(address, index.column()):
+            return False
+        self.al.wallet.set_label(self.get_storage_string(address), value)
+        self.al.parent.update_labels()
+        return True
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sort_column, self.sort_order = column, order
+        self.set_tree(self.build())
+
+    # what is displayed of an address
+
+    def get_info(self, address):
+        ret = self.info.get(address)
+        if ret is None:
+            wallet = self.al.wallet
+            balance = wallet.get_addr_balance(address)
+            num_tx = len(wallet.get_address_history(address))
+            is_empty = not any(balance)
+            # used receiving addresses and empty change addresses go under a node of their own
+            is_hidden = is_empty if self.position[address][0] else bool(num_tx) and is_empty
+            ret = self.info[address] = AddressInfo(sum(balance), num_tx, is_hidden)
+        return ret
+
+    def is_beyond_limit(self, address):
+        ret = self.beyond_limit.get(address)
+        if ret is None:
+            ret = self.beyond_limit[address] = self.al.wallet.is_beyond_limit(address, self.position[address][0])
+        return ret
+
+    def get_address_text(self, address):
+        if self.address_format != Address.FMT_UI:
+            self.address_texts.clear()
+            self.address_format = Address.FMT_UI
+        ret = self.address_texts.get(address)
+        if ret is None:
+            ret = self.address_texts[address] = address.to_ui_string()
+        return ret
+
+    def get_storage_string(self, address):
+        ret = self.storage_strings.get(address)
+        if ret is None:
+            ret = self.storage_strings[address] = address.to_storage_string()
+        return ret
+
+    def get_text(self, address, column):
+        key = self.columns[column]
+        if key == 'label':
+            return self.al.wallet.labels.get(self.get_storage_string(address), '')
+        cells = self.cells.get(address)
+        if cells is None:
+            cells = self.cells[address] = {}
+        text = cells.get(key)
+        if text is None:
+            text = cells[key] = self.format_cell(address, key)
+        return text
+
+    def format_cell(self, address, key):
+        if key == 'address':
+            return self.get_address_text(address)
+        if key == 'index':
+            return str(self.position[address][1])
+        info = self.get_info(address)
+        if key == 'balance':
+            return self.al.parent.format_amount(info.balance, whitespaces=True)
+        if key == 'fiat':
+            fx = self.al.fx()
+            return fx.value_str(info.balance, fx.exchange_rate())
+        return str(info.num_tx)
+
+    def sort_key(self):
+        ''' Returns a function of addresses to sort them by, or None to keep
+        them in the wallet's order (the Address column). '''
+        key = self.columns[self.sort_column] if self.sort_column < len(self.columns) else 'address'
+        if key == 'address':
+            return None
+        if key == 'index':
+            return lambda address: self.position[address][1]
+        if key in ('balance', 'fiat'):
+            return lambda address: self.get_info(address).balance
+        if key == 'tx':
+            return lambda address: self.get_info(address).num_tx
+        def text_key(address):
+            text = self.get_text(address, self.sort_column)
+            try:
+                return (0, float(text.replace(',', '')), '')
+            except ValueError:
+                return (1, 0, text)
+        return text_key
+
+    def matches_filter(self, address):
+        p = self.filter_text
+        return not p or any(self.get_text(address, column).lower().find(p) != -1 for column in self.al.filter_columns)
+
+    # the tree
+
+    def get_node(self, is_change, is_hidden, has_groups):
+        node = self.nodes.get((is_change, is_hidden, has_groups))
+        if node is None:
+            if is_hidden:
+                name = _("Empty") if is_change else _("Used")
+                parent = self.get_node(is_change, False, True) if has_groups else self.root
+            else:
+                name = _("Change") if is_change else _("Receiving")
+                parent = self.root
+            node = self.nodes[(is_change, is_hidden, has_groups)] = AddressNode(name, parent)
+        return node
+
+    def node_index(self, node):
+        ''' Returns the index of node, which is invalid for the root node or
+        a node which isn't displayed. '''
+        pos = self.tree_position.get(node)
+        return self.createIndex(pos[1], 0, pos[0]) if pos else QModelIndex()
+
+    def nodes_in_tree(self, node=None):
+        node = node or self.root
+        ret = [node]
+        for child in node.children:
+            if not isinstance(child, AddressNode):
+                break  # nodes come first
+            ret += self.nodes_in_tree(child)
+        return ret
+
+    def build(self):
+        ''' Returns the tree to display, as {node: children}. '''
+        has_groups = len(self.sequences) > 1
+        key = self.sort_key()
+        reverse = self.sort_order == Qt.DescendingOrder
+        tree = {self.root: []}
+        for is_change, addresses in self.sequences:
+            group = self.get_node(is_change, False, True) if has_groups else self.root
+            if has_groups:
+                tree[self.root].append(group)
+                tree[group] = []
+            shown, hidden = [], []
+            for address in addresses:
+                if self.matches_filter(address):
+                    (hidden if self.get_info(address).is_hidden else shown).append(address)
+            if key:
+                shown.sort(key=key, reverse=reverse)
+                hidden.sort(key=key, reverse=reverse)
+            if hidden:
+                node = self.get_node(is_change, True, has_groups)
+                tree[group].append(node)
+                tree[node] = hidden
+            tree[group].extend(shown)
+        return tree
+
+    def set_tree(self, tree):
+        ''' Displays tree, as returned by build(), if it differs from what is
+        displayed. The rows that are still there keep their selection and
+        expanded state, wherever they moved. '''
+        old_nodes = self.nodes_in_tree()
+        if set(old_nodes) == set(tree) and all(node.children == tree[node] for node in old_nodes):
+            return
+        self.layoutAboutToBeChanged.emit()
+        position = {item: (node, row) for node, children in tree.items() for row, item in enumerate(children)}
+        old_indexes = self.persistentIndexList()
+        new_indexes = []
+        for ix in old_indexes:
+            node = ix.internalPointer()
+            pos = position.get(node.children[ix.row()]) if ix.row() < len(node.children) else None
+            new_indexes.append(self.createIndex(pos[1], ix.column(), pos[0]) if pos else QModelIndex())
+        for node in old_nodes:
+            node.children = []
+        for node, children in tree.items():
+            node.children = children
+        self.tree_position = position
+        self.changePersistentIndexList(old_indexes, new_indexes)
+        self.layoutChanged.emit()
+
+    def rows_changed(self, addresses=(), column=None):
+        ''' Tells the view to redisplay column, or all of them: of the rows
+        of addresses, and of every row but for the first column. A range of
+        rows spanning the first column has a QTreeView look up whether each
+        of them has rows under it, while a range of rows has it repaint all
+        that's on screen anyway. '''
+        if not self.headers:
+            return
+        first, last = (column, column) if column is not None else (0, len(self.headers) - 1)
+        for address in addresses:
+            if address in self.tree_position:
+                self.dataChanged.emit(self.address_index(address, first), self.address_index(address, last))
+        first = max(first, 1)
+        if first > last:
+            return
+        for node in self.nodes_in_tree():
+            if node.children:
+                parent = self.node_index(node)
+                self.dataChanged.emit(self.index(0, first, parent), self.index(len(node.children) - 1, last, parent))
+
+    def address_index(self, address, column=0):
+        ''' Returns the index of address, which is invalid if it isn't
+        displayed. '''
+        pos = self.tree_position.get(address)
+        return self.createIndex(pos[1], column, pos[0]) if pos else QModelIndex()
+
+    # updates
+
+    def set_headers(self, headers, columns):
+        if headers == self.headers and columns == self.columns:
+            return
+        self.beginResetModel()
+        self.headers, self.columns = headers, columns
+        self.cells.clear()
+        self.endResetModel()
+
+    def update(self, changed):
+        ''' Updates the rows after the wallet's addresses in changed, or all
+        of them if None, may have changed. '''
+        wallet = self.al.wallet
+        sequences = [(False, list(wallet.get_receiving_addresses()))]
+        change_addresses = list(wallet.get_change_addresses())
+        if change_addresses:
+            sequences.append((True, change_addresses))
+        self.cells.clear()
+        rebuild = changed is None or sequences != self.sequences
+        if rebuild:
+            self.sequences = sequences
+            self.position = {address: (is_change, n) for is_change, addresses in sequences
+                             for n, address in enumerate(addresses)}
+            self.beyond_limit.clear()
+        if changed is None:
+            self.info.clear()
+        else:
+            sorted_by_value = self.sort_column < len(self.columns) and self.columns[self.sort_column] in self.VALUE_COLUMNS
+            for address in changed:
+                old = self.info.pop(address, None)
+                if rebuild or address not in self.position:
+                    continue
+                new = self.get_info(address)
+                if old is None or old.is_hidden != new.is_hidden or (sorted_by_value and old != new):
+                    rebuild = True
+        if rebuild:
+            self.set_tree(self.build())
+        self.rows_changed(changed or ())
+
+    def set_filter(self, p):
+        if p == self.filter_text:
+            return
+        self.filter_text = p
+        self.set_tree(self.build())
+
+    def labels_changed(self):
+        self.rows_changed(column=self.LABEL_COLUMN)
+        if self.filter_text or self.sort_column == self.LABEL_COLUMN:
+            self.set_tree(self.build())
+
+
+class AddressList(QTreeView):
+    ''' The addresses tab, as a view of an AddressModel which only looks up
+    the addresses the wallet says changed since the last update, and only
+    formats the rows on screen. It otherwise works like the MyTreeWidget it
+    used to be. '''
+
+    filter_columns = [0, 1, 2]  # Address, Index, Label
+    stretch_column = AddressModel.LABEL_COLUMN
+    editable_columns = [AddressModel.LABEL_COLUMN]
 
     def __init__(self, parent=None):
-        super().__init__(parent, self.create_menu, [], 2, deferred_updates=True)
-        self.refresh_headers()
-        self.setSelectionMode(QAbstractItemView.ExtendedSelection)
-        self.setSortingEnabled(True)
+        super().__init__(parent)
+        self.parent = parent
+        self.config = parent.config
         # force attributes to always be defined, even if None, at construction.
         self.wallet = self.parent.wallet
+        self.wallet_changes = self.wallet.watch_changes()
+
+        self.monospaceFont = QFont(MONOSPACE_FONT)
+        self.lightBlue = QColor('lightblue')
+        self.red = QColor('red')
+
+        self.deferred_updates = True
+        self.deferred_update_ct, self._forced_update = 0, False
+        self.pending_update = False
+        self.expanded_groups = set()  # the group nodes expanded when they first appeared
+
+        self.setUniformRowHeights(True)
+        self.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        # size the columns from the rows on screen and at most 100 others (rather than 1000)
+        self.header().setResizeContentsPrecision(100)
+        self.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.customContextMenuRequested.connect(self.create_menu)
+        self.doubleClicked.connect(self.on_doubleclick)
+
+        self.address_model = AddressModel(self)
+        self.setModel(self.address_model)
+        self.refresh_headers()
+        self.setSortingEnabled(True)
+        self.sortByColumn(0, Qt.AscendingOrder)
+
+    def fx(self):
+        fx = self.parent.fx
+        return fx if fx and fx.get_fiat_address_config() else None
 
     def filter(self, p):
-        ''' Reimplementation from superclass filter.  Chops off the
-        "bitcoincash:" prefix so that address filters ignore this prefix.
-        Closes #1440. Modified by Calin to also handle "simpleledger:". '''
+        ''' Chops off the "bitcoincash:" prefix so that address filters
+        ignore this prefix. Closes #1440. Modified by Calin to also handle
+        "simpleledger:". '''
         cashaddr_prefix = f"{networks.net.CASHADDR_PREFIX}:".lower()
         slpaddr_prefix = f"{networks.net.SLPADDR_PREFIX}:".lower()
         p = p.strip()
@@ -59,147 +468,86 @@ class AddressList(MyTreeWidget):
             p = p[len(cashaddr_prefix):]  # chop off prefix
         elif len(p) > len(slpaddr_prefix) and p.lower().startswith(slpaddr_prefix):
             p = p[len(slpaddr_prefix):]  # chop off SLP prefix, if any
-        super().filter(p)  # call super on chopped-off-piece
+        self.address_model.set_filter(p.lower())
 
     def refresh_headers(self):
         headers = [ _('Address'), _('Index'),_('Label'), _('Balance'), _('Tx')]
-        fx = self.parent.fx
-        if fx and fx.get_fiat_address_config():
+        columns = ['address', 'index', 'label', 'balance', 'tx']
+        fx = self.fx()
+        if fx:
             headers.insert(4, '{} {}'.format(fx.get_currency(), _('Balance')))
-        self.update_headers(headers)
+            columns.insert(4, 'fiat')
+        self.address_model.set_headers(headers, columns)
+        self.header().setStretchLastSection(False)
+        for col in range(len(headers)):
+            sm = QHeaderView.Stretch if col == self.stretch_column else QHeaderView.ResizeToContents
+            self.header().setSectionResizeMode(col, sm)
+        self.expanded_groups.clear()  # a reset collapses them
+
+    def clean_up(self):
+        ''' Stops collecting the wallet's changes, called when the window
+        closes. '''
+        self.wallet.unwatch_changes(self.wallet_changes)
+
+    def should_defer_update_incr(self):
+        ret = (self.deferred_updates and not self.isVisible()
+               and not self._forced_update)
+        if ret:
+            self.deferred_update_ct += 1
+        return ret
 
     @rate_limited(1.0, ts_after=True) # We rate limit the address list refresh no more than once every second
     def update(self):
         if self.wallet and (not self.wallet.thread or not self.wallet.thread.isRunning()):
             # short-cut return if window was closed and wallet is stopped
             return
-        super().update()
+        if self.state() == QAbstractItemView.EditingState:
+            # updated when the editor closes
+            self.pending_update = True
+        elif not self.should_defer_update_incr():
+            self.on_update()
+            self.deferred_update_ct = 0
+
+    def showEvent(self, e):
+        super().showEvent(e)
+        if e.isAccepted() and self.deferred_update_ct:
+            self._forced_update = True
+            self.update()
+            self._forced_update = False
+
+    def closeEditor(self, editor, hint):
+        super().closeEditor(editor, hint)
+        if self.pending_update:
+            self.pending_update = False
+            self.update()
 
     @profiler
     def on_update(self):
-        def item_path(item): # Recursively builds the path for an item eg 'parent_name/item_name'
-            return item.text(0) if not item.parent() else item_path(item.parent()) + "/" + item.text(0)
-        def remember_expanded_items(root):
-            # Save the set of expanded items... so that address list updates don't annoyingly collapse
-            # our tree list widget due to the update. This function recurses. Pass self.invisibleRootItem().
-            expanded_item_names = set()
-            for i in range(0, root.childCount()):
-                it = root.child(i)
-                if it and it.childCount():
-                    if it.isExpanded():
-                        expanded_item_names.add(item_path(it))
-                    expanded_item_names |= remember_expanded_items(it) # recurse
-            return expanded_item_names
-        def restore_expanded_items(root, expanded_item_names):
-            # Recursively restore the expanded state saved previously. Pass self.invisibleRootItem().
-            for i in range(0, root.childCount()):
-                it = root.child(i)
-                if it and it.childCount():
-                    restore_expanded_items(it, expanded_item_names) # recurse, do leaves first
-                    old = bool(it.isExpanded())
-                    new = bool(item_path(it) in expanded_item_names)
-                    if old != new:
-                        it.setExpanded(new)
         self.wallet = self.parent.wallet
-        had_item_count = self.topLevelItemCount()
-        sels = self.selectedItems()
-        addresses_to_re_select = {item.data(0, Qt.UserRole) for item in sels}
-        expanded_item_names = remember_expanded_items(self.invisibleRootItem())
-        del sels  # avoid keeping reference to about-to-be delete C++ objects
-        self.clear()
-        # Note we take a shallow list-copy because we want to avoid
-        # race conditions with the wallet while iterating here. The wallet may
-        # touch/grow the returned lists at any time if a history comes (it
-        # basically returns a reference to its own internal lists). The wallet
-        # may then, in another thread such as the Synchronizer thread, grow
-        # the receiving or change addresses on Deterministic wallets.  While
-        # probably safe in a language like Python -- and especially since
-        # the lists only grow at the end, we want to avoid bad habits.
-        # The performance cost of the shallow copy below is negligible for 10k+
-        # addresses even on huge wallets because, I suspect, internally CPython
-        # does this type of operation extremely cheaply (probably returning
-        # some copy-on-write-semantics handle to the same list).
-        receiving_addresses = list(self.wallet.get_receiving_addresses())
-        change_addresses = list(self.wallet.get_change_addresses())
-
-        if self.parent.fx and self.parent.fx.get_fiat_address_config():
-            fx = self.parent.fx
-        else:
-            fx = None
-        account_item = self
-        sequences = [0,1] if change_addresses else [0]
-        items_to_re_select = []
-        for is_change in sequences:
-            if len(sequences) > 1:
-                name = _("Receiving") if not is_change else _("Change")
-                seq_item = QTreeWidgetItem( [ name, '', '', '', '', ''] )
-                account_item.addChild(seq_item)
-                if not had_item_count: # first time we create this widget, auto-expand the default address list
-                    seq_item.setExpanded(True)
-                    expanded_item_names.add(item_path(seq_item))
-            else:
-                seq_item = account_item
-            hidden_item = QTreeWidgetItem( [ _("Empty") if is_change else _("Used"), '', '', '', '', ''] )
-            has_hidden = False
-            addr_list = change_addresses if is_change else receiving_addresses
-            for n, address in enumerate(addr_list):
-                num = len(self.wallet.get_address_history(address))
-                if is_change:
-                    is_hidden = self.wallet.is_empty(address)
-                else:
-                    is_hidden = self.wallet.is_used(address)
-                balance = sum(self.wallet.get_addr_balance(address))
-                address_text = address.to_ui_string()
-                label = self.wallet.labels.get(address.to_storage_string(), '')
-                balance_text = self.parent.format_amount(balance, whitespaces=True)
-                columns = [address_text, str(n), label, balance_text, str(num)]
-                if fx:
-                    rate = fx.exchange_rate()
-                    fiat_balance = fx.value_str(balance, rate)
-                    columns.insert(4, fiat_balance)
-                address_item = SortableTreeWidgetItem(columns)
-                address_item.setTextAlignment(3, Qt.AlignRight)
-                address_item.setFont(3, QFont(MONOSPACE_FONT))
-                if fx:
-                    address_item.setTextAlignment(4, Qt.AlignRight)
-                    address_item.setFont(4, QFont(MONOSPACE_FONT))
-
-                address_item.setFont(0, QFont(MONOSPACE_FONT))
-                address_item.setData(0, Qt.UserRole, address)
-                address_item.setData(0, Qt.UserRole+1, True) # label can be edited
-                if self.wallet.is_frozen(address):
-                    address_item.setBackground(0, QColor('lightblue'))
-                if self.wallet.is_beyond_limit(address, is_change):
-                    address_item.setBackground(0, QColor('red'))
-                if is_hidden:
-                    if not has_hidden:
-                        seq_item.insertChild(0, hidden_item)
-                        has_hidden = True
-                    hidden_item.addChild(address_item)
-                else:
-                    seq_item.addChild(address_item)
-                if address in addresses_to_re_select:
-                    items_to_re_select.append(address_item)
+        # the addresses which changed since the last update, or None for all of them
+        delta = self.wallet_changes.take()
+        self.address_model.update(delta and delta.addresses)
+        # expand the Receiving and Change nodes when they first appear
+        for row in range(self.address_model.rowCount()):
+            index = self.address_model.index(row, 0)
+            node = self.address_model.node(index)
+            if node and node not in self.expanded_groups:
+                self.expanded_groups.add(node)
+                self.setExpanded(index, True)
 
-        for item in items_to_re_select:
-            # NB: Need to select the item at the end becasue internally Qt does some index magic
-            # to pick out the selected item and the above code mutates the TreeList, invalidating indices
-            # and other craziness, which might produce UI glitches. See #1042
-            item.setSelected(True)
-
-        # Now, at the very end, enforce previous UI state with respect to what was expanded or not. See #1042
-        restore_expanded_items(self.invisibleRootItem(), expanded_item_names)
+    def selected_addresses(self):
+        addrs = [index.data(Qt.UserRole) for index in self.selectionModel().selectedRows()]
+        return [addr for addr in addrs if isinstance(addr, Address)]
 
     def create_menu(self, position):
         from electroncash.wallet import Multisig_Wallet
         is_multisig = isinstance(self.wallet, Multisig_Wallet)
         can_delete = self.wallet.can_delete_address()
-        selected = self.selectedItems()
+        selected = self.selectionModel().selectedRows()
         multi_select = len(selected) > 1
-        addrs = [item.data(0, Qt.UserRole) for item in selected]
-        if not addrs:
+        if not selected:
             return
-        addrs = [addr for addr in addrs if isinstance(addr, Address)]
+        addrs = self.selected_addresses()
 
         menu = QMenu()
 
@@ -207,15 +555,16 @@ class AddressList(MyTreeWidget):
             txt = txt.strip()
             self.parent.copy_to_clipboard(txt)
 
-        col = self.currentColumn()
-        column_title = self.headerItem().text(col)
+        col = self.currentIndex().column()
+        column_title = self.address_model.headerData(col, Qt.Horizontal)
 
         if not multi_select:
-            item = self.itemAt(position)
-            if not item:
+            index = self.indexAt(position)
+            if not index.isValid():
                 return
             if not addrs:
-                item.setExpanded(not item.isExpanded())
+                index = index.sibling(index.row(), 0)
+                self.setExpanded(index, not self.isExpanded(index))
                 return
             addr = addrs[0]
 
@@ -227,15 +576,14 @@ class AddressList(MyTreeWidget):
                 else:
                     alt_copy_text, alt_column_title = addr.to_full_string(Address.FMT_LEGACY), _('Legacy Address')
             else:
-                copy_text = item.text(col)
+                copy_text = index.sibling(index.row(), col).data() or ''
             menu.addAction(_("Copy {}").format(column_title), lambda: doCopy(copy_text))
             if alt_copy_text and alt_column_title:
                 # Add 'Copy Legacy Address' and 'Copy Cash Address' alternates if right-click is on column 0
                 menu.addAction(_("Copy {}").format(alt_column_title), lambda: doCopy(alt_copy_text))
             menu.addAction(_('Details'), lambda: self.parent.show_address(addr))
             if col in self.editable_columns:
-                menu.addAction(_("Edit {}").format(column_title), lambda: self.editItem(self.itemAt(position), # NB: C++ item may go away if this widget is refreshed while menu is up -- so need to re-grab and not store in lamba. See #953
-                                                                                        col))
+                menu.addAction(_("Edit {}").format(column_title), lambda: self.edit(self.address_model.address_index(addr, col)))  # the row may have moved since
             a = menu.addAction(_("Request payment"), lambda: self.parent.receive_at(addr))
             if self.wallet.get_num_tx(addr) or self.wallet.has_payment_request(addr):
                 # This address cannot be used for a payment request because
@@ -265,7 +613,7 @@ class AddressList(MyTreeWidget):
                     alt_copy_text = "\n".join([a.to_ui_string() + ", " + self.parent.format_amount(sum(self.wallet.get_addr_balance(a)))
                                               for a in addrs])
                 else:
-                    texts = [i.text(col).strip() for i in selected]
+                    texts = [(index.sibling(index.row(), col).data() or '').strip() for index in selected]
                     texts = [t for t in texts if t]  # omit empty items
                 if texts:
                     copy_text = '\n'.join(texts)
@@ -288,25 +636,26 @@ class AddressList(MyTreeWidget):
         menu.exec_(self.viewport().mapToGlobal(position))
 
     def keyPressEvent(self, event):
-        if event.matches(QKeySequence.Copy) and self.currentColumn() == 0:
-            addrs = [i.data(0, Qt.UserRole) for i in self.selectedItems()]
-            if addrs and isinstance(addrs[0], Address):
+        if event.matches(QKeySequence.Copy) and self.currentIndex().column() == 0:
+            addrs = self.selected_addresses()
+            if addrs:
                 text = addrs[0].to_full_ui_string()
                 self.parent.app.clipboard().setText(text)
+        elif event.key() in [ Qt.Key_F2, Qt.Key_Return ] and self.state() != QAbstractItemView.EditingState:
+            index = self.currentIndex()
+            if index.isValid():
+                # on 'enter' we show the menu
+                pt = self.visualRect(index).bottomLeft()
+                pt.setX(50)
+                self.customContextMenuRequested.emit(pt)
         else:
             super().keyPressEvent(event)
 
+    def on_doubleclick(self, index):
+        if index.flags() & Qt.ItemIsEditable:
+            self.edit(index)
+
     def update_labels(self):
         if self.should_defer_update_incr():
             return
-        def update_recurse(root):
-            child_count = root.childCount()
-            for i in range(child_count):
-                item = root.child(i)
-                addr = item.data(0, Qt.UserRole)
-                if isinstance(addr, Address):
-                    label = self.wallet.labels.get(addr.to_storage_string(), '')
-                    item.setText(2, label)
-                if item.childCount():
-                    update_recurse(item)
-        update_recurse(self.invisibleRootItem())
+        self.address_model.labels_changed()
@@ -19,14 +19,16 @@ from .util import *
 
 from electroncash.util import format_satoshis_nofloat
 from electroncash.transaction import Transaction
-from electroncash.bitcoinfiles import BfpMessage, BfpUnsupportedBfpMsgType, BfpInvalidOutputMessage, parseOpreturnToChunks
+from electroncash.bitcoinfiles import (BfpMessage, BfpUnsupportedBfpMsgType, BfpInvalidOutputMessage,
+                                       BfpDownloader, BfpDownloadStopped, BfpHashMismatch)
 
 dialogs = []  # Otherwise python randomly garbage collects the dialogs...
 
 class BfpDownloadFileDialog(QDialog, MessageBoxMixin):
 
     got_network_response_meta_sig = pyqtSignal()
-    got_network_response_chunk_sig = pyqtSignal(dict, int)
+    download_progress_sig = pyqtSignal(int, int)
+    download_finished_sig = pyqtSignal(object)
 
     @pyqtSlot()
     def got_network_response_slot(self):
@@ -40,14 +42,35 @@ class BfpDownloadFileDialog(QDialog, MessageBoxMixin):
         tx = Transaction(raw)
         self.handle_metadata_tx(tx)
 
-    @pyqtSlot(dict, int)
-    def got_network_response_chunk_slot(self, response, chunk_index):
-        if response.get('error'):
-            return self.fail_metadata_info("Download chunk data error!\n%r"%(response['error'].get('message')))
-        raw = response.get('result')
+    @pyqtSlot(int, int)
+    def download_progress_slot(self, done, total):
+        self.progress.setMaximum(total)
+        self.progress.setValue(done)
+        self.progress.setVisible(True)
 
-        tx = Transaction(raw)
-        self.handle_chunk_tx(tx, chunk_index)
+    @pyqtSlot(object)
+    def download_finished_slot(self, result):
+        ''' result is the dict returned by BfpDownloader.run(), or the
+        exception it raised. '''
+        self.downloader = None
+        self.progress.setHidden(True)
+        self.download_button.setDisabled(False)
+        if isinstance(result, BfpDownloadStopped):
+            return
+        if isinstance(result, BfpHashMismatch):
+            self.file_info_e.textCursor().insertText("Failure: Hash of file download does not match its own metadata.")
+            self.show_error("Aborting file save.\n\nThe hash provided in the file's metadata does not match the downloaded file data.")
+            return
+        if isinstance(result, Exception):
+            return self.fail_metadata_info("Download chunk data error!\n%s"%(result,))
+
+        self.file_info_e.textCursor().insertText("File download complete.")
+        self.file_info_e.textCursor().insertBlock()
+        if result['hash_verified'] is None:
+            self.file_info_e.textCursor().insertText("Info: No file hash provided in metadata.")
+        else:
+            self.file_info_e.textCursor().insertText("Success: Hash of file download matches its own metadata.")
+        self.file_info_e.textCursor().insertBlock()
 
     def __init__(self, main_window):
         # We want to be a top-level window
@@ -115,80 +138,25 @@ class BfpDownloadFileDialog(QDialog, MessageBoxMixin):
         hbox.addWidget(self.cancel_button)
 
         self.got_network_response_meta_sig.connect(self.got_network_response_slot, Qt.QueuedConnection)
-        self.got_network_response_chunk_sig.connect(self.got_network_response_chunk_slot, Qt.QueuedConnection)
+        self.download_progress_sig.connect(self.download_progress_slot, Qt.QueuedConnection)
+        self.download_finished_sig.connect(self.download_finished_slot, Qt.QueuedConnection)
         self.update()
 
         dialogs.append(self)
         self.show()
 
         self.file_metadata_tx = None
+        self.downloader = None
 
     def closeEvent(self, event):
+        if self.downloader:
+            self.downloader.stop()
         event.accept()
         dialogs.remove(self)
 
     def download_file(self):
-        self.txn_downloads = []
-        self.file = None
-        self.chunk_count = self.file_metadata_message.op_return_fields['chunk_count']
-        self.progress.setMaximum(self.chunk_count)
-        self.progress.setMinimum(0)
-        self.progress.setValue(0)
-
-        metadata_chunk_is_empty = self.file_metadata_message.op_return_fields['chunk_data'] == b''
-
-        if self.chunk_count > 0:
-            if not metadata_chunk_is_empty:
-                self.txn_downloads.append({ 'txid': self.file_metadata_tx.txid(), 'data': self.file_metadata_message.op_return_fields['chunk_data'] })
-            
-            if self.chunk_count > 1 or (self.chunk_count == 1 and metadata_chunk_is_empty):
-                self.txn_downloads.append({ 'txid': self.file_metadata_tx.inputs()[0]['prevout_hash'], 'data': None} )
-                assert self.file_metadata_tx.inputs()[0]['prevout_n'] == 1
-            
-            index = len(self.txn_downloads)-1
-            self.file_info_e.textCursor().insertText("Downloading file...")
-            self.file_info_e.textCursor().insertBlock()
-            if self.chunk_count > 1 or (self.chunk_count == 1 and metadata_chunk_is_empty):
-                self.download_chunk_data(self.txn_downloads[index]['txid'], index)
-            else:
-                self.build_file()
-        else:
+        if self.file_metadata_message.op_return_fields['chunk_count'] < 1:
             raise Exception("This file does not contain any data.")
-
-    def download_chunk_data(self, txid, chunk_index):
-        try: 
-            tx = self.wallet.transactions[txid]
-        except KeyError:
-            def callback(response):
-                self.got_network_response_chunk_sig.emit(response, chunk_index)
-            requests = [ ('blockchain.transaction.get', [txid]), ]
-            self.network.send(requests, callback)
-        else:
-            self.handle_chunk_tx(tx, chunk_index)              
-
-    def build_file(self):
-        self.progress.setHidden(True)
-        self.txn_downloads.reverse()
-        self.file = b''
-        for d in self.txn_downloads:
-            self.file += d['data']
-
-        self.file_info_e.textCursor().insertText("File download complete.")
-        self.file_info_e.textCursor().insertBlock()
-
-        import hashlib
-        readable_hash = hashlib.sha256(self.file).hexdigest()
-        metadata_hash = self.file_metadata_message.op_return_fields['file_sha256'].hex()
-        if metadata_hash == '':
-            self.file_info_e.textCursor().insertText("Info: No file hash provided in metadata.")
-        elif metadata_hash == readable_hash:
-            self.file_info_e.textCursor().insertText("Success: Hash of file download matches its own metadata.")
-        else: 
-            self.file_info_e.textCursor().insertText("Failure: Hash of file download does not match its own metadata.")
-            self.show_error("Aborting file save.\n\nThe hash provided in the file's metadata does not match the downloaded file data.")
-            return
-        
-        self.file_info_e.textCursor().insertBlock()
         filename = self.file_metadata_message.op_return_fields['filename'].decode('utf8')
         ext = self.file_metadata_message.op_return_fields['fileext'].decode('utf8')
         try:
@@ -196,31 +164,26 @@ class BfpDownloadFileDialog(QDialog, MessageBoxMixin):
         except IndexError:
             filenameext = ""
         name = QFileDialog.getSaveFileName(self, 'Save File', filenameext)[0]
-        if name != '':
-            file = open(name,'wb')
-            file.write(self.file)
-            file.close()
-
-    def handle_chunk_tx(self, tx, chunk_index):
-        try: 
-            data = parseOpreturnToChunks(tx.outputs()[0][1].to_script(), allow_op_0 = False, allow_op_number = False)
-        except Exception as e:
-            raise e
-            return self.fail_metadata_info(_("This chunk does not contain any data"))
-            
-        if len(data) != 1:
-            return self.fail_metadata_info(_("This chunk does not contain any data"))
-
-        self.progress.setValue(self.progress.value() + 1)
-        self.progress.setVisible(True)
-        self.txn_downloads[chunk_index]['data'] = data[0]
-        if chunk_index < self.chunk_count - 1:
-            self.txn_downloads.append({ 'txid': tx.inputs()[0]['prevout_hash'], 'data': None })
-            assert tx.inputs()[0]['prevout_n'] == 1
-            index = len(self.txn_downloads)-1
-            self.download_chunk_data(self.txn_downloads[index]['txid'], index)
-        else:
-            self.build_file()
+        if name == '':
+            return
+
+        self.progress.setMinimum(0)
+        self.progress.setValue(0)
+        self.download_button.setDisabled(True)
+        self.file_info_e.textCursor().insertText("Downloading file...")
+        self.file_info_e.textCursor().insertBlock()
+
+        # the download runs in its own thread, which blocks on the network;
+        # an interrupted download of the same file to the same name resumes
+        self.downloader = dl = BfpDownloader(self.network, self.file_metadata_tx.txid(), name,
+                                             wallet=self.wallet, progress_callback=self.download_progress_sig.emit)
+        def run():
+            try:
+                result = dl.run()
+            except Exception as e:
+                result = e
+            self.download_finished_sig.emit(result)
+        threading.Thread(target=run, name='BfpDownload', daemon=True).start()
 
     def download_metadata_info(self):
         txid = self.file_id_e.text()
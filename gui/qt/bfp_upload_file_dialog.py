@@ -5,6 +5,7 @@ from functools import partial
 import json
 import threading
 import sys
+import traceback
 from pathlib import Path
 from os.path import basename, splitext
 
@@ -19,7 +20,7 @@ from electroncash.plugins import run_hook
 
 from .util import *
 
-from electroncash.util import bfh, format_satoshis_nofloat, format_satoshis_plain_nofloat, NotEnoughFunds, ExcessiveFee, InvalidPassword
+from electroncash.util import bfh, format_satoshis_nofloat, format_satoshis_plain_nofloat, NotEnoughFunds, ExcessiveFee, InvalidPassword, UserCancelled
 from electroncash.transaction import Transaction
 
 from electroncash import bitcoinfiles
@@ -34,6 +35,9 @@ dialogs = []  # Otherwise python randomly garbage collects the dialogs...
 
 class BitcoinFilesUploadDialog(QDialog, MessageBoxMixin):
 
+    upload_progress_sig = pyqtSignal(int, int)
+    upload_finished_sig = pyqtSignal(object)
+
     def __init__(self, parent, file_receiver=None, show_on_create=False, screen_name="Upload Token Document"):
         # We want to be a top-level window
         QDialog.__init__(self, parent)
@@ -56,7 +60,12 @@ class BitcoinFilesUploadDialog(QDialog, MessageBoxMixin):
         if self.main_window.gui_object.warn_if_no_network(self.main_window):
             return
 
+        self.upload_progress_sig.connect(self.upload_progress)
+        self.upload_finished_sig.connect(self.upload_finished)
+
         self.file_receiver = file_receiver
+        self.uploader = None
+        self.broadcasting = False
         self.metadata = None
         self.filename = None
         self.is_dirty = False
@@ -235,10 +244,6 @@ class BitcoinFilesUploadDialog(QDialog, MessageBoxMixin):
         self.upload_button.setDisabled(True)
         self.progress.setValue(0)
         self.tx_batch = []
-        self.tx_batch_signed_count = 0
-        self.chunks_processed = 0
-        self.chunks_total = 0
-        self.final_metadata_txn_created = False
         if self.filename != '' and self.filename != None:
             self.sign_button.setEnabled(True)
             self.sign_button.setDefault(True)
@@ -327,67 +332,52 @@ class BitcoinFilesUploadDialog(QDialog, MessageBoxMixin):
                     self.make_dirty()
                     return
 
-                # Rewind and put file into chunks
-                f.seek(0, 0)
-                chunks = []
-                while True:
-                    b = f.read(220)
-                    if b == b'': break
-                    try:
-                        chunks.append(b)
-                        self.chunks_total += 1
-                    except ValueError:
-                        break
-
-                min_len = 223 - len(make_bitcoinfile_metadata_opreturn(1, 0, None, self.metadata['filename'], self.metadata['fileext'], self.metadata['filesize'], self.metadata['file_sha256'], self.metadata['prev_file_sha256'], self.metadata['uri'])[1].to_script())
-                
-                # determine if the metadata txn data chunk will be empty for progress bar accuracy
-                if len(bytes) < 220:
-                    chunk_count_adder = 1 if len(bytes) > min_len else 0
-                else:
-                    chunk_count_adder = 1 if min_len - (len(bytes) % 220) < 0 else 0
-
-                self.progress.setMaximum(len(chunks) + chunk_count_adder + 1)
+                try:
+                    self.uploader = BfpUploader(self.wallet, self.tx_batch[0], bytes, self.metadata, file_receiver=self.file_receiver,
+                                                progress_callback=self.upload_progress_sig.emit)
+                except BfpUploadError as e:
+                    self.show_error(str(e))
+                    return
+
+                self.progress.setMaximum(len(self.uploader.chunks) + 2)
                 self.progress.setMinimum(0)
                 self.progress.setVisible(True)
-                self.progress_label.setText("Signing 1 of " + str(len(chunks) + chunk_count_adder + 1) + " transactions")
-                
-                # callback to recursive sign next txn or finish
-                def sign_done(success):
-                    if success:
-                        self.tx_batch_signed_count += 1
-                        self.progress.setValue(self.tx_batch_signed_count)
-                        self.activateWindow()
-                        self.raise_()
-                        self.progress_label.setText("Signing " + str(self.tx_batch_signed_count + 1) + " of " + str(len(chunks) + chunk_count_adder + 1) + " transactions")
-                        if self.chunks_processed <= self.chunks_total and not self.final_metadata_txn_created:
-                            try:
-                                chunk_bytes = chunks[self.chunks_processed]
-                            except IndexError:
-                                chunk_bytes = None
-                            try:
-                                txn, self.final_metadata_txn_created = getUploadTxn(self.parent.wallet, self.tx_batch[self.chunks_processed], self.chunks_processed, self.chunks_total, chunk_bytes, self.parent.config, self.metadata, self.file_receiver)
-                                self.tx_batch.append(txn)
-                            except NotEnoughFunds as e:
-                                self.show_message("Insufficient funds for file chunk #" + str(self.chunks_processed + 1))
-                                return
-                            self.chunks_processed += 1
-
-                        if self.tx_batch_signed_count < len(self.tx_batch):
-                            self.sign_tx_with_password(self.tx_batch[self.tx_batch_signed_count], sign_done, self.password)
-                        else:
-                            uri = "bitcoinfile:" + self.tx_batch[len(self.tx_batch)-1].txid()
-                            self.bitcoinfileAddr_label.setText(uri)
-                            self.progress_label.setText("Signing complete. Ready to upload.")
-                            self.progress.setHidden(True)
-                            self.is_dirty = False
-                            self.progress.setValue(0)
-                            self.sign_button.setDisabled(True)
-                            self.upload_button.setEnabled(True)
-                            self.upload_button.setDefault(True)
-                            self.activateWindow()
-                            self.raise_()
-                self.sign_tx_with_password(self.tx_batch[0], sign_done, self.password)
+                self.progress_label.setText("Signing funding transaction")
+
+                # the funding tx is signed on its own, as it may need the hardware wallet or plugins; the
+                # chain of chunk txs spending it is then made and signed in one go
+                self.sign_tx_with_password(self.tx_batch[0], self.funding_signed, self.password)
+
+    def funding_signed(self, success):
+        if not success:
+            return
+        self.progress.setValue(1)
+        self.progress_label.setText("Signing upload transactions")
+        WaitingDialog(self, _('Signing transactions...'), partial(self.uploader.build, self.password),
+                      self.chain_signed, self.on_error)
+
+    def chain_signed(self, txs):
+        self.tx_batch = txs
+        uri = "bitcoinfile:" + self.uploader.file_txid
+        self.bitcoinfileAddr_label.setText(uri)
+        self.progress_label.setText("Signing complete. Ready to upload.")
+        self.progress.setHidden(True)
+        self.is_dirty = False
+        self.progress.setValue(0)
+        self.sign_button.setDisabled(True)
+        self.upload_button.setEnabled(True)
+        self.upload_button.setDefault(True)
+        self.activateWindow()
+        self.raise_()
+
+    def on_error(self, exc_info):
+        ''' Error callback of the signing WaitingDialogs: reports the error
+        and lets the user sign again. '''
+        if not isinstance(exc_info[1], UserCancelled):
+            traceback.print_exception(*exc_info)
+            self.show_error(str(exc_info[1]))
+        self.progress_label.setText('')
+        self.make_dirty()
 
     def sign_tx_with_password(self, tx, callback, password):
         '''Sign the transaction in a separate thread.  When done, calls
@@ -431,10 +421,6 @@ class BitcoinFilesUploadDialog(QDialog, MessageBoxMixin):
 
         self.progress.setValue(0)
         self.tx_batch = []
-        self.tx_batch_signed_count = 0
-        self.chunks_processed = 0
-        self.chunks_total = 0
-        self.final_metadata_txn_created = False
         options = QFileDialog.Options()
         options |= QFileDialog.DontUseNativeDialog
         home = str(Path.home())
@@ -443,38 +429,50 @@ class BitcoinFilesUploadDialog(QDialog, MessageBoxMixin):
         
     def upload(self):
         if not self.is_dirty:
-            self.progress_label.setText("Broadcasting 1 of " + str(len(self.tx_batch)) + " transactions")
+            self.progress_label.setText("Broadcasting " + str(len(self.tx_batch)) + " transactions")
             self.progress.setVisible(True)
             self.progress.setMinimum(0)
             self.progress.setMaximum(len(self.tx_batch))
-            broadcast_count = 0
-            # Broadcast all transaction to the nexwork
-            for tx in self.tx_batch:
-                tx_desc = None
-                status, msg = self.network.broadcast_transaction(tx)
-                # print(status)
-                # print(msg)
-                if status == False:
-                    self.show_error(msg)
-                    self.show_error("Upload failed. Try again.")
-                    return
+            self.upload_button.setDisabled(True)
+            self.broadcasting = True
 
-                broadcast_count += 1
-                time.sleep(0.1)
-                self.progress_label.setText("Broadcasting " + str(broadcast_count) + " of " + str(len(self.tx_batch)) + " transactions")
-                self.progress.setValue(broadcast_count)
-                QApplication.processEvents()
+            def broadcast():
+                try:
+                    self.uploader.broadcast(self.network)
+                    self.upload_finished_sig.emit(None)
+                except BfpUploadError as e:
+                    self.upload_finished_sig.emit(str(e))
+                except Exception as e:
+                    # anything else must not leave the dialog stuck broadcasting
+                    self.upload_finished_sig.emit(repr(e))
+            threading.Thread(target=broadcast, name='BfpUploader', daemon=True).start()
+
+    def upload_progress(self, done, total):
+        self.progress.setValue(done)
+        if self.broadcasting:
+            self.progress_label.setText("Broadcasting " + str(done) + " of " + str(total) + " transactions")
+        else:
+            self.progress_label.setText("Signing " + str(done) + " of " + str(total) + " transactions")
+
+    def upload_finished(self, error):
+        self.broadcasting = False
+        if error is not None:
+            # broadcasting again resumes after the transactions the server accepted
+            self.show_error(error)
+            self.show_error("Upload failed. Try again.")
+            self.upload_button.setEnabled(True)
+            return
 
-            self.progress_label.setText("Broadcasting complete.")
-            self.progress.setHidden(True)
-            try:
-                self.parent.token_dochash_e.setText(self.hash.text())
-                self.parent.token_url_e.setText(self.bitcoinfileAddr_label.text())
-            except AttributeError:
-                pass
+        self.progress_label.setText("Broadcasting complete.")
+        self.progress.setHidden(True)
+        try:
+            self.parent.token_dochash_e.setText(self.hash.text())
+            self.parent.token_url_e.setText(self.bitcoinfileAddr_label.text())
+        except AttributeError:
+            pass
 
-            self.show_message("File upload complete.")
-            self.close()
+        self.show_message("File upload complete.")
+        self.close()
 
     def closeEvent(self, event):
         event.accept()
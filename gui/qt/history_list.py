@@ -26,7 +26,7 @@
 from .util import *
 import electroncash.web as web
 from electroncash.i18n import _
-from electroncash.util import timestamp_to_datetime, profiler, Weak
+from electroncash.util import profiler
 
 
 TX_ICONS = [
@@ -42,24 +42,294 @@ TX_ICONS = [
     "confirmed.svg",
 ]
 
-class HistoryList(MyTreeWidget):
+class HistoryModel(QAbstractItemModel):
+    ''' The rows of a HistoryList: the (tx_hash, height, conf, timestamp,
+    value, balance) items of wallet.get_history(), filtered and sorted.
+
+    The cells of a row are only formatted when the view asks for them, that
+    is when the row is on screen (or when sorting or filtering by a column
+    needs its text), and are kept until the row changes. '''
+
+    LABEL_COLUMN = 3
+
+    def __init__(self, history_list):
+        super().__init__(history_list)
+        self.hl = history_list
+        self.headers = []
+        self.history = []  # as returned by wallet.get_history(..., reverse=True)
+        self.rows = []  # the displayed history items
+        self.row_of = {}  # tx_hash -> index in self.rows
+        self.cells = {}  # tx_hash -> (status, cell texts), for the rows formatted so far (labels are looked up each time)
+        self.fiat_cells = {}  # tx_hash -> fiat cell texts
+        self.sort_column, self.sort_order = None, Qt.AscendingOrder
+        self.filter_text = ''
+
+    # QAbstractItemModel interface
+
+    def index(self, row, column, parent=QModelIndex()):
+        if parent.isValid() or not self.hasIndex(row, column, parent):
+            return QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index):
+        return QModelIndex()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(self.headers)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole and section < len(self.headers):
+            return self.headers[section]
+        return None
+
+    def flags(self, index):
+        flags = super().flags(index)
+        if index.column() == self.LABEL_COLUMN:
+            flags |= Qt.ItemIsEditable
+        return flags
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        item = self.rows[index.row()]
+        tx_hash, column = item[0], index.column()
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            return self.get_text(item, column)
+        if role == Qt.UserRole:
+            return tx_hash
+        if role == Qt.DecorationRole:
+            if column == 0:
+                return self.hl._get_icon_for_status(self.get_cells(item)[0])
+            if column == 3 and self.hl.wallet.invoices.paid.get(tx_hash):
+                return self.hl.invoiceIcon
+        elif role == Qt.ToolTipRole:
+            if column == 0:
+                conf = item[2]
+                return str(conf) + " confirmation" + ("s" if conf != 1 else "")
+        elif role == Qt.FontRole:
+            if column != 2:
+                return self.hl.monospaceFont
+        elif role == Qt.TextAlignmentRole:
+            if column > 3:
+                return int(Qt.AlignRight | Qt.AlignVCenter)
+        elif role == Qt.ForegroundRole:
+            if column in (3, 4) and item[4] and item[4] < 0:
+                return self.hl.withdrawalBrush
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if role != Qt.EditRole or index.column() != self.LABEL_COLUMN:
+            return False
+        tx_hash = self.rows[index.row()][0]
+        if value == self.get_text(self.rows[index.row()], index.column()):
+            return False
+        self.hl.wallet.set_label(tx_hash, value)
+        self.hl.parent.update_labels()
+        return True
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sort_column, self.sort_order = column, order
+        self.layoutAboutToBeChanged.emit()
+        old_rows = self.rows
+        self.rows = self.sorted(self.rows)
+        self.row_of = {item[0]: i for i, item in enumerate(self.rows)}
+        # keep the selection and current index on the same txs
+        old_indexes = self.persistentIndexList()
+        new_indexes = [self.index(self.row_of[old_rows[ix.row()][0]], ix.column()) for ix in old_indexes]
+        self.changePersistentIndexList(old_indexes, new_indexes)
+        self.layoutChanged.emit()
+
+    # cell formatting
+
+    def get_cells(self, item):
+        ''' Returns (status, [cell texts]) for history item, without the fiat
+        columns. '''
+        tx_hash, height, conf, timestamp, value, balance = item
+        ret = self.cells.get(tx_hash)
+        if ret is None:
+            wallet, format_amount = self.hl.wallet, self.hl.parent.format_amount
+            status, status_str = wallet.get_tx_status(tx_hash, height, conf, timestamp)
+            ret = self.cells[tx_hash] = (status, [
+                '', tx_hash, status_str, None,
+                format_amount(value, True, whitespaces=True), format_amount(balance, whitespaces=True)
+            ])
+        return ret
+
+    def get_fiat_cells(self, items):
+        ''' Returns the fiat amount and balance texts of history items,
+        looking up the rates of those not formatted yet in one go. '''
+        fx = self.hl.parent.fx
+        missing = [item for item in items if item[0] not in self.fiat_cells]
+        if missing:
+            timestamps = [time.time() if conf <= 0 else timestamp for _h, _ht, conf, timestamp, _v, _b in missing]
+            for item, fiat in zip(missing, zip(fx.historical_value_strs([item[4] for item in missing], timestamps),
+                                               fx.historical_value_strs([item[5] for item in missing], timestamps))):
+                self.fiat_cells[item[0]] = fiat
+        return [self.fiat_cells[item[0]] for item in items]
+
+    def get_text(self, item, column):
+        if column == self.LABEL_COLUMN:
+            return self.hl.wallet.get_label(item[0])
+        if column < 6:
+            return self.get_cells(item)[1][column]
+        return self.get_fiat_cells([item])[0][column - 6]
+
+    def sort_key(self, column):
+        ''' Returns a function of history items to sort them by column,
+        ordering them as the SortableTreeWidgetItems of a MyTreeWidget did. '''
+        if column == 0:
+            # the status orders the unconfirmed txs, and goes up with conf for the others
+            return lambda item: (self.get_cells(item)[0] if item[2] <= 0 else 4, item[2])
+        if column == 2:
+            return lambda item: (1, self.get_cells(item)[1][2], 0) if item[2] <= 0 else (0, '', item[3] or 0)
+        if column in (4, 5):
+            return lambda item: (item[column] is not None, item[column] or 0)
+        def text_key(item):
+            text = self.get_text(item, column)
+            try:
+                return (0, float(text.replace(',', '')), '')
+            except ValueError:
+                return (1, 0, text)
+        return text_key
+
+    def sorted(self, items):
+        items = list(items)
+        if self.sort_column is None or self.sort_column >= len(self.headers):
+            return items
+        if self.sort_column >= 6:
+            self.get_fiat_cells(items)  # in one go
+        return sorted(items, key=self.sort_key(self.sort_column), reverse=self.sort_order == Qt.DescendingOrder)
+
+    def matches_filter(self, item):
+        p = self.filter_text
+        return not p or any(self.get_text(item, column).lower().find(p) != -1 for column in self.hl.filter_columns)
+
+    # updates
+
+    def set_headers(self, headers):
+        self.beginResetModel()
+        self.headers = headers
+        self.fiat_cells.clear()
+        self.endResetModel()
+
+    def set_history(self, history):
+        ''' Displays history, inserting the rows of new txs if the txs
+        displayed so far are still there in the same order, or else resetting
+        the model. '''
+        self.history = history
+        self.cells.clear()
+        self.fiat_cells.clear()
+        rows = self.sorted(item for item in history if self.matches_filter(item))
+        old = self.row_of
+        inserts = []  # (row, count)
+        n = 0  # rows of the old ones seen so far
+        for i, item in enumerate(rows):
+            if item[0] in old:
+                if old[item[0]] != n:
+                    break
+                n += 1
+            elif inserts and sum(inserts[-1]) == i:
+                inserts[-1] = (inserts[-1][0], inserts[-1][1] + 1)
+            else:
+                inserts.append((i, 1))
+        else:
+            if n == len(self.rows):
+                # the same as before but for the inserted txs
+                for row, count in inserts:
+                    self.beginInsertRows(QModelIndex(), row, row + count - 1)
+                    self.rows[row:row] = rows[row:row + count]
+                    self.endInsertRows()
+                self.rows = rows
+                self.row_of = {item[0]: i for i, item in enumerate(rows)}
+                if rows and self.headers:
+                    self.dataChanged.emit(self.index(0, 0), self.index(len(rows) - 1, len(self.headers) - 1))
+                return
+        self.beginResetModel()
+        self.rows = rows
+        self.row_of = {item[0]: i for i, item in enumerate(rows)}
+        self.endResetModel()
+
+    def set_filter(self, p):
+        if p == self.filter_text:
+            return
+        self.filter_text = p
+        self.set_history(self.history)
+
+    def update_item(self, tx_hash, height, conf, timestamp):
+        ''' Updates the row of tx_hash with a new height, returning whether
+        it is there. '''
+        i = self.row_of.get(tx_hash)
+        if i is None:
+            return False
+        self.rows[i] = (tx_hash, height, conf, timestamp) + self.rows[i][4:]
+        self.cells.pop(tx_hash, None)
+        self.fiat_cells.pop(tx_hash, None)
+        self.dataChanged.emit(self.index(i, 0), self.index(i, len(self.headers) - 1))
+        return True
+
+    def labels_changed(self):
+        if self.rows:
+            self.dataChanged.emit(self.index(0, self.LABEL_COLUMN), self.index(len(self.rows) - 1, self.LABEL_COLUMN))
+
+
+class HistoryList(QTableView):
+    ''' The history tab, as a view of a HistoryModel so that only the rows
+    on screen get formatted, which keeps wallets with a huge history
+    responsive. It otherwise works like the MyTreeWidget it used to be. '''
+
     filter_columns = [2, 3, 4]  # Date, Description, Amount
     statusIcons = {}
     default_sort = MyTreeWidget.SortSpec(0, Qt.AscendingOrder)
+    stretch_column = 3
+    editable_columns = [HistoryModel.LABEL_COLUMN]
 
     def __init__(self, parent):
-        super().__init__(parent, self.create_menu, [], 3, deferred_updates=True)
-        self.refresh_headers()
-        self.setColumnHidden(1, True)
+        super().__init__(parent)
+        self.parent = parent
+        self.config = parent.config
         # force attributes to always be defined, even if None, at construction.
         self.wallet = self.parent.wallet
+        self.cleaned_up = False
 
         self.monospaceFont = QFont(MONOSPACE_FONT)
         self.withdrawalBrush = QBrush(QColor("#BC1E1E"))
         self.invoiceIcon = QIcon(":icons/seal")
-        self._item_cache = Weak.ValueDictionary()
 
         self.has_unknown_balances = False
+        self.deferred_updates = True
+        self.deferred_update_ct, self._forced_update = 0, False
+        self.pending_update = False
+
+        self.setShowGrid(False)
+        self.setWordWrap(False)
+        self.setAlternatingRowColors(True)
+        self.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.verticalHeader().hide()
+        # all rows have the same height, so nothing needs to look at all of them
+        self.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.verticalHeader().setDefaultSectionSize(QFontMetrics(self.monospaceFont).height() + 4)
+        self.horizontalHeader().setHighlightSections(False)
+        # size the columns from the rows on screen and at most 100 others (rather than 1000)
+        self.horizontalHeader().setResizeContentsPrecision(100)
+        self.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.customContextMenuRequested.connect(self.create_menu)
+        self.doubleClicked.connect(self.on_doubleclick)
+
+        self.history_model = HistoryModel(self)
+        self.setModel(self.history_model)
+        self.refresh_headers()
+        self.setSortingEnabled(True)
+        self.sortByColumn(self.default_sort.column, self.default_sort.qt_sort_order)
+
+        # re-sorts after rows changed status, see update_item()
+        self._resort_timer = QTimer(self)
+        self._resort_timer.setSingleShot(True)
+        self._resort_timer.timeout.connect(self._resort)
 
     def clean_up(self):
         self.cleaned_up = True
@@ -69,34 +339,48 @@ class HistoryList(MyTreeWidget):
         fx = self.parent.fx
         if fx and fx.show_history():
             headers.extend(['%s '%fx.ccy + _('Amount'), '%s '%fx.ccy + _('Balance')])
-        self.update_headers(headers)
+        self.history_model.set_headers(headers)
+        self.horizontalHeader().setStretchLastSection(False)
+        for col in range(len(headers)):
+            sm = QHeaderView.Stretch if col == self.stretch_column else QHeaderView.ResizeToContents
+            self.horizontalHeader().setSectionResizeMode(col, sm)
+        self.setColumnHidden(1, True)
 
     def get_domain(self):
         '''Replaced in address_dialog.py'''
         return self.wallet.get_addresses()
 
+    def should_defer_update_incr(self):
+        ret = (self.deferred_updates and not self.isVisible()
+               and not self._forced_update)
+        if ret:
+            self.deferred_update_ct += 1
+        return ret
+
     @rate_limited(1.0, classlevel=True, ts_after=True) # We rate limit the history list refresh no more than once every second, app-wide
     def update(self):
         if self.wallet and (not self.wallet.thread or not self.wallet.thread.isRunning()):
             # short-cut return if window was closed and wallet is stopped
             return
-        super().update()
-
-    def clear(self):
-        self._item_cache.clear()
-        super().clear()
+        if self.state() == QAbstractItemView.EditingState:
+            # updated when the editor closes
+            self.pending_update = True
+        elif not self.should_defer_update_incr():
+            self.on_update()
+            self.deferred_update_ct = 0
 
-    def insertTopLevelItem(self, index, item, tx_hash=None):
-        super().insertTopLevelItem(index, item)
-        tx_hash = tx_hash or item.data(0, Qt.UserRole)
-        if tx_hash:
-            self._item_cache[tx_hash] = item
+    def showEvent(self, e):
+        super().showEvent(e)
+        if e.isAccepted() and self.deferred_update_ct:
+            self._forced_update = True
+            self.update()
+            self._forced_update = False
 
-    def addTopLevelItem(self, item, tx_hash=None):
-        super().addTopLevelItem(item)
-        tx_hash = tx_hash or item.data(0, Qt.UserRole)
-        if tx_hash:
-            self._item_cache[tx_hash] = item
+    def closeEditor(self, editor, hint):
+        super().closeEditor(editor, hint)
+        if self.pending_update:
+            self.pending_update = False
+            self.update()
 
     @classmethod
     def _get_icon_for_status(cls, status):
@@ -105,66 +389,57 @@ class HistoryList(MyTreeWidget):
             cls.statusIcons[status] = ret = QIcon(":icons/" + TX_ICONS[status])
         return ret
 
+    def current_tx_hash(self):
+        index = self.currentIndex()
+        return index.data(Qt.UserRole) if index.isValid() else None
+
+    def select_tx(self, tx_hash):
+        row = self.history_model.row_of.get(tx_hash)
+        if row is not None:
+            self.setCurrentIndex(self.history_model.index(row, 0))
+
     @profiler
     def on_update(self):
         self.wallet = self.parent.wallet
         h = self.wallet.get_history(self.get_domain(), reverse=True)
-        sels = self.selectedItems()
-        current_tx = sels[0].data(0, Qt.UserRole) if sels else None
-        del sels #  make sure not to hold stale ref to C++ list of items which will be deleted in clear() call below
-        self.clear()
-        self.has_unknown_balances = False
+        current_tx = self.current_tx_hash()
         fx = self.parent.fx
         if fx: fx.history_used_spot = False
-        for h_item in h:
-            tx_hash, height, conf, timestamp, value, balance = h_item
-            label = self.wallet.get_label(tx_hash)
-            if value is None or balance is None:
-                # Workaround to the fact that sometimes the wallet doesn't
-                # know the actual balance for history items while it's
-                # downloading history, and we want to flag that situation
-                # and redraw the GUI sometime later when it finishes updating.
-                # This flag is checked in main_window.py, TxUpdateMgr class.
-                self.has_unknown_balances = True
-            status, status_str = self.wallet.get_tx_status(tx_hash, height, conf, timestamp)
-            has_invoice = self.wallet.invoices.paid.get(tx_hash)
-            icon = self._get_icon_for_status(status)
-            v_str = self.parent.format_amount(value, True, whitespaces=True)
-            balance_str = self.parent.format_amount(balance, whitespaces=True)
-            entry = ['', tx_hash, status_str, label, v_str, balance_str]
-            if fx and fx.show_history():
-                date = timestamp_to_datetime(time.time() if conf <= 0 else timestamp)
-                for amount in [value, balance]:
-                    text = fx.historical_value_str(amount, date)
-                    entry.append(text)
-            item = SortableTreeWidgetItem(entry)
-            if icon: item.setIcon(0, icon)
-            item.setToolTip(0, str(conf) + " confirmation" + ("s" if conf != 1 else ""))
-            item.setData(0, SortableTreeWidgetItem.DataRole, (status, conf))
-            if has_invoice:
-                item.setIcon(3, self.invoiceIcon)
-            for i in range(len(entry)):
-                if i>3:
-                    item.setTextAlignment(i, Qt.AlignRight | Qt.AlignVCenter)
-                if i!=2:
-                    item.setFont(i, self.monospaceFont)
-            if value and value < 0:
-                item.setForeground(3, self.withdrawalBrush)
-                item.setForeground(4, self.withdrawalBrush)
-            item.setData(0, Qt.UserRole, tx_hash)
-            self.addTopLevelItem(item, tx_hash)
-            if current_tx == tx_hash:
-                # Note that it's faster to setSelected once the item is in
-                # the tree. Also note that doing setSelected() on the item
-                # itself is much faster than doing setCurrentItem()
-                # which must do a linear search in the tree (wastefully)
-                item.setSelected(True)
-
-    def on_doubleclick(self, item, column):
-        if self.permit_edit(item, column):
-            super(HistoryList, self).on_doubleclick(item, column)
+        # Workaround to the fact that sometimes the wallet doesn't
+        # know the actual balance for history items while it's
+        # downloading history, and we want to flag that situation
+        # and redraw the GUI sometime later when it finishes updating.
+        # This flag is checked in main_window.py, TxUpdateMgr class.
+        self.has_unknown_balances = any(value is None or balance is None for _h, _ht, _c, _t, value, balance in h)
+        self.history_model.set_history(h)
+        if current_tx and current_tx != self.current_tx_hash():
+            self.select_tx(current_tx)
+
+    def filter(self, p):
+        current_tx = self.current_tx_hash()
+        self.history_model.set_filter(p.lower())
+        if current_tx:
+            self.select_tx(current_tx)
+
+    def keyPressEvent(self, event):
+        if event.key() in [ Qt.Key_F2, Qt.Key_Return ] and self.state() != QAbstractItemView.EditingState:
+            index = self.currentIndex()
+            if index.isValid():
+                # on 'enter' we show the menu
+                pt = self.visualRect(index).bottomLeft()
+                pt.setX(50)
+                self.customContextMenuRequested.emit(pt)
         else:
-            tx_hash = item.data(0, Qt.UserRole)
+            super().keyPressEvent(event)
+
+    def permit_edit(self, index):
+        return index.column() in self.editable_columns
+
+    def on_doubleclick(self, index):
+        if self.permit_edit(index):
+            self.edit(index)
+        else:
+            tx_hash = index.data(Qt.UserRole)
             tx = self.wallet.transactions.get(tx_hash)
             if tx:
                 label = self.wallet.get_label(tx_hash) or None
@@ -173,55 +448,38 @@ class HistoryList(MyTreeWidget):
     def update_labels(self):
         if self.should_defer_update_incr():
             return
-        root = self.invisibleRootItem()
-        child_count = root.childCount()
-        for i in range(child_count):
-            item = root.child(i)
-            txid = item.data(0, Qt.UserRole)
-            label = self.wallet.get_label(txid)
-            item.setText(3, label)
+        self.history_model.labels_changed()
+        if self.history_model.sort_column == HistoryModel.LABEL_COLUMN or self.history_model.filter_text:
+            self.on_update()
 
     def update_item(self, tx_hash, height, conf, timestamp):
         if not self.wallet: return # can happen on startup if this is called before self.on_update()
-        item = self._item_cache.get(tx_hash)
-        if item:
-            idx = self.invisibleRootItem().indexOfChild(item)
-            was_cur = False
-            if idx > -1:
-                # We must take the child out of the view when updating.
-                # This is because otherwise for widgets with many thousands of
-                # items, this method becomes *horrendously* slow (500ms per
-                # call!)... but doing this hack makes it fast (~1ms per call).
-                was_cur = self.currentItem() is item
-                self.invisibleRootItem().takeChild(idx)
-            status, status_str = self.wallet.get_tx_status(tx_hash, height, conf, timestamp)
-            icon = self._get_icon_for_status(status)
-            if icon: item.setIcon(0, icon)
-            item.setData(0, SortableTreeWidgetItem.DataRole, (status, conf))
-            item.setText(2, status_str)
-            if idx > -1:
-                # Now, put the item back again
-                self.invisibleRootItem().insertChild(idx, item)
-                if was_cur:
-                    self.setCurrentItem(item)
-        elif self.should_defer_update_incr():
-            return False
-        return bool(item)  # indicate to client code whether an actual update occurred
+        if self.history_model.update_item(tx_hash, height, conf, timestamp):
+            if self.history_model.sort_column in (0, 2):
+                # the row may have to move; done once for all the items updated in a row
+                self._resort_timer.start(0)
+            return True  # indicate to client code whether an actual update occurred
+        self.should_defer_update_incr()
+        return False
+
+    def _resort(self):
+        if self.isSortingEnabled():
+            self.history_model.sort(self.history_model.sort_column, self.history_model.sort_order)
 
     def create_menu(self, position):
-        item = self.currentItem()
-        if not item:
+        index = self.currentIndex()
+        if not index.isValid():
             return
-        column = self.currentColumn()
-        tx_hash = item.data(0, Qt.UserRole)
+        column = index.column()
+        tx_hash = index.data(Qt.UserRole)
         if not tx_hash:
             return
         if column is 0:
             column_title = "ID"
             column_data = tx_hash
         else:
-            column_title = self.headerItem().text(column)
-            column_data = item.text(column)
+            column_title = self.history_model.headerData(column, Qt.Horizontal)
+            column_data = index.data()
 
         tx_URL = web.BE_URL(self.config, 'tx', tx_hash)
         height, conf, timestamp = self.wallet.get_tx_height(tx_hash)
@@ -234,9 +492,9 @@ class HistoryList(MyTreeWidget):
 
         menu.addAction(_("&Copy {}").format(column_title), lambda: self.parent.app.clipboard().setText(column_data.strip()))
         if column in self.editable_columns:
-            # We grab a fresh reference to the current item, as it has been deleted in a reported issue.
+            # We grab a fresh reference to the current index, as the row may have moved since.
             menu.addAction(_("&Edit {}").format(column_title),
-                lambda: self.currentItem() and self.editItem(self.currentItem(), column))
+                lambda: self.select_tx(tx_hash) or self.edit(self.history_model.index(self.history_model.row_of[tx_hash], column)))
         label = self.wallet.get_label(tx_hash) or None
         menu.addAction(_("&Details"), lambda: self.parent.show_transaction(tx, label))
         if is_unconfirmed and tx:
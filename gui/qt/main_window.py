@@ -195,7 +195,7 @@ class ElectrumWindow(QMainWindow, MessageBoxMixin, PrintError):
         self.tx_external_keypairs = {}
         self._tx_dialogs = Weak.Set()
         self._slp_dialogs = Weak.Set()
-        self.tx_update_mgr = TxUpdateMgr(self)  # manages network callbacks for 'new_transaction' and 'verified2', and collates GUI updates from said callbacks as a performance optimization
+        self.tx_update_mgr = TxUpdateMgr(self)  # manages network callbacks for 'new_transaction' and the changes to the wallet, and collates GUI updates from those as a performance optimization
         self.is_schnorr_enabled = self.wallet.is_schnorr_enabled  # This is a function -- Support for plugins that may be using the 4.0.3 & 4.0.4 API -- this function used to live in this class, before being moved to Abstract_Wallet.
         self.send_tab_opreturn_widgets, self.receive_tab_opreturn_widgets = [], []  # defaults to empty list
         self._shortcuts = Weak.Set()  # keep track of shortcuts and disable them on close
@@ -280,8 +280,7 @@ class ElectrumWindow(QMainWindow, MessageBoxMixin, PrintError):
         if self.network:
             self.network_signal.connect(self.on_network_qt)
             interests = ['blockchain_updated', 'wallet_updated',
-                         'new_transaction', 'status', 'banner', 'verified2',
-                         'fee']
+                         'new_transaction', 'status', 'banner', 'fee']
             # To avoid leaking references to "self" that prevent the
             # window from being GC-ed when closed, callbacks should be
             # methods of this class only, and specifically not be
@@ -442,16 +441,15 @@ class ElectrumWindow(QMainWindow, MessageBoxMixin, PrintError):
     def on_network(self, event, *args):
         #self.print_error("on_network:", event, *args)
         if event == 'wallet_updated':
+            # what changed in the wallet is applied by self.tx_update_mgr
             if args[0] is self.wallet:
-                self.need_update.set()
+                self.network_signal.emit('status', args)
         elif event == 'blockchain_updated':
-            self.need_update.set()
+            self.tx_update_mgr.blockchain_updated()
         elif event == 'new_transaction':
             self.tx_update_mgr.notif_add(args)  # added only if this wallet's tx
             if args[1] is self.wallet:
                 self.network_signal.emit(event, args)
-        elif event == 'verified2':
-            self.tx_update_mgr.verif_add(args)  # added only if this wallet's tx
         elif event in ['status', 'banner', 'fee']:
             # Handle in GUI thread
             self.network_signal.emit(event, args)
@@ -1200,6 +1198,7 @@ class ElectrumWindow(QMainWindow, MessageBoxMixin, PrintError):
     @rate_limited(1.0, classlevel=True, ts_after=True) # Limit tab updates to no more than 1 per second, app-wide. Multiple calls across instances will be collated into 1 deferred series of calls (1 call per extant instance)
     def update_tabs(self):
         if self.cleaned_up: return
+        self.tx_update_mgr.changes_shown()
         self.history_list.update()
         self.request_list.update()
         self.address_list.update()
@@ -1210,7 +1209,7 @@ class ElectrumWindow(QMainWindow, MessageBoxMixin, PrintError):
         if self.is_slp_wallet:
             self.slp_history_list.update()
             self.token_list.update()
-        self.history_updated_signal.emit() # inform things like address_dialog that there's a new history, also clears self.tx_update_mgr.verif_q
+        self.history_updated_signal.emit() # inform things like address_dialog that there's a new history
         self.need_update.clear() # clear flag
         if self.labels_need_update.is_set():
             # if flag was set, might as well declare the labels updated since they necessarily were due to a full update.
@@ -4340,57 +4339,25 @@ class ElectrumWindow(QMainWindow, MessageBoxMixin, PrintError):
         if not wallet:
             return
         dlg = None  # this will be set at the bottom of this function
+        ccy = (self.fx and self.fx.get_currency()) or ''
+        has_fiat_columns = bool(self.fx and self.fx.show_history() and ccy)
         def task():
             def update_prog(x):
                 if dlg: dlg.update_progress(int(x*100))
-            return wallet.export_history(fx=self.fx,
-                                         show_addresses=include_addresses,
-                                         decimal_point=self.decimal_point,
-                                         fee_calc_timeout=timeout,
-                                         download_inputs=download_inputs,
-                                         progress_callback=update_prog)
+            items = wallet.iter_history_export(fx=self.fx,
+                                               show_addresses=include_addresses,
+                                               decimal_point=self.decimal_point,
+                                               fee_calc_timeout=timeout,
+                                               download_inputs=download_inputs,
+                                               progress_callback=update_prog)
+            # the rows are written as they are exported, so that the whole
+            # history never has to be held in memory
+            with open(fileName, "w+", encoding="utf-8") as f:  # ensure encoding to utf-8. Avoid Windows cp1252. See #1453.
+                wallet.write_history(f, items, is_csv=is_csv, include_addresses=include_addresses,
+                                     fiat_currency=ccy if has_fiat_columns else None)
         success = False
-        def on_success(history):
+        def on_success(result):
             nonlocal success
-            ccy = (self.fx and self.fx.get_currency()) or ''
-            has_fiat_columns = history and self.fx and self.fx.show_history() and 'fiat_value' in history[0] and 'fiat_balance' in history[0] and 'fiat_fee' in history[0]
-            lines = []
-            for item in history:
-                if is_csv:
-                    cols = [item['txid'], item.get('label', ''), item['confirmations'], item['value'], item['fee'], item['date']]
-                    if has_fiat_columns:
-                        cols += [item['fiat_value'], item['fiat_balance'], item['fiat_fee']]
-                    if include_addresses:
-                        inaddrs_filtered = (x for x in (item.get('input_addresses') or [])
-                                            if Address.is_valid(x))
-                        outaddrs_filtered = (x for x in (item.get('output_addresses') or [])
-                                             if Address.is_valid(x))
-                        cols.append( ','.join(inaddrs_filtered) )
-                        cols.append( ','.join(outaddrs_filtered) )
-                    lines.append(cols)
-                else:
-                    if has_fiat_columns and ccy:
-                        item['fiat_currency'] = ccy  # add the currency to each entry in the json. this wastes space but json is bloated anyway so this won't hurt too much, we hope
-                    elif not has_fiat_columns:
-                        # No need to include these fields as they will always be 'No Data'
-                        item.pop('fiat_value', None)
-                        item.pop('fiat_balance', None)
-                        item.pop('fiat_fee', None)
-                    lines.append(item)
-
-            with open(fileName, "w+", encoding="utf-8") as f:  # ensure encoding to utf-8. Avoid Windows cp1252. See #1453.
-                if is_csv:
-                    transaction = csv.writer(f, lineterminator='\n')
-                    cols = ["transaction_hash","label", "confirmations", "value", "fee", "timestamp"]
-                    if has_fiat_columns:
-                        cols += [f"fiat_value_{ccy}", f"fiat_balance_{ccy}", f"fiat_fee_{ccy}"]  # in CSV mode, we use column names eg fiat_value_USD, etc
-                    if include_addresses:
-                        cols += ["input_addresses", "output_addresses"]
-                    transaction.writerow(cols)
-                    for line in lines:
-                        transaction.writerow(line)
-                else:
-                    f.write(json.dumps(lines, indent=4))
             success = True
         # kick off the waiting dialog to do all of the above
         dlg = WaitingDialog(self.top_level_window(),
@@ -5296,6 +5263,10 @@ class ElectrumWindow(QMainWindow, MessageBoxMixin, PrintError):
             del shortcut
         self._shortcuts.clear()
 
+        # The lists stop collecting what changes in the wallet
+        self.address_list.clean_up()
+        self.utxo_list.clean_up()
+
         # Reparent children to 'None' so python GC can clean them up sooner rather than later.
         # This also hopefully helps accelerate this window's GC.
         children = [c for c in self.children()
@@ -5564,9 +5535,11 @@ class ElectrumWindow(QMainWindow, MessageBoxMixin, PrintError):
 
 
 class TxUpdateMgr(QObject, PrintError):
-    ''' Manages new transaction notifications and transaction verified
-    notifications from the network thread. It collates them and sends them to
-    the appropriate GUI controls in the main_window in an efficient manner. '''
+    ''' Manages new transaction notifications from the network thread and the
+    changes to the wallet, as collected by a WalletChanges (see
+    Abstract_Wallet.watch_changes). It collates them and sends them to the
+    appropriate GUI controls in the main_window in an efficient manner, so
+    that only the lists affected by a change are updated. '''
     def __init__(self, main_window_parent):
         assert isinstance(main_window_parent, ElectrumWindow), "TxUpdateMgr must be constructed with an ElectrumWindow as its parent"
         super().__init__(main_window_parent)
@@ -5574,11 +5547,13 @@ class TxUpdateMgr(QObject, PrintError):
         self.lock = threading.Lock()  # used to lock thread-shared attrs below
         # begin thread-shared attributes
         self.notif_q = []
-        self.verif_q = []
-        self.need_process_v, self.need_process_n = False, False
+        self.need_process_n = False
+        self.need_process_b = False  # the chain tip moved, confirmations changed
         # /end thread-shared attributes
         self.weakParent = Weak.ref(main_window_parent)
-        main_window_parent.history_updated_signal.connect(self.verifs_get_and_clear, Qt.DirectConnection)  # immediately clear verif_q on history update because it would be redundant to keep the verify queue around after a history list update
+        # the update_tabs() which starts out a window shows everything so far
+        self.changes = main_window_parent.wallet.watch_changes()
+        self.changes.take()
         main_window_parent.on_timer_signal.connect(self.do_check, Qt.DirectConnection)  # hook into main_window's timer_actions function
         self.full_hist_refresh_timer = QTimer(self)
         self.full_hist_refresh_timer.setInterval(1000); self.full_hist_refresh_timer.setSingleShot(False)
@@ -5591,33 +5566,32 @@ class TxUpdateMgr(QObject, PrintError):
         self.cleaned_up = True
         main_window_parent = self.weakParent()  # weak -> strong ref
         if main_window_parent:
-            try: main_window_parent.history_updated_signal.disconnect(self.verifs_get_and_clear)
-            except TypeError: pass
+            main_window_parent.wallet.unwatch_changes(self.changes)
             try: main_window_parent.on_timer_signal.disconnect(self.do_check)
             except TypeError: pass
 
     def do_check(self):
-        ''' Called from timer_actions in main_window to check if notifs or
-        verifs need to update the GUI.
-          - Checks the need_process_[v|n] flags
-          - If either flag is set, call the @rate_limited process_verifs
-            and/or process_notifs functions which update GUI parent in a
+        ''' Called from timer_actions in main_window to check if wallet
+        changes or notifs need to update the GUI.
+          - Checks for pending wallet changes and the need_process_[b|n] flags
+          - If so, call the @rate_limited process_changes and/or
+            process_notifs functions which update GUI parent in a
             rate-limited (collated) fashion (for decent GUI responsiveness). '''
         with self.lock:
-            bV, bN = self.need_process_v, self.need_process_n
-            self.need_process_v, self.need_process_n = False, False
-        if bV: self.process_verifs()  # rate_limited call (1 per second)
+            bN = self.need_process_n
+            self.need_process_n = False
+        if self.changes.pending() or self.need_process_b:
+            self.process_changes()  # rate_limited call (1 per second)
         if bN: self.process_notifs()  # rate_limited call (1 per 15 seconds)
 
-    def verifs_get_and_clear(self):
-        ''' Clears the verif_q. This is called from the network
-        thread for the 'verified2' event as well as from the below
-        update_verifs (GUI thread), hence the lock. '''
-        with self.lock:
-            ret = self.verif_q
-            self.verif_q = []
-            self.need_process_v = False
-            return ret
+    def changes_shown(self):
+        ''' Called by a full refresh of the tabs (update_tabs in main_window),
+        which shows all the changes so far. '''
+        self.changes.take()
+        self.need_process_b = False
+
+    def blockchain_updated(self):
+        self.need_process_b = True
 
     def notifs_get_and_clear(self):
         with self.lock:
@@ -5626,17 +5600,6 @@ class TxUpdateMgr(QObject, PrintError):
             self.need_process_n = False
             return ret
 
-    def verif_add(self, args):
-        # args: [wallet, tx_hash, height, conf, timestamp]
-        # filter out tx's not for this wallet
-        parent = self.weakParent()
-        if not parent or parent.cleaned_up:
-            return
-        if args[0] is parent.wallet:
-            with self.lock:
-                self.verif_q.append(args[1:])
-                self.need_process_v = True
-
     def notif_add(self, args):
         parent = self.weakParent()
         if not parent or parent.cleaned_up:
@@ -5649,41 +5612,62 @@ class TxUpdateMgr(QObject, PrintError):
                 self.need_process_n = True
 
     @rate_limited(1.0, ts_after=True)
-    def process_verifs(self):
-        ''' Update history list with tx's from verifs_q, but limit the
-        GUI update rate to once per second. '''
+    def process_changes(self):
+        ''' Updates the lists showing what changed in the wallet, but limits
+        the GUI update rate to once per second. While the wallet is syncing,
+        only the txs already displayed are updated, the rest being left
+        pending until it is done. '''
         parent = self.weakParent()
         if not parent or parent.cleaned_up:
             return
-        items = self.verifs_get_and_clear()
-        if items:
-            t0 = time.time()
-            parent.history_list.setUpdatesEnabled(False)
-            parent.slp_history_list.setUpdatesEnabled(False)
-            had_sorting = [ parent.history_list.isSortingEnabled(),
-                            parent.slp_history_list.isSortingEnabled() ]
-            if had_sorting[0]:
-                parent.history_list.setSortingEnabled(False)
-            if had_sorting[1]:
-                parent.slp_history_list.setSortingEnabled(False)
-            n_updates = 0
-            for item in items:
-                did_update = parent.history_list.update_item(*item)
-                parent.slp_history_list.update_item_netupdate(*item)
-                n_updates += 1 if did_update else 0
-            self.print_error("Updated {}/{} verified txs in GUI in {:0.2f} ms"
-                             .format(n_updates, len(items), (time.time()-t0)*1e3))
-            if had_sorting[0]:
-                parent.history_list.setSortingEnabled(True)
-            if had_sorting[1]:
-                parent.slp_history_list.setSortingEnabled(True)
-            parent.slp_history_list.setUpdatesEnabled(True)
-            parent.history_list.setUpdatesEnabled(True)
-            parent.update_status()
-            if parent.history_list.has_unknown_balances:
-                self.print_error("History tab: 'Unknown' balances detected, will schedule a GUI refresh after wallet settles")
-                self._full_refresh_ctr = 0
-                self.full_hist_refresh_timer.start()
+        wallet = parent.wallet
+        delta = self.changes.take()
+        if delta is None:
+            parent.need_update.set()  # a full refresh
+            return
+        t0 = time.time()
+        syncing = not wallet.up_to_date and parent.network and parent.network.is_connected()
+        history_list = parent.history_list
+        # txs which came or went (rather than just changed status) change the
+        # running balance of the history, which is then recomputed
+        new_txs = {tx_hash for tx_hash in delta.txs
+                   if tx_hash not in history_list.history_model.row_of or not wallet.tx_addr_hist.get(tx_hash)}
+        if syncing and new_txs:
+            self.changes.add(txs=new_txs)
+            new_txs, delta = set(), delta._replace(txs=delta.txs - new_txs)
+        n_updates = 0
+        new_block, self.need_process_b = self.need_process_b, False
+        if new_txs or new_block:
+            history_list.update()
+        else:
+            for tx_hash in delta.txs:
+                item = (tx_hash,) + wallet.get_tx_height(tx_hash)
+                n_updates += 1 if history_list.update_item(*item) else 0
+        if parent.is_slp_wallet:
+            if new_txs or new_block:
+                parent.slp_history_list.update()
+            elif delta.txs:
+                parent.slp_history_list.update_txs(delta.txs)
+            if delta.tokens or delta.addresses or delta.coins:
+                # cheap, see Abstract_Wallet.get_slp_token_summaries
+                parent.token_list.update()
+        if delta.addresses or delta.coins:
+            parent.address_list.update()
+            parent.utxo_list.update()
+        if delta.addresses:
+            parent.request_list.update()
+        if new_txs:
+            parent.invoice_list.update()
+        if delta.txs:
+            parent.history_updated_signal.emit()  # inform things like address_dialog that there's a new history
+        parent.update_status()
+        self.print_error("Applied changes to {} txs ({} updated in place), {} addresses, {} coins, {} tokens in {:0.2f} ms"
+                         .format(len(delta.txs), n_updates, len(delta.addresses), len(delta.coins), len(delta.tokens),
+                                 (time.time()-t0)*1e3))
+        if history_list.has_unknown_balances:
+            self.print_error("History tab: 'Unknown' balances detected, will schedule a GUI refresh after wallet settles")
+            self._full_refresh_ctr = 0
+            self.full_hist_refresh_timer.start()
 
     _full_refresh_ctr = 0
     def schedule_full_hist_refresh_maybe(self):
@@ -5696,7 +5680,7 @@ class TxUpdateMgr(QObject, PrintError):
             self.full_hist_refresh_timer.stop()
         elif parent and parent.history_list.has_unknown_balances:
             # Still have 'Unknown' balance. Check if wallet is settled.
-            if self.need_process_v or not parent.wallet.is_fully_settled_down():
+            if self.changes.pending() or not parent.wallet.is_fully_settled_down():
                 # Wallet not fully settled down yet... schedule this function to run later
                 self.print_error("History tab: Wallet not yet settled.. will try again in 1 second...")
             else:
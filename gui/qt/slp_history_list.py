@@ -33,7 +33,6 @@ from electroncash.util import timestamp_to_datetime, profiler
 from electroncash.util import format_satoshis_nofloat
 
 from .slp_add_token_dialog import SlpAddTokenDialog
-from electroncash.slp_graph_search import slp_gs_mgr
 
 from locale import localeconv
 from collections import defaultdict
@@ -54,27 +53,12 @@ TX_ICONS = [
 
 class HistoryList(MyTreeWidget):
     filter_columns = [2, 3, 4]  # Date, Description, Amount
+    validation_priority_count = 50  # number of newest txs whose validation gets prioritized
 
 
-    def slp_validity_slot(self, txid, validity):
-        # This gets pinged by the SLP validator when a validation job finishes.
-        # (see lib/wallet.py : slp_check_validation() )
-        if validity in (2,3,4):
-            # If validator found 'invalid', then we need to update balances,
-            # which requires recalculating / refreshing the whole list.
-            self.update()
-        else:
-            # If validator found 'valid' then the balances are OK, so just
-            # update the relevant items (note: may be multiple matches.).
-            items = self._allitems.get(txid, [])
-            for item in items:
-                self.update_item_state(item)
-
     def __init__(self, parent=None):
         MyTreeWidget.__init__(self, parent, self.create_menu, [], 4, deferred_updates=True)
 
-        slp_gs_mgr.slp_validity_signal.connect(self.slp_validity_slot, Qt.QueuedConnection)
-
         self.editable_columns=[]
         self.refresh_headers()
         self.setColumnHidden(1, True)
@@ -132,6 +116,10 @@ class HistoryList(MyTreeWidget):
 
             self._allitems[tx_hash].append(item)
 
+        # The newest txs end up at the top of the list where the user sees
+        # them, so ask for those to be validated first.
+        self.wallet.slp_prioritize_validation(h_item[0] for h_item in slp_history[-self.validation_priority_count:])
+
     def on_doubleclick(self, item, column):
         tx_hash = item.data(0, Qt.UserRole)
         tx = self.wallet.transactions.get(tx_hash)
@@ -218,6 +206,23 @@ class HistoryList(MyTreeWidget):
             item.setText(2, status_str)
             self.update_item_state(item)
 
+    def update_txs(self, tx_hashes):
+        ''' Updates the items of tx_hashes, whose confirmation status or SLP
+        validity changed (as collected by the main window's TxUpdateMgr, once
+        for all the validation jobs that finished in the meantime). '''
+        wallet = getattr(self,'wallet', None)
+        if not wallet:
+            return
+        for tx_hash in tx_hashes:
+            if wallet.tx_tokinfo.get(tx_hash, {}).get('validity') in (2,3,4):
+                # If validator found 'invalid', then we need to update balances,
+                # which requires recalculating / refreshing the whole list.
+                self.update()
+                return
+        # Otherwise the balances are OK, so just update the relevant items
+        for tx_hash in tx_hashes:
+            self.update_item_netupdate(tx_hash, *wallet.get_tx_height(tx_hash))
+
     def create_menu(self, position):
         item = self.currentItem()
         if not item:
@@ -42,17 +42,15 @@ from .slp_create_token_mint_dialog import SlpCreateTokenMintDialog
 from .slp_burn_token_dialog import SlpBurnTokenDialog
 
 from electroncash.slp import SlpNoMintingBatonFound
+from electroncash.wallet import SlpTokenSummary
+
+from collections import defaultdict
 
 class SlpMgt(MyTreeWidget):
     filter_columns = [0, 1,2]  # Key, Value
 
-    def slp_validity_slot(self, txid, validity):
-        self.update()
-
     def __init__(self, parent):
         MyTreeWidget.__init__(self, parent, self.create_menu, [_('Token ID'), _('Token Name'), _('Dec.'),_('Balance'),_('Mint Baton'), _('Token Type')], 0, [0], deferred_updates=True)
-        self.slp_validity_signal = parent.gui_object.slp_validity_signal
-        self.slp_validity_signal.connect(self.slp_validity_slot, Qt.QueuedConnection)
         self.setSelectionMode(QAbstractItemView.ExtendedSelection)
         self.setSortingEnabled(True)
         self.editable_columns=[1]
@@ -129,10 +127,7 @@ class SlpMgt(MyTreeWidget):
             SlpBurnTokenDialog(self.parent, token_id_hex = current.data(0, Qt.UserRole), token_name=current.text(1))
 
     def get_balance_from_token_id(self,slpTokenId):
-        # implement by looking at UTXO for this token!
-        # for now return dummy value.
-        bal=self.parent.wallet.get_slp_token_balance(slpTokenId, self.parent.config)[0]
-        return bal
+        return self.parent.wallet.get_slp_token_balance(slpTokenId, self.parent.config)[0]
 
     @rate_limited(1.0, classlevel=True, ts_after=True) # We rate limit the slp mgt refresh no more than 3 times every second, app-wide
     def update(self):
@@ -145,12 +140,19 @@ class SlpMgt(MyTreeWidget):
         selected_item = self.currentItem()
         current_token_id = selected_item.data(0, Qt.UserRole) if selected_item else None
         self.clear()
+        # the sums of the coins of every token, rather than each token's coins
+        summaries = self.parent.wallet.get_slp_token_summaries(confirmed_only=self.parent.config.get('confirmed_only', False))
+        no_coins = SlpTokenSummary(0, 0, 0, 0, 0)
         tokens = self.parent.wallet.token_types.copy()
+        nft_children = defaultdict(list)  # group id -> [(token_id, entry)]
+        for _token_id, _i in tokens.items():
+            if _i["class"] == "SLP65" and _i.get("group_id", None) is not None:
+                nft_children[_i["group_id"]].append((_token_id, _i))
         for token_id, i in tokens.items():
             name     = i["name"]
             decimals = i["decimals"]
             if decimals != "?":
-                calculated_balance= self.get_balance_from_token_id(token_id)
+                calculated_balance= summaries.get(token_id, no_coins).valid
                 balancestr = format_satoshis_nofloat(calculated_balance, decimal_point=decimals, num_zeros=decimals)
                 balancestr += ' '*(9-decimals)
             else:
@@ -165,13 +167,9 @@ class SlpMgt(MyTreeWidget):
                 typestr = "NFT1 Group"
 
             baton_sym = ""
-            if decimals != "?":
-                try:
-                    self.parent.wallet.get_slp_token_baton(token_id)
-                    baton_sym = "★"
-                except SlpNoMintingBatonFound:
-                    pass
-            
+            if decimals != "?" and summaries.get(token_id, no_coins).batons:
+                baton_sym = "★"
+
             item = QTreeWidgetItem([str(token_id), str(name), str(decimals), balancestr, baton_sym, typestr])
 
             squishyfont = QFont(MONOSPACE_FONT)
@@ -189,31 +187,29 @@ class SlpMgt(MyTreeWidget):
                 item.setForeground(4, QBrush(QColor("#BC1E1E")))
                 item.setForeground(5, QBrush(QColor("#BC1E1E")))
             if i["class"] == "SLP129":
-                tokens = self.parent.wallet.token_types.copy()
-                for _token_id, _i in tokens.items():
-                    if _i["class"] == "SLP65" and _i.get("group_id", None) == token_id:
-                        name =     _i["name"]
-                        decimals = _i["decimals"]
-                        if decimals != "?":
-                            calculated_balance= self.get_balance_from_token_id(_token_id)
-                            balancestr = format_satoshis_nofloat(calculated_balance, decimal_point=decimals, num_zeros=decimals)
-                            balancestr += ' '*(9-decimals)
-                        else:
-                            balancestr = "double-click to add"
-                        _nft_item = QTreeWidgetItem([str(_token_id),str(name),str(decimals),balancestr,"", "NFT1 Child"])
-                        squishyfont = QFont(MONOSPACE_FONT)
-                        squishyfont.setStretch(85)
-                        _nft_item.setFont(0, squishyfont)
-                        #item.setTextAlignment(2, Qt.AlignRight)
-                        _nft_item.setTextAlignment(3, Qt.AlignRight)
-                        _nft_item.setFont(3, QFont(MONOSPACE_FONT))
-                        _nft_item.setData(0, Qt.UserRole, _token_id)
-                        if decimals == "?":
-                            _nft_item.setForeground(0, QBrush(QColor("#BC1E1E")))
-                            _nft_item.setForeground(1, QBrush(QColor("#BC1E1E")))
-                            _nft_item.setForeground(2, QBrush(QColor("#BC1E1E")))
-                            _nft_item.setForeground(3, QBrush(QColor("#BC1E1E")))
-                        item.addChild(_nft_item)
+                for _token_id, _i in nft_children[token_id]:
+                    name =     _i["name"]
+                    decimals = _i["decimals"]
+                    if decimals != "?":
+                        calculated_balance= summaries.get(_token_id, no_coins).valid
+                        balancestr = format_satoshis_nofloat(calculated_balance, decimal_point=decimals, num_zeros=decimals)
+                        balancestr += ' '*(9-decimals)
+                    else:
+                        balancestr = "double-click to add"
+                    _nft_item = QTreeWidgetItem([str(_token_id),str(name),str(decimals),balancestr,"", "NFT1 Child"])
+                    squishyfont = QFont(MONOSPACE_FONT)
+                    squishyfont.setStretch(85)
+                    _nft_item.setFont(0, squishyfont)
+                    #item.setTextAlignment(2, Qt.AlignRight)
+                    _nft_item.setTextAlignment(3, Qt.AlignRight)
+                    _nft_item.setFont(3, QFont(MONOSPACE_FONT))
+                    _nft_item.setData(0, Qt.UserRole, _token_id)
+                    if decimals == "?":
+                        _nft_item.setForeground(0, QBrush(QColor("#BC1E1E")))
+                        _nft_item.setForeground(1, QBrush(QColor("#BC1E1E")))
+                        _nft_item.setForeground(2, QBrush(QColor("#BC1E1E")))
+                        _nft_item.setForeground(3, QBrush(QColor("#BC1E1E")))
+                    item.addChild(_nft_item)
                 self.addTopLevelItem(item)
             elif i["class"] == "SLP65" and i.get("group_id", "?") == "?":
                 self.addTopLevelItem(item)
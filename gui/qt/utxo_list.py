@@ -25,93 +25,403 @@
 from .util import *
 from electroncash.i18n import _
 from electroncash.address import Address
+from electroncash.util import profiler
 
 
-class UTXOList(MyTreeWidget):
-    filter_columns = [0, 2]  # Address, Label
+class UTXOModel(QAbstractItemModel):
+    ''' The rows of a UTXOList: the (prevout_hash, n) outpoints of the
+    wallet's coins, filtered and sorted.
+
+    The coins of an address are only looked up again when the wallet says
+    the address changed, the rows of those coins come and go one by one, and
+    the cells of a row are only formatted when the view asks for them, that
+    is when the row is on screen. '''
+
+    LABEL_COLUMN = 1
+    # above this many coins coming or going, the rows are reset rather than
+    # inserted and removed one by one
+    max_row_changes = 1000
+
+    def __init__(self, utxo_list):
+        super().__init__(utxo_list)
+        self.ul = utxo_list
+        self.headers = []
+        self.coins = {}  # outpoint -> coin dict as returned by wallet.get_addr_utxo()
+        self.coins_of = {}  # address -> set of the outpoints of its coins
+        self.rows = []  # the displayed outpoints
+        self.row_of = {}  # outpoint -> index in self.rows
+        self.keys = []  # the sort key of each row
+        self.cells = {}  # outpoint -> cell texts, for the rows displayed since the last update
+        self.sort_column, self.sort_order = None, Qt.AscendingOrder
+        self.filter_text = ''
+
+    # QAbstractItemModel interface
+
+    def index(self, row, column, parent=QModelIndex()):
+        if parent.isValid() or not self.hasIndex(row, column, parent):
+            return QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index):
+        return QModelIndex()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(self.headers)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole and section < len(self.headers):
+            return self.headers[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        outpoint, column = self.rows[index.row()], index.column()
+        if role == Qt.DisplayRole:
+            return self.get_text(outpoint, column)
+        if role == Qt.UserRole:
+            return self.ul.get_name(self.coins[outpoint])
+        if role == Qt.UserRole + 1:
+            # the address-level-frozen and coin-level-frozen flags, for create_menu()
+            return self.frozen_flags(outpoint)
+        ul = self.ul
+        if role == Qt.FontRole:
+            if column in (0, 2, 4):
+                return ul.monospaceFont
+        elif role == Qt.ToolTipRole:
+            if column == 0:
+                flags = self.frozen_flags(outpoint)
+                if flags == 'a':
+                    return _("Address is frozen")
+                if flags == 'c':
+                    return _("Coin is frozen")
+                if flags:
+                    return _("Coin & Address are frozen")
+            elif column == self.LABEL_COLUMN:
+                # just in case it doesn't fit horizontally, we also provide it as a tool tip where hopefully it won't be elided
+                return self.get_text(outpoint, column) or None
+            elif column == 4:
+                return ul.get_name(self.coins[outpoint])  # just in case they like to see lots of hex digits :)
+        elif role == Qt.BackgroundRole:
+            if column == 0:
+                flags = self.frozen_flags(outpoint)
+                if 'a' in flags:
+                    # emulate the "Look" off the address_list .py's frozen entry
+                    return ul.lightBlue
+                if flags:
+                    return ul.blue
+        elif role == Qt.ForegroundRole:
+            if column == 0 and self.frozen_flags(outpoint) == 'ac':
+                # both coin and address are frozen so color-code it to indicate that.
+                return ul.cyanBlue
+        return None
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sort_column, self.sort_order = column, order
+        self.layoutAboutToBeChanged.emit()
+        old_rows = self.rows
+        self.set_rows(self.rows)
+        # keep the selection and current index on the same coins
+        old_indexes = self.persistentIndexList()
+        new_indexes = [self.index(self.row_of[old_rows[ix.row()]], ix.column()) for ix in old_indexes]
+        self.changePersistentIndexList(old_indexes, new_indexes)
+        self.layoutChanged.emit()
+
+    # cells
+
+    def frozen_flags(self, outpoint):
+        wallet = self.ul.wallet
+        return "{}{}".format("a" if wallet.is_frozen(self.coins[outpoint]['address']) else "",
+                             "c" if outpoint in wallet.frozen_coins else "")
+
+    def get_text(self, outpoint, column):
+        if column == self.LABEL_COLUMN:
+            return self.ul.wallet.get_label(outpoint[0])
+        ret = self.cells.get(outpoint)
+        if ret is None:
+            coin = self.coins[outpoint]
+            ret = self.cells[outpoint] = [
+                coin['address'].to_ui_string(), None,
+                self.ul.parent.format_amount(coin['value'], is_diff=False, whitespaces=True),
+                str(coin['height']), self.ul.get_name_short(coin)
+            ]
+        return ret[column]
+
+    def sort_key(self, column):
+        ''' Returns a function of outpoints to sort them by column, ordering
+        them as the SortableTreeWidgetItems of a MyTreeWidget did. '''
+        if column == 2:
+            return lambda outpoint: self.coins[outpoint]['value']
+        if column == 3:
+            return lambda outpoint: self.coins[outpoint]['height']
+        if column == 4:
+            return lambda outpoint: self.ul.get_name(self.coins[outpoint])
+        def text_key(outpoint):
+            text = self.get_text(outpoint, column)
+            try:
+                return (0, float(text.replace(',', '')), '')
+            except ValueError:
+                return (1, 0, text)
+        return text_key
+
+    def matches_filter(self, outpoint):
+        p = self.filter_text
+        return not p or any(self.get_text(outpoint, column).lower().find(p) != -1 for column in self.ul.filter_columns)
+
+    # rows
+
+    def set_rows(self, outpoints):
+        ''' Sets self.rows to outpoints, sorted, and what goes with it. '''
+        if self.sort_column is None or self.sort_column >= len(self.headers):
+            self.rows = list(outpoints)
+            self.keys = [None] * len(self.rows)
+        else:
+            key = self.sort_key(self.sort_column)
+            rows = sorted(((key(outpoint), outpoint) for outpoint in outpoints), key=lambda x: x[0],
+                          reverse=self.sort_order == Qt.DescendingOrder)
+            self.rows = [outpoint for _k, outpoint in rows]
+            self.keys = [k for k, _o in rows]
+        self.row_of = {outpoint: i for i, outpoint in enumerate(self.rows)}
+
+    def insert_row(self, outpoint):
+        ''' Inserts the row of outpoint where it sorts, after the rows with
+        the same key. self.row_of must be brought up to date after. '''
+        lo, hi = 0, len(self.rows)
+        if self.sort_column is None or self.sort_column >= len(self.headers):
+            key = None
+            lo = hi
+        else:
+            key = self.sort_key(self.sort_column)(outpoint)
+            descending = self.sort_order == Qt.DescendingOrder
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if (self.keys[mid] < key) if descending else (key < self.keys[mid]):
+                    hi = mid
+                else:
+                    lo = mid + 1
+        self.beginInsertRows(QModelIndex(), lo, lo)
+        self.rows.insert(lo, outpoint)
+        self.keys.insert(lo, key)
+        self.endInsertRows()
+
+    def remove_rows(self, outpoints):
+        ''' Removes the rows of outpoints, from the bottom up so that
+        self.row_of stays right for the rest. '''
+        for row in sorted((self.row_of[outpoint] for outpoint in outpoints), reverse=True):
+            self.beginRemoveRows(QModelIndex(), row, row)
+            del self.rows[row]
+            del self.keys[row]
+            self.endRemoveRows()
+
+    # updates
+
+    def set_headers(self, headers):
+        self.beginResetModel()
+        self.headers = headers
+        self.endResetModel()
+
+    def reset(self):
+        self.beginResetModel()
+        self.set_rows(outpoint for outpoint in self.coins if self.matches_filter(outpoint))
+        self.endResetModel()
+
+    def update(self, addresses, coins):
+        ''' Updates the rows after the coins of the wallet's addresses, or all
+        of them if None, and the frozen state of some coins may have changed.
+        Returns whether rows were moved, which loses their selection. '''
+        wallet = self.ul.wallet
+        self.cells.clear()
+        if addresses is None:
+            self.coins, self.coins_of = {}, {}
+            for address in wallet.get_addresses():
+                self.add_coins(address, wallet.get_addr_utxo(address, exclude_slp=False))
+            self.reset()
+            return False
+        gone, new = set(), set()
+        key = self.sort_key(self.sort_column) if self.sort_column is not None and self.sort_column < len(self.headers) else None
+        for address in addresses:
+            old_coins = {outpoint: self.coins.pop(outpoint) for outpoint in self.coins_of.pop(address, ())}
+            new_coins = wallet.get_addr_utxo(address, exclude_slp=False) if wallet.is_mine(address) else {}
+            self.add_coins(address, new_coins)
+            gone.update(outpoint for outpoint in old_coins if outpoint not in new_coins)
+            for outpoint in new_coins:
+                if outpoint not in old_coins:
+                    new.add(outpoint)
+                elif key and outpoint in self.row_of and key(outpoint) != self.keys[self.row_of[outpoint]]:
+                    # it has to move, say when the height of a coin changed
+                    gone.add(outpoint)
+                    new.add(outpoint)
+        for outpoint in coins:
+            coin = self.coins.get(outpoint)
+            if coin:
+                coin['is_frozen_coin'] = outpoint in wallet.frozen_coins
+        gone = [outpoint for outpoint in gone if outpoint in self.row_of]
+        new = [outpoint for outpoint in new if self.matches_filter(outpoint)]
+        if len(gone) + len(new) > self.max_row_changes:
+            self.reset()
+            return True
+        self.remove_rows(gone)
+        for outpoint in new:
+            self.insert_row(outpoint)
+        self.row_of = {outpoint: i for i, outpoint in enumerate(self.rows)}
+        if self.rows and self.headers:
+            self.dataChanged.emit(self.index(0, 0), self.index(len(self.rows) - 1, len(self.headers) - 1))
+        return bool(gone)
+
+    def add_coins(self, address, coins):
+        self.coins_of[address] = set(coins)
+        self.coins.update(coins)
+
+    def set_filter(self, p):
+        if p == self.filter_text:
+            return
+        self.filter_text = p
+        self.reset()
+
+    def labels_changed(self):
+        if self.rows:
+            self.dataChanged.emit(self.index(0, self.LABEL_COLUMN), self.index(len(self.rows) - 1, self.LABEL_COLUMN))
+        if self.sort_column == self.LABEL_COLUMN:
+            self.sort(self.sort_column, self.sort_order)
+
+
+class UTXOList(QTableView):
+    ''' The coins tab, as a view of a UTXOModel which only looks up the
+    coins of the addresses the wallet says changed since the last update,
+    and only formats the rows on screen. It otherwise works like the
+    MyTreeWidget it used to be. '''
+
+    filter_columns = [0, 2]  # Address, Amount
     col_output_point = 4  # <-- index of the 'Output point' column. make sure to update this if you modify the header below...
     col_address = 0
     default_sort = MyTreeWidget.SortSpec(2, Qt.DescendingOrder)  # sort by amount, descending
+    stretch_column = 1
 
     def __init__(self, parent=None):
-        MyTreeWidget.__init__(self, parent, self.create_menu, [ _('Address'), _('Label'), _('Amount'), _('Height'), _('Output point')], 1, deferred_updates=True, save_sort_settings=True)
-        self.setSelectionMode(QAbstractItemView.ExtendedSelection)
-        self.setSortingEnabled(True)
+        super().__init__(parent)
+        self.parent = parent
+        self.config = parent.config
         # force attributes to always be defined, even if None, at construction.
         self.wallet = self.parent.wallet
-        self.utxos = list()
-        # cache some values to avoid constructing Qt objects for every pass through self.on_update (this is important for large wallets)
+        self.wallet_changes = self.wallet.watch_changes()
         self.monospaceFont = QFont(MONOSPACE_FONT)
         self.lightBlue = QColor('lightblue') if not ColorScheme.dark_scheme else QColor('blue')
         self.blue = ColorScheme.BLUE.as_color(True)
         self.cyanBlue = QColor('#3399ff')
 
+        self.deferred_updates = True
+        self.deferred_update_ct, self._forced_update = 0, False
+
+        self.setShowGrid(False)
+        self.setWordWrap(False)
+        self.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.verticalHeader().hide()
+        # all rows have the same height, so nothing needs to look at all of them
+        self.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.verticalHeader().setDefaultSectionSize(QFontMetrics(self.monospaceFont).height() + 4)
+        self.horizontalHeader().setHighlightSections(False)
+        # size the columns from the rows on screen and at most 100 others (rather than 1000)
+        self.horizontalHeader().setResizeContentsPrecision(100)
+        self.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.customContextMenuRequested.connect(self.create_menu)
+
+        self.utxo_model = UTXOModel(self)
+        self.setModel(self.utxo_model)
+        headers = [ _('Address'), _('Label'), _('Amount'), _('Height'), _('Output point')]
+        self.utxo_model.set_headers(headers)
+        self.horizontalHeader().setStretchLastSection(False)
+        for col in range(len(headers)):
+            sm = QHeaderView.Stretch if col == self.stretch_column else QHeaderView.ResizeToContents
+            self.horizontalHeader().setSectionResizeMode(col, sm)
+        self._setup_save_sort_mechanism()
+
+    def _setup_save_sort_mechanism(self):
+        ''' Sorts as saved in the wallet, under the key it had when this was
+        a MyTreeWidget, and saves the sort order when it changes. '''
+        storage = self.wallet.storage
+        key = f'mytreewidget_default_sort_{type(self).__name__}'
+        default = (storage and storage.get(key, None)) or self.default_sort
+        if not (default and isinstance(default, (tuple, list)) and len(default) >= 2 and all(isinstance(i, int) for i in default)):
+            default = self.default_sort
+        self.setSortingEnabled(True)
+        self.sortByColumn(default[0], default[1])
+        if storage:
+            # Paranoia; hold a weak reference just in case subclass code
+            # does unusual things.
+            weakStorage = Weak.ref(storage)
+            def save_sort(column, qt_sort_order):
+                storage = weakStorage()
+                if storage:
+                    storage.put(key, [column, qt_sort_order])
+            self.horizontalHeader().sortIndicatorChanged.connect(save_sort)
+
     def get_name(self, x):
         return x.get('prevout_hash') + ":%d"%x.get('prevout_n')
 
     def get_name_short(self, x):
         return x.get('prevout_hash')[:10] + '...' + ":%d"%x.get('prevout_n')
 
+    def clean_up(self):
+        ''' Stops collecting the wallet's changes, called when the window
+        closes. '''
+        self.wallet.unwatch_changes(self.wallet_changes)
+
+    def should_defer_update_incr(self):
+        ret = (self.deferred_updates and not self.isVisible()
+               and not self._forced_update)
+        if ret:
+            self.deferred_update_ct += 1
+        return ret
+
     @rate_limited(1.0, ts_after=True) # performance tweak -- limit updates to no more than once per second
     def update(self):
         if self.wallet and (not self.wallet.thread or not self.wallet.thread.isRunning()):
             # short-cut return if window was closed and wallet is stopped
             return
-        super().update()
+        if not self.should_defer_update_incr():
+            self.on_update()
+            self.deferred_update_ct = 0
 
+    def showEvent(self, e):
+        super().showEvent(e)
+        if e.isAccepted() and self.deferred_update_ct:
+            self._forced_update = True
+            self.update()
+            self._forced_update = False
+
+    @profiler
     def on_update(self):
-        prev_selection = self.get_selected() # cache previous selection, if any
-        self.clear()
         self.wallet = self.parent.wallet
         if not self.wallet: return
-        self.utxos = self.wallet.get_utxos(exclude_slp=False)
-        for x in self.utxos:
-            address = x['address']
-            address_text = address.to_ui_string()
-            height = x['height']
-            name = self.get_name(x)
-            name_short = self.get_name_short(x)
-            label = self.wallet.get_label(x['prevout_hash'])
-            amount = self.parent.format_amount(x['value'], is_diff=False, whitespaces=True)
-            utxo_item = SortableTreeWidgetItem([address_text, label, amount,
-                                                str(height), name_short])
-            if label:
-                utxo_item.setToolTip(1, label)  # just in case it doesn't fit horizontally, we also provide it as a tool tip where hopefully it won't be elided
-            utxo_item.setToolTip(4, name)  # just in case they like to see lots of hex digits :)
-            utxo_item.DataRole = Qt.UserRole+100 # set this here to avoid sorting based on Qt.UserRole+1
-            utxo_item.setFont(0, self.monospaceFont)
-            utxo_item.setFont(2, self.monospaceFont)
-            utxo_item.setFont(4, self.monospaceFont)
-            utxo_item.setData(0, Qt.UserRole, name)
-            a_frozen = self.wallet.is_frozen(address)
-            c_frozen = x['is_frozen_coin']
-            toolTipFrozen = ''
-            if a_frozen and not c_frozen:
-                # address is frozen, coin is not frozen
-                # emulate the "Look" off the address_list .py's frozen entry
-                utxo_item.setBackground(0, self.lightBlue)
-                toolTipFrozen = _("Address is frozen")
-            elif c_frozen and not a_frozen:
-                # coin is frozen, address is not frozen
-                utxo_item.setBackground(0, self.blue)
-                toolTipFrozen = _("Coin is frozen")
-            elif c_frozen and a_frozen:
-                # both coin and address are frozen so color-code it to indicate that.
-                utxo_item.setBackground(0, self.lightBlue)
-                utxo_item.setForeground(0, self.cyanBlue)
-                toolTipFrozen = _("Coin & Address are frozen")
-            # save the address-level-frozen and coin-level-frozen flags to the data item for retrieval later in create_menu() below.
-            utxo_item.setData(0, Qt.UserRole+1, "{}{}".format(("a" if a_frozen else ""), ("c" if c_frozen else "")))
-            if toolTipFrozen:
-                utxo_item.setToolTip(0, toolTipFrozen)
-            self.addChild(utxo_item)
-            if name in prev_selection:
-                # NB: This needs to be here after the item is added to the widget. See #979.
-                utxo_item.setSelected(True) # restore previous selection
+        prev_selection = self.get_selected() # cache previous selection, if any
+        # the addresses and coins which changed since the last update, or None for all of them
+        delta = self.wallet_changes.take()
+        if self.utxo_model.update(delta and delta.addresses, delta and delta.coins) and prev_selection:
+            # restore the selection of the coins which moved
+            selection = QItemSelection()
+            for name in prev_selection:
+                prevout_hash, n = name.split(':')
+                row = self.utxo_model.row_of.get((prevout_hash, int(n)))
+                if row is not None:
+                    selection.select(self.utxo_model.index(row, 0), self.utxo_model.index(row, 0))
+            self.selectionModel().select(selection, QItemSelectionModel.Select | QItemSelectionModel.Rows)
+
+    def filter(self, p):
+        self.utxo_model.set_filter(p.lower())
 
     def get_selected(self):
-        return { x.data(0, Qt.UserRole) : x.data(0, Qt.UserRole+1) # dict of "name" -> frozen flags string (eg: "ac")
-                for x in self.selectedItems() }
+        return { index.data(Qt.UserRole) : index.data(Qt.UserRole+1) # dict of "name" -> frozen flags string (eg: "ac")
+                for index in self.selectionModel().selectedRows() }
+
+    def get_coins(self, names):
+        ''' Returns the coin dicts of the displayed coins named in names. '''
+        return [coin for coin in (self.utxo_model.coins[outpoint] for outpoint in self.utxo_model.rows)
+                if self.get_name(coin) in names]
 
     def are_any_slp_coins(self, coins):
         for coin in coins:
@@ -129,7 +439,7 @@ class UTXOList(MyTreeWidget):
         if not selected:
             return
         menu = QMenu()
-        coins = filter(lambda x: self.get_name(x) in selected, self.utxos)
+        coins = self.get_coins(selected)
         if not coins:
             return
         spendable_coins = list(filter(lambda x: not selected.get(self.get_name(x), ''), coins))
@@ -137,18 +447,18 @@ class UTXOList(MyTreeWidget):
         menu.addAction(_("Spend"), lambda: self.parent.spend_coins(spendable_coins)).setEnabled(bool(spendable_coins) and not self.are_any_slp_coins(spendable_coins))
         if len(selected) == 1:
             # "Copy ..."
-            item = self.itemAt(position)
-            if not item:
+            index = self.indexAt(position)
+            if not index.isValid():
                 return
 
-            col = self.currentColumn()
-            column_title = self.headerItem().text(col)
+            col = self.currentIndex().column()
+            column_title = self.utxo_model.headerData(col, Qt.Horizontal)
             alt_column_title, alt_copy_text = None, None
             if col == self.col_output_point:
-                copy_text = item.data(0, Qt.UserRole)
+                copy_text = index.data(Qt.UserRole)
             elif col == self.col_address:
                 # Determine the "alt copy text" "Legacy Address" or "Cash Address"
-                copy_text = item.text(col).strip()
+                copy_text = index.sibling(index.row(), col).data().strip()
                 try:
                     addr = Address.from_string(copy_text)
                 except:
@@ -161,7 +471,7 @@ class UTXOList(MyTreeWidget):
                         alt_copy_text, alt_column_title = addr.to_full_string(Address.FMT_LEGACY), _('Legacy Address')
                 del addr
             else:
-                copy_text = item.text(col)
+                copy_text = index.sibling(index.row(), col).data()
             if copy_text:
                 copy_text = copy_text.strip()  # make sure formatted amount is not whitespaced
             menu.addAction(_("Copy {}").format(column_title), lambda: QApplication.instance().clipboard().setText(copy_text))
@@ -209,9 +519,16 @@ class UTXOList(MyTreeWidget):
 
         menu.exec_(self.viewport().mapToGlobal(position))
 
-    def on_permit_edit(self, item, column):
-        # disable editing fields in this tab (labels)
-        return False
+    def keyPressEvent(self, event):
+        if event.key() in [ Qt.Key_F2, Qt.Key_Return ]:
+            index = self.currentIndex()
+            if index.isValid():
+                # on 'enter' we show the menu
+                pt = self.visualRect(index).bottomLeft()
+                pt.setX(50)
+                self.customContextMenuRequested.emit(pt)
+        else:
+            super().keyPressEvent(event)
 
     def set_frozen_coins(self, coins, b):
         if self.parent:
@@ -219,24 +536,11 @@ class UTXOList(MyTreeWidget):
 
     def set_frozen_addresses_for_coins(self, coins, b):
         if not self.parent: return
-        addrs = set()
-        for utxo in self.utxos:
-            name = self.get_name(utxo)
-            if name in coins:
-                addrs.add(utxo['address'])
+        addrs = {coin['address'] for coin in self.get_coins(coins)}
         if addrs:
             self.parent.set_frozen_state(list(addrs), b)
 
     def update_labels(self):
         if self.should_defer_update_incr():
             return
-        root = self.invisibleRootItem()
-        child_count = root.childCount()
-        for i in range(child_count):
-            item = root.child(i)
-            try:
-                txid = item.data(0, Qt.UserRole).split(':', 1)[0]
-            except IndexError:
-                continue # name is iinvalid. should be txid:prevout_n
-            label = self.wallet.get_label(txid)
-            item.setText(1, label)
+        self.utxo_model.labels_changed()
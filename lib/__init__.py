@@ -1,13 +1,46 @@
+''' The names exported below are imported from their submodules on first
+access rather than here, so that importing any electroncash submodule (or
+running a one-shot command line call) doesn't import the whole library.
+Python 3.6 lacks module level __getattr__ (PEP 562), hence the module class
+swap at the bottom. '''
+
+import importlib
+import sys
+import types
+
 from .version import PACKAGE_VERSION
-from .util import format_satoshis, print_msg, print_error, set_verbosity
-from .wallet import Synchronizer, Wallet
-from .storage import WalletStorage
-from .network import Network, pick_random_server
-from .interface import Connection, Interface
-from .simple_config import SimpleConfig, get_config, set_config
-from . import bitcoin
-from . import transaction
-from . import daemon
-from .transaction import Transaction
-from .plugins import BasePlugin
-from .commands import Commands, known_commands
+
+# name -> submodule it is imported from (for submodules, the name itself)
+_lazy_attrs = {
+    'format_satoshis': 'util', 'print_msg': 'util', 'print_error': 'util', 'set_verbosity': 'util',
+    'Synchronizer': 'wallet', 'Wallet': 'wallet',
+    'WalletStorage': 'storage',
+    'Network': 'network', 'pick_random_server': 'network',
+    'Connection': 'interface', 'Interface': 'interface',
+    'SimpleConfig': 'simple_config', 'get_config': 'simple_config', 'set_config': 'simple_config',
+    'bitcoin': 'bitcoin',
+    'transaction': 'transaction',
+    'daemon': 'daemon',
+    'Transaction': 'transaction',
+    'BasePlugin': 'plugins',
+    'Commands': 'commands', 'known_commands': 'commands',
+}
+
+
+class _LazyModule(types.ModuleType):
+
+    def __getattr__(self, name):
+        try:
+            modname = _lazy_attrs[name]
+        except KeyError:
+            raise AttributeError("module '{}' has no attribute '{}'".format(self.__name__, name)) from None
+        module = importlib.import_module('.' + modname, self.__name__)
+        value = module if name == modname else getattr(module, name)
+        setattr(self, name, value)
+        return value
+
+    def __dir__(self):
+        return sorted(set(super().__dir__()) | set(_lazy_attrs))
+
+
+sys.modules[__name__].__class__ = _LazyModule
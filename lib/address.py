@@ -31,6 +31,7 @@ from . import cashaddr, networks
 from enum import IntEnum
 from .bitcoin import EC_KEY, is_minikey, minikey_to_private_key, SCRIPT_TYPES
 from .util import cachedproperty, inv_dict
+from .caches import ExpiringCache
 
 _sha256 = hashlib.sha256
 _new_hash = hashlib.new
@@ -445,6 +446,13 @@ class ScriptOutput(namedtuple("ScriptAddressTuple", "script")):
 
 
 # A namedtuple for easy comparison and unique hashing
+# (string, net, parser) -> Address, of the strings parsed so far. Wallets
+# parse the same addresses over and over (eg on each load of the storage), so
+# they are decoded once, and the same Address instance is handed out each time,
+# along with its cached to_string() results.
+_addr_registry = ExpiringCache(maxlen=250000, name='Address registry')
+
+
 class Address(namedtuple("AddressTuple", "hash160 kind")):
 
     # Address kinds
@@ -481,10 +489,19 @@ class Address(namedtuple("AddressTuple", "hash160 kind")):
 
 
     @classmethod
-    def from_cashaddr_string(cls, string, *, net=None):
-        '''Construct from a cashaddress string.'''
-        if net is None: net = networks.net
-        prefix = net.CASHADDR_PREFIX
+    def _registered(cls, parser, string, net):
+        '''Returns the Address for string from the registry, parsing it with
+        parser(string, net) and registering the result on a miss.'''
+        key = (string, net, parser)
+        addr = _addr_registry.get(key)
+        if addr is None:
+            addr = parser(string, net)
+            _addr_registry.put(key, addr)
+        return addr
+
+    @classmethod
+    def _from_cashaddr_prefix(cls, string, net, prefix, fmt):
+        orig = string
         if string.upper() == string:
             prefix = prefix.upper()
         if ':' not in string:
@@ -494,42 +511,50 @@ class Address(namedtuple("AddressTuple", "hash160 kind")):
             raise AddressError('address has unexpected prefix {}'
                                .format(addr_prefix))
         if kind == cashaddr.PUBKEY_TYPE:
-            return cls(addr_hash, cls.ADDR_P2PKH)
+            addr = cls(addr_hash, cls.ADDR_P2PKH)
         elif kind == cashaddr.SCRIPT_TYPE:
-            return cls(addr_hash, cls.ADDR_P2SH)
+            addr = cls(addr_hash, cls.ADDR_P2SH)
         else:
             raise AddressError('address has unexpected kind {}'.format(kind))
+        if orig.islower() and net is networks.net:
+            # lowercase is the canonical encoding, no need to encode it again
+            addr._addr2str_cache[fmt] = orig.rpartition(':')[2]
+        return addr
+
+    @classmethod
+    def _parse_cashaddr(cls, string, net):
+        return cls._from_cashaddr_prefix(string, net, net.CASHADDR_PREFIX, cls.FMT_CASHADDR)
+
+    @classmethod
+    def _parse_slpaddr(cls, string, net):
+        return cls._from_cashaddr_prefix(string, net, net.SLPADDR_PREFIX, cls.FMT_SLPADDR)
+
+    @classmethod
+    def from_cashaddr_string(cls, string, *, net=None):
+        '''Construct from a cashaddress string.'''
+        if net is None: net = networks.net
+        return cls._registered(cls._parse_cashaddr, string, net)
 
     @classmethod
     def from_slpaddr_string(cls, string, *, net=None):
         '''Construct from a slpaddress string.'''
         if net is None: net = networks.net
-        prefix = net.SLPADDR_PREFIX
-        if string.upper() == string:
-            prefix = prefix.upper()
-        if ':' not in string:
-            string = ':'.join([prefix, string])
-        addr_prefix, kind, addr_hash = cashaddr.decode(string)
-        if addr_prefix != prefix:
-            raise AddressError('address has unexpected prefix {}'
-                               .format(addr_prefix))
-        if kind == cashaddr.PUBKEY_TYPE:
-            return cls(addr_hash, cls.ADDR_P2PKH)
-        elif kind == cashaddr.SCRIPT_TYPE:
-            return cls(addr_hash, cls.ADDR_P2SH)
-        else:
-            raise AddressError('address has unexpected kind {}'.format(kind))
+        return cls._registered(cls._parse_slpaddr, string, net)
 
     @classmethod
     def from_string(cls, string, *, net=None):
         '''Construct from an address string.'''
         if net is None: net = networks.net
+        return cls._registered(cls._parse_string, string, net)
+
+    @classmethod
+    def _parse_string(cls, string, net):
         if len(string) > 35:
             try:
                 try:
-                    return cls.from_slpaddr_string(string, net=net)
+                    return cls._parse_slpaddr(string, net)
                 except:
-                    return cls.from_cashaddr_string(string, net=net)
+                    return cls._parse_cashaddr(string, net)
             except ValueError as e:
                 raise AddressError(str(e))
 
@@ -552,7 +577,12 @@ class Address(namedtuple("AddressTuple", "hash160 kind")):
         else:
             raise AddressError('unknown version byte: {}'.format(verbyte))
 
-        return cls(hash160, kind)
+        addr = cls(hash160, kind)
+        if verbyte in (net.ADDRTYPE_P2PKH, net.ADDRTYPE_P2SH) and net is networks.net:
+            # the storage format, which is what this usually gets called
+            # with: no need to encode it again on save
+            addr._addr2str_cache[cls.FMT_LEGACY] = string
+        return addr
 
     @classmethod
     def prefix_from_address_string(cls, string, *, net=None):
@@ -582,9 +612,17 @@ class Address(namedtuple("AddressTuple", "hash160 kind")):
 
     @classmethod
     def from_strings(cls, strings, *, net=None):
-        '''Construct a list from an iterable of strings.'''
+        '''Construct a list from an iterable of strings. Strings that were
+        parsed before are looked up in the registry without further ado.'''
         if net is None: net = networks.net
-        return [cls.from_string(string, net=net) for string in strings]
+        get, parse = _addr_registry.get, cls._parse_string
+        ret = []
+        for string in strings:
+            addr = get((string, net, parse))
+            if addr is None:
+                addr = cls._registered(parse, string, net)
+            ret.append(addr)
+        return ret
 
     @classmethod
     def from_pubkey(cls, pubkey):
@@ -613,7 +651,10 @@ class Address(namedtuple("AddressTuple", "hash160 kind")):
     def to_strings(cls, fmt, addrs, *, net=None):
         '''Construct a list of strings from an iterable of Address objects.'''
         if net is None: net = networks.net
-        return [addr.to_string(fmt, net=net) for addr in addrs]
+        if net is not networks.net:
+            return [addr.to_string(fmt, net=net) for addr in addrs]
+        # the string is usually in the instance's cache
+        return [addr._addr2str_cache[fmt] or addr.to_string(fmt) for addr in addrs]
 
     def to_cashaddr(self, *, net=None):
         if net is None: net = networks.net
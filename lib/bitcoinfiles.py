@@ -10,6 +10,12 @@ Multi-part file chunks are committed to the blockchain as transactions using the
 
 Max message length to fit in 223 byte op_return relay limit: 204 bytes
 """
+import hashlib
+import json
+import os
+import queue
+import time
+
 from .address import Address, ScriptOutput
 from . import util
 from . import bitcoin
@@ -43,6 +49,21 @@ class BfpInvalidOutputMessage(BfpParsingError):
     # under SLP consensus rules. (either malformed SLP or just not SLP)
     pass
 
+# Exceptions during download of a file.
+class BfpDownloadError(Exception):
+    pass
+
+class BfpDownloadStopped(BfpDownloadError):
+    pass
+
+class BfpHashMismatch(BfpDownloadError):
+    # The downloaded file doesn't match the hash in its metadata
+    pass
+
+# Exceptions during upload of a file.
+class BfpUploadError(Exception):
+    pass
+
 def make_bitcoinfile_chunk_opreturn(data: bytes):
     pushes = []
 
@@ -407,3 +428,391 @@ class BfpMessage:
         else:
             raise BfpInvalidOutputMessage('Not a BFP metadata message')
         return bfpMsg
+
+
+class BfpDownloader(util.PrintError):
+    ''' Downloads the file whose metadata is in tx `file_txid` to `path`.
+
+    The chunk txs are taken from the wallet or the Transaction class cache
+    when there, and are otherwise fetched from the network. Since each
+    chunk's txid is only known from the input of the chunk after it, the
+    chain is walked one tx at a time. However, the chunk txs all pay to the
+    uploader's address, so the first time a chunk has to be fetched, the
+    txs in that address' history are fetched in parallel, which usually
+    leaves nothing to fetch one at a time.
+
+    The chunks come in last to first. They are appended to `path`.part as
+    they come, and the progress is kept in `path`.part.json, so that an
+    interrupted download resumes where it left off. Once all chunks are in,
+    they are copied to `path` in order, hashing them on the way.
+
+    run() blocks until done, call it from a thread other than the network's
+    or the GUI's. It may be stopped from another thread with stop(). '''
+
+    prefetch_limit = 600  # don't prefetch the history of addresses with more txs than this
+
+    def __init__(self, network, file_txid, path, *, wallet=None, progress_callback=None, timeout=30.0):
+        self.network = network
+        self.file_txid = file_txid
+        self.path = path
+        self.wallet = wallet
+        self.progress_callback = progress_callback  # called as progress_callback(chunks_done, chunk_count)
+        self.timeout = timeout  # for each network request
+        self.part_path = path + '.part'
+        self.state_path = path + '.part.json'
+        self.prefetched = {}  # txid -> Transaction
+        self.prefetch_done = False
+        self.stopped = False
+        self.metadata = None  # the BfpMessage, once known
+
+    def diagnostic_name(self):
+        return 'BfpDownloader/' + self.file_txid[:8]
+
+    def stop(self):
+        self.stopped = True
+
+    def get_tx(self, txid):
+        tx = ((self.wallet and self.wallet.transactions.get(txid))
+              or Transaction.tx_cache_get(txid)
+              or self.prefetched.pop(txid, None))
+        if tx:
+            return tx
+        if not self.network:
+            raise BfpDownloadError('transaction {} not found, and not connected to the network'.format(txid))
+        try:
+            raw = self.network.synchronous_get(('blockchain.transaction.get', [txid]), timeout=self.timeout)
+        except (util.TimeoutException, util.ServerError) as e:
+            raise BfpDownloadError('could not fetch transaction {}: {}'.format(txid, e)) from e
+        tx = Transaction(raw)
+        if Transaction._txid(tx.raw) != txid:
+            raise BfpDownloadError('server sent the wrong transaction for {}'.format(txid))
+        Transaction.tx_cache_put(tx=tx, txid=txid)
+        return tx
+
+    def prefetch(self, address):
+        ''' Fetches the txs of address' history in parallel, waiting at most
+        self.timeout seconds, into self.prefetched. '''
+        self.prefetch_done = True
+        try:
+            hist = self.network.synchronous_get(('blockchain.scripthash.get_history', [address.to_scripthash_hex()]),
+                                                timeout=self.timeout)
+        except (util.TimeoutException, util.ServerError) as e:
+            self.print_error('could not get history for prefetching:', e)
+            return
+        txids = {h['tx_hash'] for h in hist} - set(self.prefetched)
+        if not txids or len(txids) > self.prefetch_limit:
+            return
+        q = queue.Queue()
+        for txid in txids:
+            self.network.queue_request('blockchain.transaction.get', [txid],
+                                       interface='random', callback=q.put)
+        deadline = time.time() + self.timeout
+        try:
+            for i in range(len(txids)):
+                try:
+                    r = q.get(timeout=max(deadline - time.time(), 0.001))
+                except queue.Empty:
+                    break
+                try:
+                    txid = r['params'][0]
+                    tx = Transaction(r['result'])
+                    assert txid == Transaction._txid(tx.raw), "txid-is-sane-check"
+                    self.prefetched[txid] = tx
+                except Exception as e:
+                    self.print_error('bad prefetch response:', repr(e))
+        finally:
+            self.network.cancel_requests(q.put)
+        self.print_error('prefetched {} of {} txs'.format(len(self.prefetched), len(txids)))
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, 'r') as f:
+                state = json.load(f)
+            if state['file_txid'] != self.file_txid:
+                return None
+            size = sum(state['lengths'])
+            if os.path.getsize(self.part_path) < size:
+                return None
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        return state
+
+    def _save_state(self, state):
+        tmp = self.state_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, self.state_path)
+
+    def _remove_part(self):
+        for p in (self.part_path, self.state_path):
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+
+    def run(self):
+        ''' Downloads the file. Returns a dict with the path, size and sha256
+        of the file, and whether the hash matched the one in the metadata
+        (None if the metadata has no hash). Raises BfpDownloadError (or
+        BfpParsingError for a bad metadata tx) on failure. '''
+        meta_tx = self.get_tx(self.file_txid)
+        self.metadata = msg = BfpMessage.parseBfpScriptOutput(meta_tx.outputs()[0][1])
+        chunk_count = msg.op_return_fields['chunk_count']
+        if chunk_count < 1:
+            raise BfpDownloadError('this file does not contain any data')
+
+        state = self._load_state()
+        if state:
+            self.print_error('resuming after {} of {} chunks'.format(len(state['lengths']), chunk_count))
+        else:
+            state = {'file_txid': self.file_txid, 'lengths': [], 'next_txid': None}
+            meta_data = msg.op_return_fields['chunk_data']
+            with open(self.part_path, 'wb') as f:
+                f.write(meta_data)
+            if meta_data:
+                state['lengths'].append(len(meta_data))
+            state['next_txid'] = self._prev_chunk_txid(meta_tx, len(state['lengths']), chunk_count)
+            self._save_state(state)
+
+        with open(self.part_path, 'r+b') as f:
+            # drop anything written after the state was last saved
+            f.truncate(sum(state['lengths']))
+            f.seek(0, os.SEEK_END)
+            while len(state['lengths']) < chunk_count:
+                if self.progress_callback:
+                    self.progress_callback(len(state['lengths']), chunk_count)
+                if self.stopped:
+                    raise BfpDownloadStopped('download stopped')
+                txid = state['next_txid']
+                if (not self.prefetch_done and self.network and not self.prefetched
+                        and not (self.wallet and txid in self.wallet.transactions)
+                        and not Transaction.tx_cache_get(txid)):
+                    tx = self.get_tx(txid)
+                    outputs = tx.outputs()
+                    if len(outputs) > 1 and isinstance(outputs[1][1], Address):
+                        self.prefetch(outputs[1][1])
+                else:
+                    tx = self.get_tx(txid)
+                data = parseOpreturnToChunks(tx.outputs()[0][1].to_script(), allow_op_0=False, allow_op_number=False)
+                if len(data) != 1:
+                    raise BfpDownloadError('chunk transaction {} does not contain any data'.format(txid))
+                f.write(data[0])
+                f.flush()
+                state['lengths'].append(len(data[0]))
+                state['next_txid'] = self._prev_chunk_txid(tx, len(state['lengths']), chunk_count)
+                self._save_state(state)
+        if self.progress_callback:
+            self.progress_callback(chunk_count, chunk_count)
+        return self._assemble(state['lengths'])
+
+    @staticmethod
+    def _prev_chunk_txid(tx, chunks_done, chunk_count):
+        if chunks_done >= chunk_count:
+            return None
+        txin = tx.inputs()[0]
+        if txin['prevout_n'] != 1:
+            raise BfpDownloadError('transaction {} does not continue a file'.format(tx.txid()))
+        return txin['prevout_hash']
+
+    def _assemble(self, lengths):
+        ''' Writes the chunks from the part file to self.path in file order
+        (they were written last to first), hashing them on the way. '''
+        h = hashlib.sha256()
+        tmp = self.path + '.tmp'
+        with open(self.part_path, 'rb') as src, open(tmp, 'wb') as dst:
+            offset = sum(lengths)
+            for length in reversed(lengths):
+                offset -= length
+                src.seek(offset)
+                data = src.read(length)
+                h.update(data)
+                dst.write(data)
+        sha256 = h.hexdigest()
+        expected = self.metadata.op_return_fields['file_sha256'].hex()
+        if expected and expected != sha256:
+            os.remove(tmp)
+            self._remove_part()
+            raise BfpHashMismatch('the hash of the file does not match its metadata')
+        os.replace(tmp, self.path)
+        self._remove_part()
+        return {
+            'path': self.path,
+            'size': sum(lengths),
+            'sha256': sha256,
+            'hash_verified': (expected == sha256) if expected else None,
+        }
+
+
+class BfpUploader(util.PrintError):
+    ''' Uploads a file, given the (signed) funding tx made by getFundingTxn()
+    whose output 0 pays for the upload.
+
+    build() makes and signs the whole chain of chunk txs, ending with the
+    metadata tx, without going to the network. The chain is the same as the
+    one getUploadTxn() makes one tx at a time. Every chunk tx spends the
+    previous one's output 1 (the first spends the funding output 0), all from
+    the same address, so the private key is derived only once for the whole
+    chain.
+
+    broadcast() then sends the funding tx and the chain with up to
+    max_in_flight broadcasts outstanding at a time. The server may see them
+    out of order; a tx refused for its parent not being known yet is sent
+    again once its parent got accepted. Only refusals of a tx sent after its
+    parent got accepted count toward max_resends.
+    If broadcast() fails, calling it again resumes from the first tx not yet
+    accepted. '''
+
+    chunk_size = 220
+    max_chunks = 255  # the chunk count is a single byte in the metadata
+    max_in_flight = 10
+    max_resends = 3  # per tx, for 'missing inputs' errors
+
+    def __init__(self, wallet, funding_tx, data, metadata, *, file_receiver=None, progress_callback=None):
+        self.wallet = wallet
+        self.funding_tx = funding_tx
+        self.chunks = [data[i:i + self.chunk_size] for i in range(0, len(data), self.chunk_size)]
+        if len(self.chunks) > self.max_chunks:
+            raise BfpUploadError('file too big, at most {} bytes can be uploaded'.format(self.chunk_size * self.max_chunks))
+        self.metadata = metadata
+        self.file_receiver = file_receiver
+        self.progress_callback = progress_callback  # called as progress_callback(txs_done, tx_count) by build() and broadcast()
+        self.txs = [funding_tx]  # funding tx, then the chunk txs, then the metadata tx
+        self.broadcast_count = 0  # number of leading txs of self.txs the server accepted
+
+    @property
+    def file_txid(self):
+        return self.txs[-1].txid()
+
+    def _chain_tx(self, prev_tx, vout, op_return, address, locktime):
+        ''' The tx spending output vout of prev_tx to op_return and a single
+        output to address, with the fee estimate_miner_fee() gives, as per
+        getUploadTxn(). '''
+        out_type, prev_address, amount = prev_tx.outputs()[vout]
+        assert out_type == TYPE_ADDRESS
+        miner_fee = estimate_miner_fee(1, 1, len(op_return[1].to_script()))
+        dust_output = (amount - miner_fee) if (amount - miner_fee) >= 546 else 546
+        txin = {
+            'address': prev_address,
+            'value': amount,
+            'prevout_n': vout,
+            'prevout_hash': prev_tx.txid(),
+            'height': 0,
+            'coinbase': False,
+        }
+        self.wallet.add_input_info_for_bitcoinfiles(txin)
+        return Transaction.from_io([txin], [op_return, (TYPE_ADDRESS, address or prev_address, dust_output)],
+                                   locktime, sign_schnorr=self.wallet.is_schnorr_enabled())
+
+    def _get_keypairs(self, tx, password):
+        ''' Returns the keypairs to sign tx with, or None if a keystore can't
+        hand out private keys (hardware wallets). '''
+        from .keystore import Software_KeyStore
+        keypairs = {}
+        for k in self.wallet.get_keystores():
+            if not k.can_sign(tx):
+                continue
+            if not isinstance(k, Software_KeyStore):
+                return None
+            k.check_password(password)
+            for x_pubkey, derivation in k.get_tx_derivations(tx).items():
+                keypairs[x_pubkey] = k.get_private_key(derivation, password)
+        return keypairs
+
+    def build(self, password):
+        ''' Makes and signs the chain of txs into self.txs. '''
+        locktime = max(self.wallet.get_local_height(), 0)
+        m = self.metadata
+        metadata_no_chunk = make_bitcoinfile_metadata_opreturn(1, len(self.chunks), None, m['filename'], m['fileext'], m['filesize'],
+                                                               m['file_sha256'], m['prev_file_sha256'], m['uri'])
+        self.txs = [self.funding_tx]
+        self.broadcast_count = 0
+        keypairs = None
+        prev, vout = self.funding_tx, 0
+        for i in range(len(self.chunks) + 1):
+            chunk = self.chunks[i] if i < len(self.chunks) else None
+            is_metadata_txn = i >= len(self.chunks) - 1 and chunk_can_fit_in_final_opreturn(metadata_no_chunk, len(chunk or b''))
+            if is_metadata_txn:
+                op_return = make_bitcoinfile_metadata_opreturn(1, len(self.chunks), chunk, m['filename'], m['fileext'], m['filesize'],
+                                                               m['file_sha256'], m['prev_file_sha256'], m['uri'])
+                address = self.file_receiver
+            else:
+                op_return = make_bitcoinfile_chunk_opreturn(chunk)
+                address = None
+            tx = self._chain_tx(prev, vout, op_return, address, locktime)
+            if keypairs is None:
+                keypairs = self._get_keypairs(tx, password)
+            if keypairs:
+                tx.sign(keypairs, use_cache=True)
+            else:
+                self.wallet.sign_transaction(tx, password, use_cache=True)
+            if not tx.is_complete():
+                raise BfpUploadError('could not sign the upload transactions')
+            self.txs.append(tx)
+            if self.progress_callback:
+                self.progress_callback(len(self.txs), len(self.chunks) + 2)
+            if is_metadata_txn:
+                break
+            prev, vout = tx, 1
+        return self.txs
+
+    @staticmethod
+    def _is_missing_inputs(msg):
+        msg = str(msg).lower()
+        return 'missingorspent' in msg or 'missing inputs' in msg or 'missing-inputs' in msg
+
+    def broadcast(self, network, *, timeout=30.0):
+        ''' Broadcasts the txs from self.broadcast_count on, blocking until
+        they are all accepted. Raises BfpUploadError on failure, after which
+        calling it again resumes. '''
+        q = queue.Queue()
+        index = {str(tx): i for i, tx in enumerate(self.txs)}
+        accepted = set(range(self.broadcast_count))
+        resends = {}
+        retry = set()  # txs to send again once their parent is accepted
+        sent_after_parent = set()  # txs last sent after their parent was accepted
+        next_i = self.broadcast_count
+        def send(i):
+            if i - 1 in accepted:
+                sent_after_parent.add(i)
+            else:
+                sent_after_parent.discard(i)
+            network.queue_request('blockchain.transaction.broadcast', [str(self.txs[i])], callback=q.put)
+        try:
+            while self.broadcast_count < len(self.txs):
+                while next_i < len(self.txs) and next_i - self.broadcast_count < self.max_in_flight:
+                    send(next_i)
+                    next_i += 1
+                try:
+                    r = q.get(timeout=timeout)
+                except queue.Empty:
+                    raise BfpUploadError('timed out waiting for the server')
+                i = index[r['params'][0]]
+                err = r.get('error')
+                if err:
+                    msg = err.get('message', err) if isinstance(err, dict) else err
+                    if self._is_missing_inputs(msg) and i > 0 and i not in sent_after_parent:
+                        # the parent may reach the server after this one,
+                        # which is not a failure of this tx
+                        retry.add(i)
+                    elif self._is_missing_inputs(msg) and i > 0 and resends.get(i, 0) < self.max_resends:
+                        resends[i] = resends.get(i, 0) + 1
+                        retry.add(i)
+                    elif 'already' not in str(msg).lower():
+                        raise BfpUploadError(Network.transmogrify_broadcast_response_for_gui(msg))
+                    else:
+                        accepted.add(i)
+                elif r.get('result') != self.txs[i].txid():
+                    raise BfpUploadError('server response does not match the transaction id')
+                else:
+                    accepted.add(i)
+                while self.broadcast_count in accepted:
+                    self.broadcast_count += 1
+                if self.progress_callback:
+                    self.progress_callback(self.broadcast_count, len(self.txs))
+                resent = {j for j in retry if j - 1 in accepted}
+                for j in sorted(resent):
+                    send(j)
+                retry -= resent
+        finally:
+            network.cancel_requests(q.put)
+        return self.file_txid
@@ -20,25 +20,34 @@
 # THE SOFTWARE.
 
 _CHARSET = "qpzry9x8gf2tvdw0s3jn54khce6mua7l"
+_CHARSET_REV = {c: i for i, c in enumerate(_CHARSET)}
+
+_GENERATORS = (0x98f2bc8e61, 0x79b76d99e2, 0xf33e5fb3c4, 0xae2eabe2a8, 0x1e4f43e470)
+
+def _make_polymod_table():
+    """The generator xor'ed in for each value of the top 5 bits of the
+    checksum state."""
+    table = []
+    for c0 in range(32):
+        g = 0
+        for i, gen in enumerate(_GENERATORS):
+            if (c0 >> i) & 1:
+                g ^= gen
+        table.append(g)
+    return tuple(table)
+
+_POLYMOD_TABLE = _make_polymod_table()
+
+def _polymod_state(values, c=1):
+    """Feeds values into the checksum state c, and returns the new state."""
+    table = _POLYMOD_TABLE
+    for d in values:
+        c = ((c & 0x07ffffffff) << 5) ^ d ^ table[c >> 35]
+    return c
 
 def _polymod(values):
     """Internal function that computes the cashaddr checksum."""
-    c = 1
-    for d in values:
-        c0 = c >> 35
-        c = ((c & 0x07ffffffff) << 5) ^ d
-        if (c0 & 0x01):
-            c ^= 0x98f2bc8e61
-        if (c0 & 0x02):
-            c ^= 0x79b76d99e2
-        if (c0 & 0x04):
-            c ^= 0xf33e5fb3c4
-        if (c0 & 0x08):
-            c ^= 0xae2eabe2a8
-        if (c0 & 0x10):
-            c ^= 0x1e4f43e470
-    retval= c ^ 1
-    return retval
+    return _polymod_state(values) ^ 1
 
 def _prefix_expand(prefix):
     """Expand the prefix into values for checksum computation."""
@@ -47,10 +56,20 @@ def _prefix_expand(prefix):
     retval.append(0)
     return retval
 
+_prefix_states = {}
+
+def _prefix_state(prefix):
+    """The checksum state after the expanded prefix. There are only a few
+    prefixes in use, so these are computed once."""
+    try:
+        return _prefix_states[prefix]
+    except KeyError:
+        c = _prefix_states[prefix] = _polymod_state(_prefix_expand(prefix))
+        return c
+
 def _create_checksum(prefix, data):
     """Compute the checksum values given prefix and data."""
-    values = _prefix_expand(prefix) + data + bytes(8)
-    polymod = _polymod(values)
+    polymod = _polymod_state(bytes(8), _polymod_state(data, _prefix_state(prefix))) ^ 1
     # Return the polymod expanded into eight 5-bit elements
     return bytes((polymod >> 5 * (7 - i)) & 31 for i in range(8))
 
@@ -122,12 +141,12 @@ def _decode_payload(addr):
         raise ValueError('address payload has invalid length: {}'
                          .format(len(addr)))
     try:
-        data = bytes(_CHARSET.find(x) for x in payload)
-    except ValueError:
+        data = bytes(_CHARSET_REV[x] for x in payload)
+    except KeyError:
         raise ValueError('invalid characters in address: {}'
                             .format(payload))
 
-    if _polymod(_prefix_expand(prefix) + data):
+    if _polymod_state(data, _prefix_state(prefix)) ^ 1:
         raise ValueError('invalid checksum in address: {}'.format(addr))
 
     if lower != addr:
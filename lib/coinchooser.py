@@ -40,12 +40,23 @@ class PRNG:
     def __init__(self, seed):
         self.sha = sha256(seed)
         self.pool = bytearray()
+        self.pos = 0  # bytes of self.pool already consumed
+
+    def _fill(self, n):
+        pool = self.pool
+        if self.pos > 4096:
+            # Drop consumed bytes now and then, rather than re-slicing the
+            # pool on every call.
+            del pool[:self.pos]
+            self.pos = 0
+        while len(pool) - self.pos < n:
+            pool.extend(self.sha)
+            self.sha = sha256(self.sha)
 
     def get_bytes(self, n):
-        while len(self.pool) < n:
-            self.pool.extend(self.sha)
-            self.sha = sha256(self.sha)
-        result, self.pool = self.pool[:n], self.pool[n:]
+        self._fill(n)
+        result = self.pool[self.pos:self.pos + n]
+        self.pos += n
         return result
 
     def randint(self, start, end):
@@ -54,7 +65,10 @@ class PRNG:
         r = 0
         p = 1
         while p < n:
-            r = self.get_bytes(1)[0] + (r << 8)
+            if self.pos >= len(self.pool):
+                self._fill(1)
+            r = self.pool[self.pos] + (r << 8)
+            self.pos += 1
             p = p << 8
         return start + (r % n)
 
@@ -70,15 +84,100 @@ class PRNG:
 
 Bucket = namedtuple('Bucket', ['desc', 'size', 'value', 'coins'])
 
+
+class SufficientFunds:
+    '''Decides whether a set of buckets can pay for a transaction, working
+    purely on the total value and size of the inputs so that candidate
+    bucket sets can be evaluated without building Transaction objects.
+
+    Calling an instance with a list of buckets gives the classic
+    sufficient_funds(buckets) -> bool interface.'''
+
+    def __init__(self, spent_amount, base_size, fee_estimator, dust_threshold,
+                 extra_value=0, extra_size=0):
+        self.spent_amount = spent_amount
+        self.base_size = base_size + extra_size
+        self.fee_estimator = fee_estimator
+        self.dust_threshold = dust_threshold
+        self.extra_value = extra_value
+
+    def excess(self, value, size):
+        '''How much the inputs exceed outputs + fee (negative if short)'''
+        return (value + self.extra_value - self.spent_amount
+                - self.fee_estimator(size + self.base_size))
+
+    def by_totals(self, value, size):
+        return self.excess(value, size) >= 0
+
+    def max_changeless_excess(self, size):
+        '''Largest excess that still produces no change output, ie. the
+        change left after paying for a 34 byte change output is dust.'''
+        total = size + self.base_size
+        return (self.dust_threshold - 1
+                + self.fee_estimator(total + 34) - self.fee_estimator(total))
+
+    def __call__(self, buckets):
+        return self.by_totals(sum(bucket.value for bucket in buckets),
+                              sum(bucket.size for bucket in buckets))
+
+
 def strip_unneeded(bkts, sufficient_funds):
     '''Remove buckets that are unnecessary in achieving the spend amount'''
     bkts = sorted(bkts, key = lambda bkt: bkt.value)
-    for i in range(len(bkts)):
-        if not sufficient_funds(bkts[i + 1:]):
+    by_totals = getattr(sufficient_funds, 'by_totals', None)
+    if by_totals is None:
+        for i in range(len(bkts)):
+            if not sufficient_funds(bkts[i + 1:]):
+                return bkts[i:]
+        # Shouldn't get here
+        return bkts
+    # Same as above, using precomputed suffix totals rather than re-summing
+    # every suffix of bkts.
+    n = len(bkts)
+    values, sizes = [0] * (n + 1), [0] * (n + 1)
+    for i in range(n - 1, -1, -1):
+        values[i] = values[i + 1] + bkts[i].value
+        sizes[i] = sizes[i + 1] + bkts[i].size
+    for i in range(n):
+        if not by_totals(values[i + 1], sizes[i + 1]):
             return bkts[i:]
     # Shouldn't get here
     return bkts
 
+
+def branch_and_bound(values, sizes, sufficient_funds, max_tries=100000):
+    '''Depth-first search for a set of bucket indices that pays for the
+    transaction without needing a change output. Buckets are tried largest
+    value first; branches that overshoot the changeless window or that
+    cannot reach the target even with every remaining bucket are pruned.
+    Returns a tuple of indices, or None if nothing was found within
+    max_tries steps.'''
+    order = sorted(range(len(values)), key=lambda i: values[i], reverse=True)
+    remaining = [0] * (len(order) + 1)
+    for k in range(len(order) - 1, -1, -1):
+        remaining[k] = remaining[k + 1] + values[order[k]]
+    excess = sufficient_funds.excess
+    max_excess = sufficient_funds.max_changeless_excess
+    stack = [(0, 0, 0, ())]
+    tries = 0
+    while stack and tries < max_tries:
+        tries += 1
+        k, value, size, chosen = stack.pop()
+        if chosen:
+            e = excess(value, size)
+            if e > max_excess(size):
+                continue
+            if e >= 0:
+                return chosen
+        if k == len(order) or excess(value + remaining[k], size) < 0:
+            continue
+        i = order[k]
+        # push the "omit" branch first so the "include" branch runs first
+        stack.append((k + 1, value, size, chosen))
+        stack.append((k + 1, value + values[i], size + sizes[i], chosen + (i,)))
+    return None
+
+
 class CoinChooserBase(PrintError):
 
     def keys(self, coins):
@@ -188,15 +287,14 @@ class CoinChooserBase(PrintError):
         base_size = tx.estimated_size()
         spent_amount = tx.output_value()
 
-        def sufficient_funds(buckets):
-            '''Given a list of buckets, return True if it has enough
-            value to pay for the transaction'''
-            mandatory_coins_bucket = self.bucketize_coins(mandatory_coins, sign_schnorr=sign_schnorr)
-            mandatory_input = sum(coin.value for coin in mandatory_coins_bucket)
-            mandatory_input_size = sum(coin.size for coin in mandatory_coins_bucket)
-            total_input = sum(bucket.value for bucket in buckets) + mandatory_input
-            total_size = sum(bucket.size for bucket in buckets) + mandatory_input_size + base_size
-            return total_input >= spent_amount + fee_estimator(total_size)
+        # Given a list of buckets, sufficient_funds returns True if it has
+        # enough value to pay for the transaction. The mandatory coins are
+        # always spent so their totals are computed just once, here.
+        mandatory_coins_bucket = self.bucketize_coins(mandatory_coins, sign_schnorr=sign_schnorr)
+        sufficient_funds = SufficientFunds(
+            spent_amount, base_size, fee_estimator, dust_threshold,
+            extra_value=sum(coin.value for coin in mandatory_coins_bucket),
+            extra_size=sum(coin.size for coin in mandatory_coins_bucket))
 
         # Collect the coins into buckets, choose a subset of the buckets
         buckets = self.bucketize_coins(coins, sign_schnorr=sign_schnorr)
@@ -231,10 +329,16 @@ class CoinChooserRandom(CoinChooserBase):
     def bucket_candidates(self, buckets, sufficient_funds):
         '''Returns a list of bucket sets.'''
         candidates = set()
+        by_totals = getattr(sufficient_funds, 'by_totals', None)
+        if by_totals is None:
+            # plain sufficient_funds(buckets) callable
+            by_totals = lambda value, size: sufficient_funds([Bucket(None, size, value, [])])
+        values = [bucket.value for bucket in buckets]
+        sizes = [bucket.size for bucket in buckets]
 
         # Add all singletons
-        for n, bucket in enumerate(buckets):
-            if sufficient_funds([bucket]):
+        for n in range(len(buckets)):
+            if by_totals(values[n], sizes[n]):
                 candidates.add((n, ))
 
         # And now some random ones
@@ -244,15 +348,22 @@ class CoinChooserRandom(CoinChooserBase):
             # Get a random permutation of the buckets, and
             # incrementally combine buckets until sufficient
             self.p.shuffle(permutation)
-            bkts = []
+            value = size = 0
             for count, index in enumerate(permutation):
-                bkts.append(buckets[index])
-                if sufficient_funds(bkts):
+                value += values[index]
+                size += sizes[index]
+                if by_totals(value, size):
                     candidates.add(tuple(sorted(permutation[:count + 1])))
                     break
             else:
                 raise NotEnoughFunds()
 
+        # Finally, a bucket set that needs no change output, if one exists
+        if isinstance(sufficient_funds, SufficientFunds):
+            changeless = branch_and_bound(values, sizes, sufficient_funds)
+            if changeless is not None:
+                candidates.add(tuple(sorted(changeless)))
+
         candidates = [[buckets[n] for n in c] for c in candidates]
         return [strip_unneeded(c, sufficient_funds) for c in candidates]
 
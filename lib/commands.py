@@ -28,6 +28,7 @@ import ast
 import base64
 import datetime
 import json
+import os
 import queue
 import sys
 import time
@@ -41,13 +42,11 @@ from . import util
 from .address import Address, AddressError
 from .bitcoin import hash_160, COIN, TYPE_ADDRESS
 from .i18n import _
-from .paymentrequest import PR_PAID, PR_UNPAID, PR_UNKNOWN, PR_EXPIRED
 from .plugins import run_hook
 from .slp_coinchooser import SlpCoinChooser
 from .slp_checker import SlpTransactionChecker
 from .transaction import Transaction, multisig_script
 from .util import bfh, bh2u, format_satoshis, json_decode, print_error, to_bytes, get_satoshis_nofloat, PrintError
-from .wallet import Deterministic_Wallet
 
 known_commands = {}
 
@@ -63,6 +62,9 @@ class Command:
         self.requires_network = 'n' in s
         self.requires_wallet = 'w' in s
         self.requires_password = 'p' in s
+        # read-only wallet commands may run concurrently with other commands
+        # on the same wallet in the daemon, the others are serialized
+        self.read_only = 'r' in s
         self.description = func.__doc__
         self.help = self.description.split('.')[0] if self.description else None
         varnames = func.__code__.co_varnames[1:func.__code__.co_argcount]
@@ -211,7 +213,7 @@ class Commands(PrintError):
         self.wallet.storage.write()
         return {'password':self.wallet.has_password()}
 
-    @command('w')
+    @command('wr')
     def get(self, key):
         """Return item from wallet storage"""
         return self.wallet.storage.get(key)
@@ -260,7 +262,7 @@ class Commands(PrintError):
         sh = Address.from_string(address).to_scripthash_hex()
         return self.network.synchronous_get(('blockchain.scripthash.get_history', [sh]))
 
-    @command('w')
+    @command('wr')
     def listunspent(self):
         """List unspent outputs. Returns the list of unspent transaction
         outputs in your wallet."""
@@ -373,7 +375,7 @@ class Commands(PrintError):
         else:
             return [get_pk(addr) for addr in address]
 
-    @command('w')
+    @command('wr')
     def ismine(self, address):
         """Check if address is in wallet. Return true if and only address is in wallet"""
         address = address_from_string_check_slp(address, self.wallet)
@@ -389,13 +391,13 @@ class Commands(PrintError):
         """Check that an address is valid. """
         return Address.is_valid(address)
 
-    @command('w')
+    @command('wr')
     def getpubkeys(self, address):
         """Return the public keys for a wallet address. """
         address = address_from_string_check_slp(address, self.wallet)
         return self.wallet.get_public_keys(address)
 
-    @command('w')
+    @command('wr')
     def getbalance(self):
         """Return the balance of your wallet. """
         c, u, x = self.wallet.get_balance()
@@ -417,7 +419,7 @@ class Commands(PrintError):
         out["unconfirmed"] =  str(PyDecimal(out["unconfirmed"])/COIN)
         return out
 
-    @command('w')
+    @command('wr')
     def getbalance_slp(self, token_id):
         """Return the token balance of your wallet. """
         if not self.wallet.is_slp:
@@ -461,7 +463,7 @@ class Commands(PrintError):
         from .version import PACKAGE_VERSION
         return PACKAGE_VERSION
 
-    @command('w')
+    @command('wr')
     def getmpk(self):
         """Get master public key. Return your wallet\'s master public key"""
         return self.wallet.get_master_public_key()
@@ -489,11 +491,11 @@ class Commands(PrintError):
             out = "Error: " + str(e)
         return out
 
-    def _resolver(self, x):
+    def _resolver(self, x, nocheck=False):
         if x is None:
             return None
         out = self.wallet.contacts.resolve(x)
-        if out.get('type') == 'openalias' and self.nocheck is False and out.get('validated') is False:
+        if out.get('type') == 'openalias' and nocheck is False and out.get('validated') is False:
             raise BaseException('cannot verify alias', x)
         return out['address']
 
@@ -505,7 +507,6 @@ class Commands(PrintError):
         from .wallet import sweep
         tx_fee = satoshis(fee)
         privkeys = privkey.split()
-        self.nocheck = nocheck
         addr = Address.from_string(destination)
         tx = sweep(privkeys, self.network, self.config, addr, tx_fee, imax)
         return tx.as_dict() if tx else None
@@ -528,12 +529,11 @@ class Commands(PrintError):
 
     def _mktx(self, outputs, fee=None, change_addr=None, domain=None, nocheck=False,
               unsigned=False, password=None, locktime=None):
-        self.nocheck = nocheck
-        change_addr = self._resolver(change_addr)
-        domain = None if domain is None else map(self._resolver, domain)
+        change_addr = self._resolver(change_addr, nocheck)
+        domain = None if domain is None else [self._resolver(x, nocheck) for x in domain]
         final_outputs = []
         for address, amount in outputs:
-            address = self._resolver(address)
+            address = self._resolver(address, nocheck)
             amount = satoshis(amount)
             final_outputs.append((TYPE_ADDRESS, address, amount))
 
@@ -680,17 +680,29 @@ class Commands(PrintError):
             raise RuntimeError(errmsg or 'Failed to add token')
         return True
 
-    @command('w')
-    def history(self, year=0, show_addresses=False, show_fiat=False, use_net=False, timeout=30.0):
-        """Wallet history. Returns the transaction history of your wallet."""
+    @command('wr')
+    def history(self, year=0, show_addresses=False, show_fiat=False, use_net=False, timeout=30.0,
+                offset=0, limit=0, output_file=None, csv=False):
+        """Wallet history. Returns the transaction history of your wallet,
+        newest first. The returned history is built in memory as a whole
+        before it is sent, so for large wallets, fetch it in pages with
+        offset and limit, or use output_file. With output_file, the history
+        is written to that file (as JSON, or CSV with csv) as it gets
+        exported, and only the number of exported transactions is returned.
+        output_file must be an absolute path, since the daemon may run in
+        another directory."""
+        if output_file and not os.path.isabs(output_file):
+            raise BaseException('output_file must be an absolute path')
         t0 = time.time()
-        year, show_addresses, show_fiat, use_net, timeout = (
+        year, show_addresses, show_fiat, use_net, timeout, offset, limit = (
             int(year), bool(show_addresses), bool(show_fiat), bool(use_net),
-            float(timeout) )
+            float(timeout), int(offset), int(limit) )
         def time_remaining(): return max(timeout - (time.time()-t0), 0)
         kwargs = { 'show_addresses'   : show_addresses,
                    'fee_calc_timeout' : timeout,
-                   'download_inputs'  : use_net,        }
+                   'download_inputs'  : use_net,
+                   'offset'           : offset,
+                   'limit'            : limit,          }
         if year:
             start_date = datetime.datetime(year, 1, 1)
             end_date = datetime.datetime(year+1, 1, 1)
@@ -722,6 +734,13 @@ class Commands(PrintError):
                 try: q.get(timeout=min(max(time_remaining()/2.0, 0.001), 10.0))
                 except queue.Empty: pass
                 kwargs['fee_calc_timeout'] = time_remaining()  # since we blocked above, recompute time_remaining for kwargs
+        if output_file:
+            items = self.wallet.iter_history_export(**kwargs)
+            ccy = kwargs['fx'].get_currency() if show_fiat else None
+            with open(output_file, "w", encoding="utf-8") as f:
+                count = self.wallet.write_history(f, items, is_csv=bool(csv), include_addresses=show_addresses,
+                                                  fiat_currency=ccy)
+            return {'output_file': output_file, 'count': count}
         return self.wallet.export_history(**kwargs)
 
     @command('w')
@@ -730,17 +749,17 @@ class Commands(PrintError):
         transaction ID"""
         self.wallet.set_label(key, label)
 
-    @command('w')
+    @command('wr')
     def listcontacts(self):
         """Show your list of contacts"""
         return self.wallet.contacts
 
-    @command('w')
+    @command('wr')
     def getalias(self, key):
         """Retrieve alias. Lookup in your list of contacts, and for an OpenAlias DNS record."""
         return self.wallet.contacts.resolve(key)
 
-    @command('w')
+    @command('wr')
     def searchcontacts(self, query):
         """Search through contacts, return matching entries. """
         results = {}
@@ -749,7 +768,7 @@ class Commands(PrintError):
                 results[key] = value
         return results
 
-    @command('w')
+    @command('wr')
     def listaddresses(self, receiving=False, change=False, labels=False, frozen=False, unused=False, funded=False, balance=False):
         """List wallet addresses. Returns the list of all addresses in your wallet. Use optional arguments to filter the results."""
         out = []
@@ -787,6 +806,18 @@ class Commands(PrintError):
                 raise BaseException("Unknown transaction")
         return tx.as_dict()
 
+    @command('n')
+    def bfp_download(self, txid, path):
+        """Download a file stored on chain with the Bitcoin Files Protocol,
+        given the txid of its metadata transaction. An interrupted download
+        resumes where it left off when run again with the same path. path
+        must be an absolute path, since the daemon may run in another
+        directory."""
+        if not os.path.isabs(path):
+            raise BaseException('path must be an absolute path')
+        from .bitcoinfiles import BfpDownloader
+        return BfpDownloader(self.network, txid, path, wallet=self.wallet).run()
+
     @command('wn')
     def slpvalidate(self, txid, debug, reset): # Wish I could make debug, reset as optional but EC console doesn't allow. >_>
         """
@@ -839,6 +870,19 @@ class Commands(PrintError):
         validity_name = job.graph.validator.validity_states[n.validity]
         return validity_name
 
+    @command('')
+    def slpvalidationstats(self):
+        """Show progress and throughput statistics of the SLP validators:
+        totals, per-token graph sizes and the state of each unfinished job."""
+        from . import slp_dagging, slp_validator_0x01, slp_validator_0x01_nft1
+        from .slp_graph_search import slp_gs_mgr
+        return {
+            'slp1': slp_validator_0x01.shared_context.get_stats(),
+            'nft1': slp_validator_0x01_nft1.shared_context_nft1.get_stats(),
+            'tx_fetcher': slp_dagging.tx_fetcher.get_stats(),
+            'graph_search_bytes_downloaded': slp_gs_mgr.bytes_downloaded,
+        }
+
     @command('')
     def encrypt(self, pubkey, message):
         """Encrypt a message with a public key. Use quotes if the message contains whitespaces."""
@@ -865,6 +909,7 @@ class Commands(PrintError):
         return res
 
     def _format_request(self, out):
+        from .paymentrequest import PR_PAID, PR_UNPAID, PR_UNKNOWN, PR_EXPIRED
         pr_str = {
             PR_UNKNOWN: 'Unknown',
             PR_UNPAID: 'Pending',
@@ -876,7 +921,7 @@ class Commands(PrintError):
         out['status'] = pr_str[out.get('status', PR_UNKNOWN)]
         return out
 
-    @command('w')
+    @command('wr')
     def getrequest(self, key):
         """Return a payment request"""
         r = self.wallet.get_payment_request(Address.from_string(key), self.config)
@@ -889,9 +934,10 @@ class Commands(PrintError):
     #    """<Not implemented>"""
     #    pass
 
-    @command('w')
+    @command('wr')
     def listrequests(self, pending=False, expired=False, paid=False):
         """List the payment requests you made."""
+        from .paymentrequest import PR_PAID, PR_UNPAID, PR_EXPIRED
         out = self.wallet.get_sorted_requests(self.config)
         if pending:
             f = PR_UNPAID
@@ -908,6 +954,7 @@ class Commands(PrintError):
     @command('w')
     def maintainaddressgap(self, enable):
         """Enable or disable the automatic address gap maintenance for receiving addresses."""
+        from .wallet import Deterministic_Wallet
         if not isinstance(self.wallet, Deterministic_Wallet):
             raise BaseException("This command is only for deterministic wallets")
         self.wallet.storage.put('auto_maintain_gap', enable)
@@ -995,7 +1042,7 @@ class Commands(PrintError):
         self.network.send([('blockchain.scripthash.subscribe', [h])], callback)
         return True
 
-    @command('wn')
+    @command('wnr')
     def is_synchronized(self):
         """ return wallet synchronization status """
         return self.wallet.is_up_to_date()
@@ -1031,11 +1078,13 @@ param_descriptions = {
     'requested_amount': 'Requested amount (in BCH).',
     'outputs': 'list of ["address", amount]',
     'redeem_script': 'redeem script (hexadecimal)',
+    'path': 'Path of the file to write',
 }
 
 command_options = {
     'balance':     ("-b", "Show the balances of listed addresses"),
     'change':      (None, "Show only change addresses"),
+    'csv':         (None, "Write the output file in CSV format"),
     'change_addr': ("-c", "Change address. Default is a spare address, or the source address if it's not in the wallet"),
     'domain':      ("-D", "List of addresses"),
     'entropy':     (None, "Custom entropy"),
@@ -1050,13 +1099,16 @@ command_options = {
     'index_url':   (None, 'Override the URL where you would like users to be shown the BIP70 Payment Request'),
     'labels':      ("-l", "Show the labels of listed addresses"),
     'language':    ("-L", "Default language for wordlist"),
+    'limit':       (None, "Maximum number of items to return (0 for no limit)"),
     'locktime':    (None, "Set locktime block number"),
     'memo':        ("-m", "Description of the request"),
     'nbits':       (None, "Number of bits of entropy"),
     'new_password':(None, "New Password"),
     'nocheck':     (None, "Do not verify aliases"),
+    'offset':      (None, "Number of items to skip"),
     'op_return':   (None, "Specify string data to add to the transaction as an OP_RETURN output"),
     'op_return_raw': (None, 'Specify raw hex data to add to the transaction as an OP_RETURN output (0x6a aka the OP_RETURN byte will be auto-prepended for you so do not include it)'),
+    'output_file': (None, "Write the output to this file instead of returning it"),
     'paid':        (None, "Show only paid requests."),
     'password':    ("-W", "Password"),
     'payment_url': (None, 'Optional URL where you would like users to POST the BIP70 Payment message'),
@@ -1081,6 +1133,8 @@ arg_types = {
     'nbits': int,
     'imax': int,
     'year': int,
+    'offset': int,
+    'limit': int,
     'entropy': int,
     'tx': tx_from_str,
     'pubkeys': json_loads,
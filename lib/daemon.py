@@ -23,23 +23,25 @@
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 import ast
+import collections
 import os
+import threading
 import time
 import sys
 
 # from jsonrpc import JSONRPCResponseManager
 import jsonrpclib
-from .jsonrpc import VerifyingJSONRPCServer
 
 from .version import PACKAGE_VERSION
-from .network import Network
 from .util import (json_decode, DaemonThread, print_error, to_string,
                    standardize_path)
-from .wallet import Wallet
 from .storage import WalletStorage
 from .commands import known_commands, Commands
 from .simple_config import SimpleConfig
-from .exchange_rate import FxThread
+
+# Note: the network, wallet, exchange rate and RPC server modules are only
+# imported by the Daemon itself, as they take a while to import and
+# command line calls to a running daemon only need get_server().
 
 
 def get_lockfile(config):
@@ -139,6 +141,8 @@ def get_rpc_credentials(config):
 class Daemon(DaemonThread):
 
     def __init__(self, config, fd, is_gui, plugins):
+        from .network import Network
+        from .exchange_rate import FxThread
         DaemonThread.__init__(self)
         self.plugins = plugins
         self.config = config
@@ -151,7 +155,22 @@ class Daemon(DaemonThread):
         if self.network:
             self.network.add_jobs([self.fx])
         self.gui = None
-        self.wallets = {}
+        # ordered from least to most recently selected by RPC calls
+        self.wallets = collections.OrderedDict()
+        # Wallets loaded on demand by RPC calls that select them with the
+        # 'wallet' argument. Beyond max_lazy_wallets of them, the least
+        # recently used ones that no call is using get unloaded again.
+        self.lazy_wallets = set()
+        self.wallet_users = {}
+        self.max_lazy_wallets = config.get('rpc_max_wallets', 20)
+        # RPC calls run on the server's worker threads. Calls that change a
+        # wallet are serialized per wallet path, and daemon subcommands
+        # (which load and close wallets) are serialized among themselves.
+        self.rpc_lock = threading.Lock()
+        self.wallet_locks = {}
+        self.wallet_load_locks = {}
+        self.daemon_cmd_lock = threading.RLock()
+        self.rpc_stats = {}
         # Setup JSONRPC server
         self.init_server(config, fd, is_gui)
 
@@ -159,10 +178,13 @@ class Daemon(DaemonThread):
         host = config.get('rpchost', '127.0.0.1')
         port = config.get('rpcport', 0)
 
+        from .jsonrpc import VerifyingJSONRPCServer
         rpc_user, rpc_password = get_rpc_credentials(config)
         try:
             server = VerifyingJSONRPCServer((host, port), logRequests=False,
-                                            rpc_user=rpc_user, rpc_password=rpc_password)
+                                            rpc_user=rpc_user, rpc_password=rpc_password,
+                                            max_workers=config.get('rpcworkers', 4),
+                                            max_queue=config.get('rpcqueue', 16))
         except Exception as e:
             self.print_error('Warning: cannot initialize RPC server on host', host, e)
             self.server = None
@@ -177,13 +199,171 @@ class Daemon(DaemonThread):
         server.register_function(self.run_daemon, 'daemon')
         self.cmd_runner = Commands(self.config, None, self.network)
         for cmdname in known_commands:
-            server.register_function(getattr(self.cmd_runner, cmdname), cmdname)
+            server.register_function(self.wrap_command(cmdname), cmdname)
         server.register_function(self.run_cmdline, 'run_cmdline')
 
+    def wrap_command(self, cmdname):
+        ''' Returns the RPC handler for calling cmdname. The handler takes an
+        optional 'wallet' keyword argument selecting the wallet to operate
+        on, see acquire_wallet(). Without it, commands operate on the last
+        wallet loaded with 'daemon load_wallet'. '''
+        cmd = known_commands[cmdname]
+        def handler(*args, wallet=None, **kwargs):
+            if wallet is None:
+                # A fresh Commands per call, as RPCs run concurrently on the
+                # thread pool and must not share per-call state.
+                selected = self.cmd_runner.wallet
+                func = getattr(Commands(self.config, selected, self.network), cmdname)
+                return self.call_command(cmd, selected, func, *args, **kwargs)
+            path, selected = self.acquire_wallet(wallet)
+            try:
+                func = getattr(Commands(self.config, selected, self.network), cmdname)
+                return self.call_command(cmd, selected, func, *args, **kwargs)
+            finally:
+                self.release_wallet(path)
+        return handler
+
+    def resolve_wallet_path(self, selector):
+        ''' A selector is either a wallet file path, or the file name of a
+        wallet in the wallets directory. '''
+        if os.path.sep in selector or (os.path.altsep and os.path.altsep in selector):
+            path = selector
+        else:
+            path = os.path.join(self.config.path, 'wallets', selector)
+        return standardize_path(path)
+
+    def acquire_wallet(self, selector):
+        ''' Returns (path, wallet) for the wallet selected by selector,
+        loading it if needed. The wallet can't be unloaded for being idle
+        until release_wallet(path) is called.
+
+        Loading a wallet can take a while, so it happens outside of the
+        daemon_cmd_lock, under a lock of its own for the wallet path. '''
+        path = self.resolve_wallet_path(selector)
+        while True:
+            with self.daemon_cmd_lock:
+                wallet = self.wallets.get(path)
+                if wallet is not None:
+                    self.wallets.move_to_end(path)
+                    self.wallet_users[path] = self.wallet_users.get(path, 0) + 1
+                    return path, wallet
+            with self.rpc_lock:
+                load_lock = self.wallet_load_locks.get(path)
+                if load_lock is None:
+                    load_lock = self.wallet_load_locks[path] = threading.Lock()
+            with load_lock:
+                try:
+                    if self.get_wallet(path) is None:
+                        self.lazy_load_wallet(path)
+                finally:
+                    with self.rpc_lock:
+                        if self.wallet_load_locks.get(path) is load_lock:
+                            del self.wallet_load_locks[path]
+            # loop to take a user reference under the daemon_cmd_lock; if
+            # the wallet got unloaded again in the meantime, it gets reloaded
+
+    def lazy_load_wallet(self, path):
+        ''' Loads the wallet at path for acquire_wallet(), without holding
+        the daemon_cmd_lock. '''
+        # encrypted wallets have to be loaded with 'daemon load_wallet'
+        if not os.path.exists(path):
+            raise Exception('Wallet "%s" not found' % os.path.basename(path))
+        wallet = self.open_wallet(path, None)
+        if wallet is None:
+            raise Exception('Wallet "%s" is not loaded. Use "electron-cash daemon load_wallet"'
+                            % os.path.basename(path))
+        with self.daemon_cmd_lock:
+            if path in self.wallets:
+                # loaded by 'daemon load_wallet' in the meantime
+                wallet.stop_threads()
+                return
+            self.wallets[path] = wallet
+            self.lazy_wallets.add(path)
+
+    def release_wallet(self, path):
+        with self.daemon_cmd_lock:
+            self.wallet_users[path] -= 1
+            if not self.wallet_users[path]:
+                del self.wallet_users[path]
+            self.unload_idle_wallets()
+
+    def unload_idle_wallets(self):
+        excess = len(self.lazy_wallets) - self.max_lazy_wallets
+        for path in list(self.wallets):
+            if excess <= 0:
+                break
+            if path in self.lazy_wallets and path not in self.wallet_users:
+                self.print_error("unloading idle wallet", path)
+                self.stop_wallet(path)
+                # no call uses the wallet, so nobody holds its RPC lock
+                with self.rpc_lock:
+                    self.wallet_locks.pop(path, None)
+                excess -= 1
+
+    def get_wallet_lock(self, wallet):
+        path = wallet.storage.path
+        with self.rpc_lock:
+            lock = self.wallet_locks.get(path)
+            if lock is None:
+                lock = self.wallet_locks[path] = threading.RLock()
+            return lock
+
+    def call_command(self, cmd, wallet, func, *args, **kwargs):
+        ''' Calls func for the command cmd on wallet, holding the wallet's
+        RPC lock unless the command is read-only, and records its latency. '''
+        lock = None
+        if wallet is not None and cmd.requires_wallet and not cmd.read_only:
+            lock = self.get_wallet_lock(wallet)
+        t0 = time.time()
+        if lock:
+            lock.acquire()
+        t1 = time.time()
+        ok = False
+        try:
+            result = func(*args, **kwargs)
+            ok = True
+            return result
+        except (KeyboardInterrupt, SystemExit, Exception):
+            raise
+        except BaseException as e:
+            # commands raise BaseException for user errors, which the RPC
+            # dispatcher would not turn into an error response
+            raise Exception(str(e)) from e
+        finally:
+            if lock:
+                lock.release()
+            self.record_rpc(cmd.name, t1 - t0, time.time() - t1, ok)
+
+    def record_rpc(self, name, lock_wait, elapsed, ok):
+        with self.rpc_lock:
+            st = self.rpc_stats.get(name)
+            if st is None:
+                st = self.rpc_stats[name] = {'count': 0, 'errors': 0, 'total_time': 0.0,
+                                             'max_time': 0.0, 'lock_wait': 0.0}
+            st['count'] += 1
+            st['errors'] += not ok
+            st['total_time'] += elapsed
+            st['max_time'] = max(st['max_time'], elapsed)
+            st['lock_wait'] += lock_wait
+
+    def get_rpc_stats(self):
+        ''' Returns the request queue counters of the RPC server and the
+        per-command call counts and latencies (in seconds). '''
+        with self.rpc_lock:
+            commands = {name: dict(st) for name, st in self.rpc_stats.items()}
+        for st in commands.values():
+            st['avg_time'] = st['total_time'] / st['count']
+        server = self.server.get_stats() if self.server else {}
+        return {'server': server, 'commands': commands}
+
     def ping(self):
         return True
 
     def run_daemon(self, config_options):
+        with self.daemon_cmd_lock:
+            return self._run_daemon(config_options)
+
+    def _run_daemon(self, config_options):
         config = SimpleConfig(config_options)
         sub = config.get('subcommand')
         subargs = config.get('subargs')
@@ -197,6 +377,8 @@ class Daemon(DaemonThread):
         elif sub == 'load_wallet':
             path = config.get_wallet_path()
             wallet = self.load_wallet(path, config.get('password'))
+            # explicitly loaded wallets stay loaded
+            self.lazy_wallets.discard(standardize_path(path))
             self.cmd_runner.wallet = wallet
             response = True
         elif sub == 'close_wallet':
@@ -221,6 +403,9 @@ class Daemon(DaemonThread):
                     'wallets': {k: w.is_up_to_date()
                                 for k, w in self.wallets.items()},
                     'fee_per_kb': self.config.fee_per_kb(),
+                    'rpc': self.get_rpc_stats(),
+                    'verification': {k: w.verifier.get_stats()
+                                     for k, w in self.wallets.items() if w.verifier},
                 }
             else:
                 response = "Daemon offline"
@@ -235,6 +420,10 @@ class Daemon(DaemonThread):
         return response
 
     def run_gui(self, config_options):
+        with self.daemon_cmd_lock:
+            return self._run_gui(config_options)
+
+    def _run_gui(self, config_options):
         config = SimpleConfig(config_options)
         if self.gui:
             if hasattr(self.gui, 'new_window'):
@@ -254,6 +443,16 @@ class Daemon(DaemonThread):
         if path in self.wallets:
             wallet = self.wallets[path]
             return wallet
+        wallet = self.open_wallet(path, password)
+        if wallet is not None:
+            self.wallets[path] = wallet
+        return wallet
+
+    def open_wallet(self, path, password):
+        ''' Opens the wallet at path and starts its threads, without adding
+        it to the loaded wallets. Returns None if the wallet can't be opened
+        without user interaction. '''
+        from .wallet import Wallet
         storage = WalletStorage(path, manual_upgrades=True)
         if not storage.file_exists():
             return
@@ -269,12 +468,12 @@ class Daemon(DaemonThread):
             return
         wallet = Wallet(storage)
         wallet.start_threads(self.network)
-        self.wallets[path] = wallet
         return wallet
 
     def add_wallet(self, wallet):
         path = wallet.storage.path
         self.wallets[path] = wallet
+        self.lazy_wallets.discard(path)
 
     def get_wallet(self, path):
         return self.wallets.get(path)
@@ -290,6 +489,7 @@ class Daemon(DaemonThread):
         # Issue #659 wallet may already be stopped.
         if path in self.wallets:
             wallet = self.wallets.pop(path)
+            self.lazy_wallets.discard(path)
             wallet.stop_threads()
 
     def run_cmdline(self, config_options):
@@ -317,7 +517,7 @@ class Daemon(DaemonThread):
         cmd_runner = Commands(config, wallet, self.network)
         func = getattr(cmd_runner, cmd.name)
         try:
-            result = func(*args, **kwargs)
+            result = self.call_command(cmd, wallet, func, *args, **kwargs)
         except TypeError as e:
             raise Exception("Wrapping TypeError to prevent JSONRPC-Pelix from hiding traceback") from e
         return result
@@ -325,6 +525,9 @@ class Daemon(DaemonThread):
     def run(self):
         while self.is_running():
             self.server.handle_request() if self.server else time.sleep(0.1)
+        if self.server:
+            # waits for the RPCs in progress, which may use the wallets
+            self.server.server_close()
         for k, wallet in self.wallets.items():
             wallet.stop_threads()
         if self.network:
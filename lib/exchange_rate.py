@@ -1,6 +1,9 @@
-from datetime import datetime
+from array import array
+import calendar
+from datetime import date, datetime
 import inspect
 import requests
+import struct
 import sys
 import os
 import json
@@ -30,6 +33,97 @@ CCY_PRECISIONS = {'BHD': 3, 'BIF': 0, 'BYR': 0, 'CLF': 4, 'CLP': 0,
                   'VUV': 0, 'XAF': 0, 'XAU': 4, 'XOF': 0, 'XPF': 0}
 
 
+class HistoryRates:
+    ''' The historical daily rates of one currency, as an array of floats
+    indexed by day (date ordinal - first_day), with NaN for days without a
+    rate. This is much more compact and faster to look up than the
+    {'YYYY-MM-DD': rate} dicts returned by request_history(), and gets
+    cached to disk as is. '''
+
+    MAGIC = b'ECFX'
+    _header = struct.Struct('<4sII')  # magic, first_day, number of days
+
+    def __init__(self, first_day=0, rates=None):
+        self.first_day = first_day
+        self.rates = rates if rates is not None else array('d')
+
+    @classmethod
+    def from_dict(cls, d):
+        days = {}
+        for day_str, rate in d.items():
+            try:
+                days[datetime.strptime(day_str, '%Y-%m-%d').toordinal()] = float(rate)
+            except (ValueError, TypeError):
+                continue
+        if not days:
+            return cls()
+        first_day = min(days)
+        rates = array('d', [float('nan')]) * (max(days) - first_day + 1)
+        for day, rate in days.items():
+            rates[day - first_day] = rate
+        return cls(first_day, rates)
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, first_day, n = cls._header.unpack_from(data)
+        if magic != cls.MAGIC or len(data) != cls._header.size + n * 8:
+            raise ValueError('bad history rates data')
+        rates = array('d')
+        rates.frombytes(data[cls._header.size:])
+        if sys.byteorder != 'little':
+            rates.byteswap()
+        return cls(first_day, rates)
+
+    def to_bytes(self):
+        rates = self.rates
+        if sys.byteorder != 'little':
+            rates = array('d', rates)
+            rates.byteswap()
+        return self._header.pack(self.MAGIC, self.first_day, len(rates)) + rates.tobytes()
+
+    def __len__(self):
+        return len(self.rates)
+
+    def get(self, day):
+        ''' Returns the rate (a float) for the date ordinal day, or None. '''
+        i = day - self.first_day
+        if 0 <= i < len(self.rates):
+            rate = self.rates[i]
+            if rate == rate:  # not NaN
+                return rate
+
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+def _utc_offset(t):
+    return calendar.timegm(time.localtime(t)) - t
+
+def day_ordinals(timestamps):
+    ''' Returns the date ordinals of the local days of timestamps (None for
+    None). The local UTC offset is looked up once per UTC day, rather than
+    converting every timestamp to a datetime. '''
+    offsets = {}  # UTC day -> UTC offset for the whole day, or None if it changes during the day
+    ret = []
+    for ts in timestamps:
+        if ts is None:
+            ret.append(None)
+            continue
+        ts = int(ts)
+        utc_day = ts // 86400
+        try:
+            offset = offsets[utc_day]
+        except KeyError:
+            offset = _utc_offset(utc_day * 86400)
+            if offset != _utc_offset(utc_day * 86400 + 86399):
+                offset = None
+            offsets[utc_day] = offset
+        if offset is None:
+            ret.append(datetime.fromtimestamp(ts).toordinal())
+        else:
+            ret.append((ts + offset) // 86400 + _EPOCH_ORDINAL)
+    return ret
+
+
 class ExchangeBase(PrintError):
 
     def __init__(self, on_quotes, on_history):
@@ -72,21 +166,33 @@ class ExchangeBase(PrintError):
         t.start()
 
     def read_historical_rates(self, ccy, cache_dir):
-        filename = self._get_cache_filename(ccy, cache_dir)
+        ''' Returns (HistoryRates or None, cache file mtime). Reads the
+        binary cache file, or failing that the JSON one written by older
+        versions. '''
         h, timestamp = None, 0.0
-        if os.path.exists(filename):
+        for filename in (self._get_cache_filename(ccy, cache_dir), self._get_legacy_cache_filename(ccy, cache_dir)):
+            if not os.path.exists(filename):
+                continue
             timestamp = os.stat(filename).st_mtime
             try:
-                with open(filename, 'r', encoding='utf-8') as f:
-                    h = json.loads(f.read())
+                if filename.endswith('.rates'):
+                    with open(filename, 'rb') as f:
+                        h = HistoryRates.from_bytes(f.read())
+                else:
+                    with open(filename, 'r', encoding='utf-8') as f:
+                        h = HistoryRates.from_dict(json.loads(f.read()))
                 if h:
                     self.print_error("read_historical_rates: returning cached history from", filename)
+                    break
             except Exception as e:
                 self.print_error("read_historical_rates: error", repr(e))
         h = h or None
         return h, timestamp
 
     def _get_cache_filename(self, ccy, cache_dir):
+        return os.path.join(cache_dir, self.name() + '_' + ccy + '.rates')
+
+    def _get_legacy_cache_filename(self, ccy, cache_dir):
         return os.path.join(cache_dir, self.name() + '_' + ccy)
 
     @staticmethod
@@ -103,9 +209,12 @@ class ExchangeBase(PrintError):
         wroteBytes, filename = 0, '(none)'
         try:
             filename = self._get_cache_filename(ccy, cache_dir)
-            with open(filename, 'w', encoding='utf-8') as f:
-                f.write(json.dumps(h))
+            with open(filename, 'wb') as f:
+                f.write(h.to_bytes())
             wroteBytes = os.stat(filename).st_size
+            legacy_filename = self._get_legacy_cache_filename(ccy, cache_dir)
+            if os.path.exists(legacy_filename):
+                os.remove(legacy_filename)
         except Exception as e:
             self.print_error("cache_historical_rates error:", repr(e))
             return False
@@ -117,7 +226,7 @@ class ExchangeBase(PrintError):
         if not h or self._is_timestamp_old(timestamp):
             try:
                 self.print_error("requesting fx history for", ccy)
-                h = self.request_history(ccy)
+                h = HistoryRates.from_dict(self.request_history(ccy))
                 self.print_error("received fx history for", ccy)
                 if not h:
                     # Paranoia: No data; abort early rather than write out an
@@ -144,7 +253,8 @@ class ExchangeBase(PrintError):
         return []
 
     def historical_rate(self, ccy, d_t):
-        return self.history.get(ccy, {}).get(d_t.strftime('%Y-%m-%d'))
+        h = self.history.get(ccy)
+        return h.get(d_t.toordinal()) if h else None
 
     def get_currencies(self):
         rates = self.get_rates('')
@@ -513,6 +623,54 @@ class FxThread(ThreadJob):
             return PyDecimal(satoshis) / COIN * PyDecimal(rate)
 
     def timestamp_rate(self, timestamp):
-        from .util import timestamp_to_datetime
-        date = timestamp_to_datetime(timestamp)
-        return self.history_rate(date)
+        return self.timestamp_rates([timestamp])[0]
+
+    def timestamp_rates(self, timestamps):
+        ''' Returns the historical rates (PyDecimal or None) at the local
+        days of timestamps, like history_rate() does for single dates. '''
+        h = self.exchange.history.get(self.ccy)
+        today = date.today().toordinal()
+        memo = {}
+        ret = []
+        for day in day_ordinals(timestamps):
+            if day in memo:
+                ret.append(memo[day])
+                continue
+            rate = h.get(day) if h and day is not None else None
+            # Frequently there is no rate for today, until tomorrow :)
+            # Use spot quotes in that case
+            if rate is None and day is not None and today - day <= 2:
+                rate = self.exchange.quotes.get(self.ccy)
+                self.history_used_spot = True
+            memo[day] = rate = PyDecimal(rate) if rate is not None else None
+            ret.append(rate)
+        return ret
+
+    def historical_values(self, amounts, timestamps):
+        ''' Returns the fiat values of the satoshi amounts at timestamps, as
+        a list of PyDecimal or None. For many amounts at once, this is much
+        faster than calling historical_value() for each. '''
+        return [PyDecimal(satoshis) / COIN * rate if rate and satoshis is not None else None
+                for satoshis, rate in zip(amounts, self.timestamp_rates(timestamps))]
+
+    def historical_value_strs(self, amounts, timestamps):
+        ''' Like historical_values(), formatted as historical_value_str()
+        does. '''
+        # same as value_str(), without the per call overhead
+        prec = CCY_PRECISIONS.get(self.ccy, 2)
+        fmt_str = "{:,.%df}" % max(0, prec)
+        unknown, no_data = _("Unknown"), _("No data")
+        ret = []
+        for satoshis, rate in zip(amounts, self.timestamp_rates(timestamps)):
+            if satoshis is None:
+                ret.append(unknown)
+            elif not rate:
+                ret.append(no_data)
+            else:
+                value = PyDecimal(satoshis) / COIN * rate
+                try:
+                    value = round(value, prec)
+                except decimal.InvalidOperation:
+                    pass
+                ret.append(fmt_str.format(value))
+        return ret
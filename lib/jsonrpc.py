@@ -25,6 +25,8 @@
 
 from jsonrpclib.SimpleJSONRPCServer import SimpleJSONRPCServer, SimpleJSONRPCRequestHandler
 from base64 import b64decode
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import time
 
 from . import util
@@ -47,12 +49,25 @@ class RPCAuthUnsupportedType(Exception):
 
 # based on http://acooke.org/cute/BasicHTTPA0.html by andrew cooke
 class VerifyingJSONRPCServer(SimpleJSONRPCServer):
+    ''' Requests are accepted by whatever thread calls handle_request(), and
+    handled on a pool of max_workers threads. At most max_queue accepted
+    requests wait for a worker; past that, new requests are answered with
+    a 503 error right away. '''
 
-    def __init__(self, *args, rpc_user, rpc_password, **kargs):
+    def __init__(self, *args, rpc_user, rpc_password, max_workers=4, max_queue=16, **kargs):
 
         self.rpc_user = rpc_user
         self.rpc_password = rpc_password
 
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='RPCWorker')
+        self.slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self.stats_lock = threading.Lock()
+        self.stats = {
+            'workers': max_workers, 'queued': 0, 'active': 0, 'max_queued': 0,
+            'requests': 0, 'rejected': 0, 'queue_time': 0.0,
+        }
+        self.closing = False
+
         class VerifyingRequestHandler(SimpleJSONRPCRequestHandler):
             def parse_request(myself):
                 # first, call the original implementation which returns
@@ -73,6 +88,71 @@ class VerifyingJSONRPCServer(SimpleJSONRPCServer):
         SimpleJSONRPCServer.__init__(
             self, requestHandler=VerifyingRequestHandler, *args, **kargs)
 
+    def process_request(self, request, client_address):
+        if self.closing or not self.slots.acquire(blocking=False):
+            self.reject_request(request)
+            return
+        with self.stats_lock:
+            self.stats['queued'] += 1
+            self.stats['max_queued'] = max(self.stats['max_queued'], self.stats['queued'])
+        try:
+            self.executor.submit(self._process_request_worker, request, client_address, time.time())
+        except BaseException:
+            # executor was shut down
+            with self.stats_lock:
+                self.stats['queued'] -= 1
+            self.slots.release()
+            raise
+
+    def _process_request_worker(self, request, client_address, t_queued):
+        with self.stats_lock:
+            self.stats['queued'] -= 1
+            self.stats['active'] += 1
+            self.stats['requests'] += 1
+            self.stats['queue_time'] += time.time() - t_queued
+        try:
+            if self.closing:
+                # queued when the server closed
+                self.reject_request(request)
+            else:
+                self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self.stats_lock:
+                self.stats['active'] -= 1
+            self.slots.release()
+
+    def reject_request(self, request):
+        ''' Answers request with a 503 error without handling it, and closes
+        the connection. '''
+        with self.stats_lock:
+            self.stats['rejected'] += 1
+        try:
+            # read what the client sent, as closing the socket with unread
+            # data would reset the connection before it gets the response
+            request.settimeout(0.1)
+            request.recv(65536)
+            request.sendall(b'HTTP/1.0 503 Service Unavailable\r\n'
+                            b'Content-Length: 0\r\nConnection: close\r\n\r\n')
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def get_stats(self):
+        ''' Returns a snapshot of the request queue counters. '''
+        with self.stats_lock:
+            return dict(self.stats)
+
+    def server_close(self):
+        ''' Stops accepting requests, rejects the queued ones and waits for
+        the running ones to finish, so that no RPC runs once the caller
+        goes on to stop the wallets and the network. '''
+        self.closing = True
+        super().server_close()
+        self.executor.shutdown(wait=True)
+
     def authenticate(self, headers):
         if self.rpc_password == '':
             # RPC authentication is disabled
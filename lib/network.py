@@ -1844,14 +1844,15 @@ class Network(util.DaemonThread):
         return _("An error occurred broadcasting the transaction")
 
     # Used by the verifier job.
-    def get_merkle_for_transaction(self, tx_hash, tx_height, callback, max_qlen=10):
+    def get_merkle_for_transaction(self, tx_hash, tx_height, callback, max_qlen=10, interface=None):
         ''' Asynchronously enqueue a request for a merkle proof for a tx.
             Note that the callback param is required.
             May return None if too many requests were enqueued (max_qlen) or
             if there is no interface.
-            Client code should handle the None return case appropriately. '''
+            Client code should handle the None return case appropriately.
+            `interface` is as for queue_request (eg 'random'). '''
         return self.queue_request('blockchain.transaction.get_merkle',
-                                  [tx_hash, tx_height],
+                                  [tx_hash, tx_height], interface,
                                   callback=callback, max_qlen=max_qlen)
 
     def get_proxies(self):
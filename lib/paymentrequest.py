@@ -24,6 +24,7 @@
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 import hashlib
+import os
 import sys
 import time
 import traceback
@@ -48,6 +49,7 @@ from . import x509
 from . import rsakey
 
 from .address import Address, PublicKey
+from .caches import ExpiringCache
 from .bitcoin import TYPE_ADDRESS
 from .util import print_error, bh2u, bfh, PrintError
 from .util import FileImportFailed, FileImportFailedEncrypted
@@ -62,11 +64,22 @@ ACK_HEADERS_SLP = {'Content-Type':'application/simpleledger-payment','Accept':'a
 ca_path = requests.certs.where()
 ca_list = None
 ca_keyID = None
+_ca_lock = threading.Lock()
+
+def _ca_index_path():
+    from .simple_config import get_config
+    config = get_config()
+    return os.path.join(config.path, 'cache', 'ca_index.json') if config else None
 
 def load_ca_list():
     global ca_list, ca_keyID
-    if ca_list is None:
-        ca_list, ca_keyID = x509.load_certificates(ca_path)
+    with _ca_lock:
+        if ca_list is None:
+            store = x509.CertificateStore(ca_path, _ca_index_path())
+            ca_list, ca_keyID = store, store.keyIDs
+
+# (SHA-256 fingerprints of the certificates of a chain) -> (X509 of the first one, CA)
+_verified_chains = ExpiringCache(maxlen=100, name='Verified certificate chains', timeout=3600)
 
 
 
@@ -394,6 +407,12 @@ def sign_request_with_alias(pr, alias, alias_privkey):
 def verify_cert_chain(chain):
     """ Verify a chain of certificates. The last certificate is the CA"""
     load_ca_list()
+    fingerprints = tuple(hashlib.sha256(c).digest() for c in chain)
+    verified = _verified_chains.get(fingerprints)
+    if verified:
+        x, ca = verified
+        x.check_date()
+        return x, ca
     # parse the chain
     cert_num = len(chain)
     x509_chain = []
@@ -442,6 +461,7 @@ def verify_cert_chain(chain):
         if not verify:
             raise BaseException("Certificate not Signed by Provided CA Certificate Chain")
 
+    _verified_chains.put(fingerprints, (x509_chain[0], ca))
     return x509_chain[0], ca
 
 
@@ -21,11 +21,15 @@ slp_validator_0x01).
 
 import sys
 import threading
+import time
 import queue
 import traceback
 import weakref
 import collections
+import heapq
+import itertools
 from abc import ABC, abstractmethod
+from .caches import ExpiringCache
 from .transaction import Transaction
 from .util import PrintError
 
@@ -58,9 +62,14 @@ class ValidatorGeneric(ABC):
         False - only call validate() once per tx, when all inputs are concluded.
         True - call validate() repeatedly, starting when all inputs are downloaded.
         (only useful if this can provide early validity conclusions)
+    - Set `undecided_waits` to True if validate() may stay undecided even
+      once all inputs are concluded; such txes are put back in waiting state
+      rather than raising an error. (NFT1 uses this while its parent token
+      is being validated.)
     """
 
     prevalidation = False
+    undecided_waits = False
 
     validity_states = {
         0: 'Unknown',
@@ -147,6 +156,129 @@ class ValidatorGeneric(ABC):
 def emptygetter(i):
     raise KeyError
 
+class DownloadLimiter:
+    """
+    Caps the number of tx download requests in flight at once, across all
+    the jobs sharing this object (by default: all jobs in the process).
+
+    A job blocks only while it holds no slots, so jobs can't deadlock each
+    other waiting for slots. A single job holds at most `per_job` slots, so
+    that one big DAG can't starve the jobs of other tokens.
+    """
+    poll_interval = 0.5  # seconds between checks of should_stop while blocked
+
+    def __init__(self, total=64, per_job=16):
+        self.total = total
+        self.per_job = per_job
+        self._sem = threading.BoundedSemaphore(total)
+
+    def acquire(self, wanted, held, should_stop=None):
+        """ Grab up to `wanted` more slots for a job currently holding `held`
+        slots, and return how many were granted. If `held` is 0, this blocks
+        until at least 1 slot is granted, or until `should_stop()` returns
+        True, in which case 0 is returned. """
+        limit = min(wanted, self.per_job - held)
+        granted = 0
+        if limit > 0 and held == 0:
+            while not self._sem.acquire(timeout=self.poll_interval):
+                if should_stop and should_stop():
+                    return 0
+            granted = 1
+        while granted < limit and self._sem.acquire(blocking=False):
+            granted += 1
+        return granted
+
+    def release(self, n):
+        for _ in range(n):
+            self._sem.release()
+
+download_limiter = DownloadLimiter()
+
+class TxFetcher:
+    """
+    Process-wide single-flight fetcher for raw txes.
+
+    Concurrent requests for the same txid (e.g. from the jobs of sibling txes,
+    or from NFT1 group and child validation) attach to one outstanding network
+    request, and its response is handed to every requester. Recent results
+    are also kept for a little while, so that jobs starting shortly after
+    don't download them again.
+    """
+    method = 'blockchain.transaction.get'
+    stale_after = 30.0  # seconds after which an unanswered request is sent again
+
+    def __init__(self, cache_size=2000):
+        self.lock = threading.Lock()
+        self._inflight = dict()  # txid -> [time_sent, [callbacks]]
+        self._recent = ExpiringCache(maxlen=cache_size, name="SLP TxFetcher", timeout=120)
+        self.requests_sent = 0
+        self.requests_shared = 0  # answered by an in-flight request or a recent result
+        self._deliveries = queue.Queue()  # (callback, response) for recent results
+        self._delivery_thread = None
+
+    def fetch(self, network, txid, callback):
+        """ Calls callback(response) once the tx is available, where response
+        is a network response dict (with 'result' or 'error'). This always
+        happens later in another thread: the network thread, or for a recent
+        result, the fetcher's delivery thread. """
+        raw = self._recent.get(txid)
+        if raw is not None:
+            with self.lock:
+                self.requests_shared += 1
+                if self._delivery_thread is None:
+                    self._delivery_thread = threading.Thread(target=self._delivery_loop,
+                                                             name="SLP TxFetcher", daemon=True)
+                    self._delivery_thread.start()
+            self._deliveries.put((callback, {'method': self.method, 'params': [txid], 'result': raw}))
+            return
+        now = time.time()
+        with self.lock:
+            entry = self._inflight.get(txid)
+            if entry is None:
+                self._inflight[txid] = [now, [callback]]
+            else:
+                entry[1].append(callback)
+                if now - entry[0] < self.stale_after:
+                    self.requests_shared += 1
+                    return
+                # Never answered; ask again on behalf of everyone waiting.
+                entry[0] = now
+            self.requests_sent += 1
+        network.send([(self.method, [txid])], lambda resp: self._on_response(txid, resp))
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'requests_sent': self.requests_sent,
+                'requests_shared': self.requests_shared,
+                'in_flight': len(self._inflight),
+                'recent_cached': len(self._recent),
+            }
+
+    def _delivery_loop(self):
+        while True:
+            callback, resp = self._deliveries.get()
+            try:
+                callback(resp)
+            except Exception:
+                traceback.print_exc()
+
+    def _on_response(self, txid, resp):
+        with self.lock:
+            entry = self._inflight.pop(txid, None)
+        if entry is None:
+            # a re-sent request was answered already
+            return
+        if not resp.get('error') and resp.get('result'):
+            self._recent.put(txid, resp['result'])
+        for callback in entry[1]:
+            try:
+                callback(resp)
+            except Exception:
+                traceback.print_exc()
+
+tx_fetcher = TxFetcher()
+
 class ValidationJob:
     """
     Manages a job whose actions are held in mainloop().
@@ -154,8 +286,36 @@ class ValidationJob:
     This implementation does a basic breadth-first search.
     """
     download_timeout = 5
+    download_limiter = download_limiter
+    tx_fetcher = tx_fetcher
     downloads = 0
 
+    # Pending jobs with a higher priority get run first, see
+    # ValidationJobManager.prioritize
+    priority = 0
+
+    # Max number of txes prefetch() downloads for this job
+    prefetch_limit = 64
+    prefetched = False
+
+    # The arguments the job was made with, only jobs made with the same ones
+    # get coalesced, see ValidationJobManager.find_pending_job
+    make_args = None
+
+    # Keys of `stats`, see get_stats()
+    stat_keys = (
+        'nodes_loaded',        # txes loaded into the graph
+        'fetch_hook_hits',     # txes supplied by fetch_hook (wallet, graph search)
+        'graph_search_hits',   # ... of which from graph search results
+        'validitycache_hits',  # loaded txes whose validity was already known
+        'net_requested',       # txes requested from the network
+        'net_errors',          # error responses from the network
+        'time_run',            # seconds spent in run(), over all runs
+        'time_fetch',          # ... of which waiting on fetch_hook / network
+        'time_load',           # ... of which in load_tx (get_info parsing)
+        'time_sched',          # ... of which in run_sched (validation, depths)
+    )
+
     currentdepth = 0
     debugging_graph_state = False
 
@@ -217,19 +377,89 @@ class ValidationJob:
 
         self._statelock = threading.Lock()
 
-    def __repr__(self,):
+        # progress / throughput figures, see get_stats()
+        self.stats = collections.Counter()
+        self.stats_reported = collections.Counter()  # used by GraphContext to total up job stats
+        self.frontier_sizes = dict()  # depth -> number of txes requested at that depth
+        self._run_started = None
+
+    @property
+    def state(self):
         if self.running:
-            state = 'running'
-        else:
-            try:
-                state = 'stopped:%r'%(self.stop_reason,)
-            except AttributeError:
-                state = 'waiting'
-        return "<%s object (%s) for txids=%r ref=%r>"%(type(self).__qualname__, state, self.txids, self.ref and self.ref())
+            return 'running'
+        if self.has_never_run:
+            return 'waiting'
+        return 'stopped:%r'%(self.stop_reason,)
+
+    def __repr__(self,):
+        return "<%s object (%s) for txids=%r ref=%r>"%(type(self).__qualname__, self.state, self.txids, self.ref and self.ref())
+
+    def get_stats(self):
+        """ Returns a dict of progress and throughput figures for this job.
+        Safe to call from any thread (figures from a running job may be a
+        little inconsistent with each other). """
+        stats = {k: self.stats[k] for k in self.stat_keys}
+        started = self._run_started
+        elapsed = stats['time_run'] + (time.time() - started if started else 0.0)
+        loaded = stats['nodes_loaded']
+        stats.update(
+            root_txid = self.root_txid,
+            state = self.state,
+            priority = self.priority,
+            downloads = self.downloads,
+            depth = self.currentdepth,
+            frontier_sizes = dict(self.frontier_sizes),
+            elapsed = elapsed,
+            nodes_per_sec = loaded / elapsed if elapsed > 0 else 0.0,
+            validitycache_hit_rate = stats['validitycache_hits'] / loaded if loaded else 0.0,
+        )
+        return stats
 
     def belongs_to(self, ref):
         return ref is (self.ref and self.ref())
 
+    def prefetch(self):
+        """ Called by the job manager while this job is pending, so that its
+        downloads overlap with those of the jobs running before it. Walks the
+        ancestry of the root tx like mainloop() would, downloading up to
+        prefetch_limit txes through the shared tx_fetcher, where get_txes
+        later finds them. It only looks at raw txes and the validator's
+        get_info(), the graph is left to the job. The walk stops at txes the
+        graph already has or whose validity is known, and once the job runs.
+        """
+        if self.prefetched or not self.network or slp_gs_mgr.gs_enabled:
+            return
+        self.prefetched = True
+        wallet = self.ref and self.ref()
+        known = wallet.transactions if wallet is not None else {}
+        del wallet
+        seen = set()
+        def visit(txid):
+            if (txid in seen or len(seen) >= self.prefetch_limit or not self.has_never_run
+                    or txid in self.graph._nodes or txid in self.validitycache):
+                return
+            seen.add(txid)
+            tx = known.get(txid)
+            if tx is not None:
+                walk(tx)
+            else:
+                self.tx_fetcher.fetch(self.network, txid, on_response)
+        def on_response(resp):
+            raw = resp.get('result')
+            if raw:
+                walk(Transaction(raw))
+        def walk(tx):
+            try:
+                info = self.graph.validator.get_info(tx)
+            except Exception:
+                return
+            if info[0] == 'prune':
+                return
+            for txin, needed in zip(tx.inputs(), info[0]):
+                if needed:
+                    visit(txin['prevout_hash'])
+        visit(self.root_txid)
+
     def has_txid(self, txid):
         return txid in self.txids
 
@@ -245,6 +475,7 @@ class ValidationJob:
             self.running = True
             self.stop_reason = None
             self.has_never_run = False
+        self._run_started = time.time()
         try:
             retval = self.mainloop()
             try:
@@ -271,6 +502,8 @@ class ValidationJob:
             retval = 'crashed'
             raise
         finally:
+            self.stats['time_run'] += time.time() - self._run_started
+            self._run_started = None
             self.exited.set()
             with self._statelock:
                 self.stop_reason = retval
@@ -391,6 +624,7 @@ class ValidationJob:
             # f = open("dag-"+self.txids[0][0:5]+".txt","a")
             # f.write(txid+","+str(self.currentdepth)+",true,\n")
 
+            t0 = time.time()
             node = self.graph.get_node(txid)
             try:
                 val = self.validitycache[txid]
@@ -400,6 +634,11 @@ class ValidationJob:
                 node.load_tx(tx, cached_validity=val)
             except DoubleLoadException:
                 pass
+            else:
+                self.stats['nodes_loaded'] += 1
+                if val is not None:
+                    self.stats['validitycache_hits'] += 1
+            self.stats['time_load'] += time.time() - t0
 
         while True:
             if self.stopping:
@@ -420,17 +659,15 @@ class ValidationJob:
                 return "download limit reached"
 
 
-            # fetch all finite-depth nodes
-            waiting = self.graph.get_waiting(maxdepth=self.depth_limit - 1)
-            if len(waiting) == 0: # No waiting nodes at all ==> completed.
-                # This really shouldn't happen
-                self.graph.debug("exhausted graph without conclusion.")
-                return "inconclusive"
-
             # select all waiting txes at or below the current depth
-            interested_txids = {n.txid for n in waiting
-                                if (n.depth <= self.currentdepth)}
+            interested_txids = {n.txid for n in
+                                self.graph.get_waiting(maxdepth=min(self.currentdepth, self.depth_limit - 1))}
             if len(interested_txids) == 0:
+                if not self.graph.has_waiting(maxdepth=self.depth_limit - 1):
+                    # No finite-depth waiting nodes at all ==> completed.
+                    # This really shouldn't happen
+                    self.graph.debug("exhausted graph without conclusion.")
+                    return "inconclusive"
                 # current depth exhausted, so move up
                 self.currentdepth += 1
                 if self.currentdepth > self.depth_limit:
@@ -439,12 +676,18 @@ class ValidationJob:
                 self.graph.debug("moving to depth = %d", self.currentdepth)
                 continue
 
+            self.frontier_sizes[self.currentdepth] = self.frontier_sizes.get(self.currentdepth, 0) + len(interested_txids)
+
             # Download and load up results; this is the main command that
             # will take time in this loop.
+            t0, time_load0 = time.time(), self.stats['time_load']
             txids_missing = self.get_txes(interested_txids, dl_callback, skip_callback)
+            t1 = time.time()
+            self.stats['time_fetch'] += (t1 - t0) - (self.stats['time_load'] - time_load0)
 
             # do graph maintenance (ping() validation, depth recalculations)
             self.graph.run_sched()
+            self.stats['time_sched'] += time.time() - t1
 
             # print entire graph (could take a lot of time!)
             if self.debugging_graph_state:
@@ -473,8 +716,8 @@ class ValidationJob:
 
     def get_txes(self, txid_iterable, dl_callback, skip_callback, errors='print'):
         """
-        Get multiple txes 'in parallel' (requests all sent at once), and
-        block while waiting. We first take txes via fetch_hook, and only if
+        Get multiple txes 'in parallel' (requests sent in windows bounded by
+        `download_limiter`), and block while waiting. We first take txes via fetch_hook, and only if
         missing do we then we ask the network.
 
         As they are received, we call `dl_callback(tx)` in the current thread.
@@ -491,6 +734,7 @@ class ValidationJob:
         if self.fetch_hook:
             txns_cache = self.fetch_hook(txid_set, self)
             cached = list(txns_cache)
+            self.stats['fetch_hook_hits'] += len(cached)
             for tx in cached:
                 # remove known txes from list
                 txid = tx.txid_fast()
@@ -525,49 +769,69 @@ class ValidationJob:
                 txid_set.clear()
                 return txid_set
         
-        # build requests list from remaining txids.
-        requests = []
-        if self.network:
-            for txid in sorted(txid_set):
-                requests.append(('blockchain.transaction.get', [txid]))
-
-            if len(requests) > 0:
-                q = queue.Queue()
-                self.network.send(requests, q.put)
+        # Requests are sent in windows, as slots in the shared
+        # download_limiter free up.
+        to_request = sorted(txid_set) if self.network else []
+        self.stats['net_requested'] += len(to_request)
+        q = queue.Queue()
+        inflight = 0
+        def send_more():
+            nonlocal inflight
+            n = self.download_limiter.acquire(len(to_request), inflight, lambda: self.stopping)
+            if n:
+                batch = to_request[:n]
+                del to_request[:n]
+                inflight += n
+                for txid in batch:
+                    self.tx_fetcher.fetch(self.network, txid, q.put)
+
+        if to_request:
+            send_more()
 
         # Now that the net request is going, start processing cached txes.
         for tx in cached:
             dl_callback(tx)
 
         # And start processing downloaded txes:
-        for _ in requests: # fetch as many responses as were requested.
-            try:
-                resp = q.get(True, self.download_timeout)
-            except queue.Empty: # timeout
-                break
-            if resp.get('error'):
-                if errors=="print":
-                    print("Tx request error:", resp.get('error'), file=sys.stderr)
-                elif errors=="raise":
-                    raise RuntimeError("Tx request error", resp.get('error'))
-                else:
-                    raise ValueError(errors)
-                continue
-            raw = resp.get('result')
-            self.downloads += 1
-            tx = Transaction(raw)
-            txid = tx.txid_fast()
-            try:
-                txid_set.remove(txid)
-            except KeyError:
-                if errors=="print":
-                    print("Received un-requested txid! Ignoring.", txid, file=sys.stderr)
-                elif errors=="raise":
-                    raise RuntimeError("Received un-requested txid!", txid)
+        try:
+            while True:
+                if to_request:
+                    send_more()
+                if not inflight:
+                    break
+                try:
+                    resp = q.get(True, self.download_timeout)
+                except queue.Empty: # timeout
+                    break
+                inflight -= 1
+                self.download_limiter.release(1)
+                if resp.get('error'):
+                    self.stats['net_errors'] += 1
+                    if errors=="print":
+                        print("Tx request error:", resp.get('error'), file=sys.stderr)
+                    elif errors=="raise":
+                        raise RuntimeError("Tx request error", resp.get('error'))
+                    else:
+                        raise ValueError(errors)
+                    continue
+                raw = resp.get('result')
+                self.downloads += 1
+                tx = Transaction(raw)
+                txid = tx.txid_fast()
+                try:
+                    txid_set.remove(txid)
+                except KeyError:
+                    if errors=="print":
+                        print("Received un-requested txid! Ignoring.", txid, file=sys.stderr)
+                    elif errors=="raise":
+                        raise RuntimeError("Received un-requested txid!", txid)
+                    else:
+                        raise ValueError(errors)
                 else:
-                    raise ValueError(errors)
-            else:
-                dl_callback(tx)
+                    dl_callback(tx)
+        finally:
+            # give back the slots of requests we are no longer waiting on
+            self.download_limiter.release(inflight)
 
         return txid_set
 
@@ -575,7 +839,14 @@ class ValidationJob:
 class ValidationJobManager(PrintError):
     """
     A single thread that processes validation jobs sequentially.
+
+    Jobs share their token graph, which isn't thread safe, so they run one
+    at a time. While one runs, the next `prefetch_jobs` jobs download their
+    txes ahead of time (see ValidationJob.prefetch), so that the download
+    phases of the jobs overlap.
     """
+    prefetch_jobs = 4
+
     def __init__(self, threadname="ValidationJobManager", graph_context=None, exit_when_done=False):
         # ---
         self.graph_context = graph_context
@@ -586,6 +857,8 @@ class ValidationJobManager(PrintError):
         self.jobs_stopped = weakref.WeakSet()  # set of jobs stopped by calling .stop(), or that terminated abnormally with an error and/or crash
         self.jobs_paused   = []   # list of jobs that stopped by calling .pause()
         self.all_jobs = weakref.WeakSet()
+        self._graph_turns = weakref.WeakKeyDictionary()  # TokenGraph -> when a job for it last started, for fairness
+        self._turn_ctr = 0
         self.wakeup = threading.Event()  # for kicking the mainloop to wake up if it has fallen asleep
         self.exited = threading.Event()  # for synchronously waiting for jobmgr to exit
         # ---
@@ -652,6 +925,68 @@ class ValidationJobManager(PrintError):
                         ret.append(job)
         return ret
 
+    def find_pending_job(self, txid, ref, make_args=None):
+        """ Returns a pending (not yet running) job for root txid `txid` that
+        belongs to `ref` and was made with the same `make_args`, or None.
+        Used to coalesce duplicate requests. """
+        with self.jobs_lock:
+            for job in self.jobs_pending:
+                if job.root_txid == txid and job.belongs_to(ref) and job.make_args == make_args:
+                    return job
+
+    def prioritize(self, txids, priority=1):
+        """ Raise the priority of pending jobs for any of `txids` (e.g.
+        because they are visible in the GUI). Returns the number of jobs
+        affected. """
+        txids = set(txids)
+        ctr = 0
+        with self.jobs_lock:
+            for job in self.jobs_pending:
+                if job.root_txid in txids and job.priority < priority:
+                    job.priority = priority
+                    ctr += 1
+        return ctr
+
+    def _job_order_key(self):
+        """ Must be called with jobs_lock held. Returns the sort key of the
+        indices of jobs_pending, in the order they get run: highest priority
+        first, then the job whose token graph has waited longest for a turn,
+        then oldest first. """
+        pending, turns = self.jobs_pending, self._graph_turns
+        return lambda i: (-pending[i].priority, turns.get(pending[i].graph, -1), i)
+
+    def _pop_next_job(self):
+        """ Must be called with jobs_lock held. Picks the next job to run,
+        see _job_order_key. """
+        if not self.jobs_pending:
+            return None
+        best = min(range(len(self.jobs_pending)), key=self._job_order_key())
+        turns = self._graph_turns
+        job = self.jobs_pending.pop(best)
+        self._turn_ctr += 1
+        turns[job.graph] = self._turn_ctr
+        return job
+
+    def _prefetch_upcoming(self):
+        """ Starts the downloads of the next prefetch_jobs pending jobs. """
+        with self.jobs_lock:
+            upcoming = [self.jobs_pending[i] for i in
+                        heapq.nsmallest(self.prefetch_jobs, range(len(self.jobs_pending)),
+                                        key=self._job_order_key())]
+        for job in upcoming:
+            job.prefetch()
+
+    def get_unfinished_jobs(self):
+        """ Returns a list of the running, pending and paused jobs. """
+        with self.jobs_lock:
+            job = self.job_current
+            return ([job] if job is not None else []) + self.jobs_pending + self.jobs_paused
+
+    def has_unfinished_jobs_for(self, graph):
+        """ Returns True if a job for `graph` is currently running, pending
+        or paused. """
+        return any(job.graph is graph for job in self.get_unfinished_jobs())
+
     def pause_job(self, job):
         """
         Returns True if job was running or pending.
@@ -705,11 +1040,9 @@ class ValidationJobManager(PrintError):
                 with self.jobs_lock:
                     self.wakeup.clear()
                     has_paused_jobs = bool(len(self.jobs_paused))
-                    try:
-                        self.job_current = self.jobs_pending.pop(0)
-                    except IndexError:
-                        # prepare to sleep, outside lock
-                        self.job_current = None
+                    # (if None, prepare to sleep, outside lock)
+                    self.job_current = self._pop_next_job()
+                self._prefetch_upcoming()
                 if self.job_current is None:
                     if self._exit_when_done and not has_paused_jobs and ran_ctr:
                         # we already finished our enqueued jobs, nothing is paused, so just exit since _exit_when_done == True
@@ -789,6 +1122,12 @@ class TokenGraph:
     Rather than call-based recursion (cascades of notifications running up and
     down the DAG) we use a task scheduler, provided by `add_ping()`,
     `add_recalc_depth()` and `run_sched()`.
+
+    Waiting nodes are kept in buckets by depth, so that getting the next BFS
+    frontier only looks at the shallow buckets rather than at every node.
+    Buckets are cleaned lazily: a node is (re-)added whenever it may have
+    changed depth while waiting, and entries whose depth no longer matches or
+    that stopped waiting are dropped when scanned.
     """
     debugging = False
 
@@ -799,11 +1138,15 @@ class TokenGraph:
 
         self.root = NodeRoot(self)
 
-        self._waiting_nodes = []
+        self._waiting_buckets = dict()  # depth -> {Node: None}, see _scan_waiting
 
-        # requested callbacks
-        self._sched_ping = set()
-        self._sched_recalc_depth = set()
+        # requested callbacks, as heaps of (priority, seq, node) with a set
+        # to skip duplicates
+        self._sched_seq = itertools.count()
+        self._sched_ping = []
+        self._sched_ping_set = set()
+        self._sched_recalc_depth = []
+        self._sched_recalc_depth_set = set()
 
         # create singletons for pruning
         self.prunednodes = {v:NodeInactive(v, None) for v in validator.validity_states.keys()}
@@ -833,62 +1176,91 @@ class TokenGraph:
         try:
             node = self._nodes[txid]
         except KeyError:
+            txid = sys.intern(txid)  # share the string with the wallet & other graphs
             node = Node(txid, self)
             self._nodes[txid] = node
-            self._waiting_nodes.append(node)
+            self.add_waiting(node)
         return node
 
     def replace_node(self, txid, replacement):
         self._nodes[txid] = replacement  # threadsafe
 
+    def add_waiting(self, node):
+        """ Called when a node enters waiting state or changes depth while
+        waiting. """
+        try:
+            bucket = self._waiting_buckets[node.depth]
+        except KeyError:
+            bucket = self._waiting_buckets[node.depth] = dict()
+        bucket[node] = None
+
     def add_ping(self, node):
-        self._sched_ping.add(node)  # threadsafe
+        if node in self._sched_ping_set:
+            return
+        self._sched_ping_set.add(node)
+        # deepest first: parents conclude before we look at their children
+        heapq.heappush(self._sched_ping, (-node.depth, next(self._sched_seq), node))
+
     def add_recalc_depth(self, node, depthpriority):
-        # currently ignoring depthpriority
-        self._sched_recalc_depth.add(node)  # threadsafe
+        if node in self._sched_recalc_depth_set:
+            return
+        self._sched_recalc_depth_set.add(node)
+        # shallowest first: depths propagate away from the root
+        heapq.heappush(self._sched_recalc_depth, (depthpriority, next(self._sched_seq), node))
 
     def run_sched(self):
         """ run the pings scheduled by add_ping() one at a time, until the
-        schedule list is empty (note: things can get added/re-added during run).
+        schedule is empty (note: things can get added/re-added during run).
 
         then do the same for stuff added by add_recalc_depth().
 
-        TODO: consider making this depth prioritized to reduce redundant work.
+        Pings run deepest node first, and depth recalculations in order of
+        their depth priority, to reduce redundant work.
         """
-        # should be threadsafe without lock (pop() is atomic)
-        while True:
-            try:
-                node = self._sched_ping.pop()
-            except KeyError:
-                return
+        while self._sched_ping:
+            node = heapq.heappop(self._sched_ping)[2]
+            self._sched_ping_set.discard(node)
             node.ping()
-        while True:
-            try:
-                node = self._sched_recalc_depth.pop()
-            except KeyError:
-                return
+        while self._sched_recalc_depth:
+            node = heapq.heappop(self._sched_recalc_depth)[2]
+            self._sched_recalc_depth_set.discard(node)
             node.recalc_depth()
 
-    def get_waiting(self, maxdepth=INF_DEPTH):
-        """ Return a list of waiting nodes (that haven't had load_tx called
-        yet). Optional parameter specifying maximum depth. """
-        # with self._lock:
-        # First, update the _waiting_nodes list.
-        waiting_actual = [node for node in self._waiting_nodes if node.waiting]
+    def _scan_waiting(self, maxdepth):
+        """ Yields the waiting nodes with depth <= maxdepth, shallowest first,
+        dropping stale bucket entries along the way. """
+        buckets = self._waiting_buckets
+        for depth in sorted(d for d in buckets if d <= maxdepth):
+            bucket = buckets[depth]
+            for node in list(bucket):
+                if node.waiting and node.depth == depth:
+                    yield node
+                else:
+                    del bucket[node]
+            if not bucket:
+                del buckets[depth]
 
+    def _waiting_fallback(self, maxdepth):
         # This is needed to handle an edge case in NFT1 validation
         # this occurs when the child genesis is paused and is also the root_txid of the job
-        from .slp_validator_0x01_nft1 import Validator_NFT1
-        if isinstance(self.validator, Validator_NFT1) and len(waiting_actual) == 0:
-            waiting_actual.extend([conn.parent for conn in self.root.conn_parents if conn.parent.waiting])
+        if not self.validator.undecided_waits:
+            return []
+        for node in self._scan_waiting(INF_DEPTH):
+            return []
+        return [conn.parent for conn in self.root.conn_parents
+                if conn.parent.waiting and conn.parent.depth <= maxdepth]
 
-        self._waiting_nodes = waiting_actual
+    def get_waiting(self, maxdepth=INF_DEPTH):
+        """ Return a list of waiting nodes (that haven't had load_tx called
+        yet), shallowest first. Optional parameter specifying maximum depth. """
+        return list(self._scan_waiting(maxdepth)) or self._waiting_fallback(maxdepth)
 
-        if maxdepth == INF_DEPTH:
-            return list(waiting_actual) # return copy
-        else:
-            return [node for node in waiting_actual
-                    if node.depth <= maxdepth]
+    def has_waiting(self, maxdepth=INF_DEPTH):
+        """ Like `bool(self.get_waiting(maxdepth))` but stops at the first
+        waiting node found. """
+        for node in self._scan_waiting(maxdepth):
+            return True
+        return bool(self._waiting_fallback(maxdepth))
 
     def get_active(self):
         return [node for node in self._nodes.values() if node.active]
@@ -952,7 +1324,14 @@ class Node:
     The node becomes inactive when a conclusion is reached: either
     pruned, invalid, or valid. When this occurs, the node replaces itself
     with a NodeInactive object (more compact).
+
+    Big DAGs can have many thousands of these alive at once, so we use
+    __slots__ to avoid a per-instance __dict__.
     """
+    __slots__ = ('txid', 'graph', 'conn_children', 'conn_parents', 'depth',
+                 'waiting', 'active', 'validity', 'myinfo', 'outputs',
+                 'replacement')
+
     def __init__(self, txid, graph):
         self.txid = txid
         self.graph = graph
@@ -1001,9 +1380,11 @@ class Node:
         if newdepth < olddepth:
             # found a shorter path from root
             self.depth = newdepth
+            if self.waiting:
+                self.graph.add_waiting(self)
             for c in self.conn_parents:
-                if c.parent.depth == 1 + olddepth:
-                    # parent may have been hanging off our depth value.
+                if c.parent.depth > 1 + newdepth:
+                    # parent now has a shorter path through us too.
                     self.graph.add_recalc_depth(c.parent, newdepth)
         return
 
@@ -1134,6 +1515,8 @@ class Node:
         olddepth = self.depth
         if newdepth != olddepth:
             self.depth = newdepth
+            if self.waiting:
+                self.graph.add_waiting(self)
             depthpriority = 1 + min(olddepth, newdepth)
             for c in self.conn_parents:
                 self.graph.add_recalc_depth(c.parent, depthpriority)
@@ -1186,9 +1569,11 @@ class Node:
         ret = validator.validate(self.myinfo, valinfo)
 
         if ret is None: # undecided
-            from .slp_validator_0x01_nft1 import Validator_NFT1
-            if isinstance(validator, Validator_NFT1):
+            if validator.undecided_waits:
+                # go back to waiting, so that we get loaded again (and
+                # re-validated) when the job resumes
                 self.waiting = True
+                self.graph.add_waiting(self)
                 return
             if not anyactive:
                 raise RuntimeError("Undecided with finalized parents",
@@ -1201,6 +1586,7 @@ class Node:
 
 
 class NodeRoot: # Special root, only one of these is created per TokenGraph.
+    __slots__ = ('graph', 'conn_parents')
     depth = -1
 
     def __init__(self, graph):
@@ -33,7 +33,6 @@ from .transaction import Transaction
 from .caches import ExpiringCache
 from electroncash import networks
 
-from . import slp_validator_0x01
 
 class _GraphSearchJob:
     def __init__(self, valjob):
@@ -142,8 +141,7 @@ class _SlpGraphSearchManager:
         self.search_queue = queue.Queue()  # TODO: make this a PriorityQueue based on dag size
 
         self.threadname = threadname
-        self.search_thread = threading.Thread(target=self.mainloop, name=self.threadname+'/search', daemon=True)
-        self.search_thread.start()
+        self.search_thread = None  # started by the first new_search(), see _start_thread()
         
         self.bytes_downloaded = 0 # this is the total number of bytes downloaded by graph search
 
@@ -191,12 +189,21 @@ class _SlpGraphSearchManager:
         """
         txid = valjob.root_txid
         with self.lock:
+            self._start_thread()
             if txid not in self._search_jobs.keys():
                 job = _GraphSearchJob(valjob)
                 self._search_jobs[txid] = job
                 self.search_queue.put(job)
             return self._search_jobs[txid]
 
+    def _start_thread(self):
+        ''' Starts the search thread if it's not running yet. The thread is
+        only started once there is something to search for, so that
+        importing this module doesn't start it. Call with self.lock held. '''
+        if not self.search_thread:
+            self.search_thread = threading.Thread(target=self.mainloop, name=self.threadname+'/search', daemon=True)
+            self.search_thread.start()
+
     def toggle_graph_search(self, enable):
         if self.gs_enabled == enable:
             return
@@ -210,6 +217,7 @@ class _SlpGraphSearchManager:
                     wallets.add(job.valjob.ref())
 
         # kill the current validator activity
+        from . import slp_validator_0x01  # imported here, it imports us (via slp_dagging)
         slp_validator_0x01.shared_context.kill()
 
         # delete all the gs jobs
@@ -36,9 +36,10 @@ class ProxyQuerier:
 
         self.pastresults = dict()
 
-        # Kick off the thread
+        # The thread is kicked off by the first add_job(), so that importing
+        # this module doesn't start it.
         self.thread = threading.Thread(target=self.mainloop, name=threadname, daemon=True)
-        self.thread.start()
+        self.thread_lock = threading.Lock()
 
     def mainloop(self,):
         try:
@@ -81,6 +82,9 @@ class ProxyQuerier:
         """ Callback called as `callback(txids, results)`
         where txids is set and results is txid-keyed dict. """
         txids = frozenset(txids)
+        with self.thread_lock:
+            if self.thread.ident is None:  # not started yet
+                self.thread.start()
         self.queue.put((txids, callback))
         return txids
 
@@ -4,6 +4,7 @@ Validate SLP token transactions with declared version 0x01.
 This uses the graph searching mechanism from slp_dagging.py
 """
 
+import collections
 import threading
 import queue
 from typing import Tuple, List
@@ -27,13 +28,22 @@ class GraphContext(PrintError):
     If is_parallel=True, will create 1 job manager (thread) per tokenid it is
     validating. '''
 
+    # Soft cap on the number of tx nodes held by all the graphs of this
+    # context. Past it, graphs with no unfinished jobs are dropped, least
+    # recently used first. Their conclusions are kept in the wallets'
+    # validity caches, so validating that token again later is cheap.
+    max_graph_nodes = 250000
+
     def __init__(self, name='GraphContext', is_parallel=False):
         # Global db for shared graphs (each token_id_hex has its own graph).
         self.graph_db_lock = threading.Lock()
-        self.graph_db = dict()   # token_id_hex -> TokenGraph
+        self.graph_db = collections.OrderedDict()   # token_id_hex -> TokenGraph, in LRU order
         self.is_parallel = is_parallel
         self.job_mgrs = weakref.WeakValueDictionary()   # token_id_hex -> ValidationJobManager (only used if is_parallel, otherwise self.job_mgr is used)
         self.name = name
+        # Totals of ValidationJob.stats over all the job runs of this context
+        self.stats_lock = threading.Lock()
+        self.stats = collections.Counter()
         self._setup_job_mgr()
 
     def diagnostic_name(self):
@@ -69,7 +79,7 @@ class GraphContext(PrintError):
         otherwise the shared job manager is used.'''
         with self.graph_db_lock:
             try:
-                return self.graph_db[token_id_hex], self._get_or_make_mgr(token_id_hex)
+                return self._lookup_graph(token_id_hex), self._get_or_make_mgr(token_id_hex)
             except KeyError:
                 pass
 
@@ -77,10 +87,60 @@ class GraphContext(PrintError):
 
             graph = TokenGraph(val)
 
-            self.graph_db[token_id_hex] = graph
+            self._add_graph(token_id_hex, graph)
 
             return graph, self._get_or_make_mgr(token_id_hex)
 
+    def _lookup_graph(self, token_id_hex) -> TokenGraph:
+        ''' Helper: This must be called with self.graph_db_lock held.
+        Returns the graph for token_id_hex, marking it as recently used.
+        Raises KeyError if there is no such graph. '''
+        graph = self.graph_db[token_id_hex]
+        self.graph_db.move_to_end(token_id_hex)
+        return graph
+
+    def _add_graph(self, token_id_hex, graph):
+        ''' Helper: This must be called with self.graph_db_lock held.
+        Adds a new graph, then evicts idle graphs if we are over the
+        max_graph_nodes budget. '''
+        self.graph_db[token_id_hex] = graph
+        self._evict_graphs(keep=graph)
+
+    def _evict_graphs(self, keep=None):
+        ''' Helper: This must be called with self.graph_db_lock held.
+        Drops graphs with no unfinished jobs, least recently used first, until
+        the graphs hold no more than max_graph_nodes nodes. The graph `keep`
+        is never dropped. With is_parallel=True, the job manager of a dropped
+        graph is killed too. '''
+        total = sum(len(g._nodes) for g in self.graph_db.values())
+        if total <= self.max_graph_nodes:
+            return
+        for tid, g in list(self.graph_db.items()):
+            if total <= self.max_graph_nodes:
+                break
+            if g is keep:
+                continue
+            job_mgr = self.job_mgr or self.job_mgrs.get(tid)
+            if job_mgr and job_mgr.has_unfinished_jobs_for(g):
+                continue
+            # We don't reset() the graph since finished jobs that callers
+            # still hold may want to look at their nodes; it gets garbage
+            # collected once those are gone.
+            del self.graph_db[tid]
+            if job_mgr and job_mgr is not self.job_mgr:
+                # it's idle, so kill() just ends its thread
+                del self.job_mgrs[tid]
+                job_mgr.kill()
+            total -= len(g._nodes)
+            self.print_error(f"evicted graph for {tid} ({len(g._nodes)} nodes)")
+
+    def _check_graph_budget(self, job):
+        ''' Job callback: graphs grow as their jobs run, so once a job
+        stopped, evict idle graphs if we went over the max_graph_nodes
+        budget. '''
+        with self.graph_db_lock:
+            self._evict_graphs(keep=job.graph)
+
     def kill_graph(self, token_id_hex):
         ''' Reset a graph. This will stop all the jobs for that token_id_hex. '''
         with self.graph_db_lock:
@@ -169,6 +229,15 @@ class GraphContext(PrintError):
 
         txid = tx.txid_fast()
 
+        make_args = (debug, reset, kwargs)
+        if not reset:
+            # coalesce with an identical job that hasn't started yet
+            job = job_mgr.find_pending_job(txid, wallet, make_args)
+            if job is not None and job.graph is graph:
+                if callback_done:
+                    job.add_callback(callback_done)
+                return job
+
         num_proxy_requests = 0
         proxyqueue = queue.Queue()
 
@@ -199,6 +268,7 @@ class GraphContext(PrintError):
                 txn = gs_job.get_tx(txid)
                 if txn:
                     l.append(txn)
+                    val_job.stats['graph_search_hits'] += 1
                 else:
                     try: l.append(wallet.transactions[txid])
                     except KeyError: pass
@@ -234,12 +304,70 @@ class GraphContext(PrintError):
                             depth_limit=limit_depth,
                             debug=debug, ref=wallet,
                             **kwargs)
+        job.make_args = make_args
         job.add_callback(done_callback)
+        job.add_callback(self._record_job_stats)
+        job.add_callback(self._check_graph_budget)
+        if callback_done:
+            job.add_callback(callback_done)
 
-        job_mgr.add_job(job)
+        with self.graph_db_lock:
+            # The graph may have been evicted since setup_job(), killing its
+            # job manager if is_parallel=True. Put it back, and add the job to
+            # the token's current job manager while holding the lock, so that
+            # it can't be evicted before the job is known to its manager.
+            token_id_hex = graph.validator.token_id_hex
+            self.graph_db.setdefault(token_id_hex, graph)
+            job_mgr = self._get_or_make_mgr(token_id_hex)
+            job_mgr.add_job(job)
 
         return job
 
+    def _record_job_stats(self, job):
+        ''' Job callback: adds what the job did since it last stopped to
+        this context's totals. '''
+        stats = job.stats.copy()
+        delta = stats.copy()
+        delta.subtract(job.stats_reported)
+        job.stats_reported = stats
+        with self.stats_lock:
+            self.stats.update(delta)
+            self.stats['job_runs'] += 1
+
+    def _get_job_mgrs(self) -> List[ValidationJobManager]:
+        if self.job_mgr:
+            return [self.job_mgr]
+        with self.graph_db_lock:
+            return list(self.job_mgrs.values())
+
+    def get_stats(self) -> dict:
+        ''' Returns a dict of validation progress and throughput figures:
+        totals over all finished job runs, a summary per token graph, and the
+        stats of each running, pending or paused job. '''
+        with self.graph_db_lock:
+            graphs = {token_id_hex: len(graph._nodes)
+                      for token_id_hex, graph in self.graph_db.items()}
+        jobs = [job.get_stats()
+                for job_mgr in self._get_job_mgrs()
+                for job in job_mgr.get_unfinished_jobs()]
+        with self.stats_lock:
+            totals = dict(self.stats)
+        time_run = totals.get('time_run', 0.0)
+        totals['nodes_per_sec'] = totals.get('nodes_loaded', 0) / time_run if time_run > 0 else 0.0
+        return {
+            'name': self.name,
+            'graph_nodes': graphs,
+            'total_graph_nodes': sum(graphs.values()),
+            'max_graph_nodes': self.max_graph_nodes,
+            'totals': totals,
+            'jobs': jobs,
+        }
+
+    def prioritize(self, txids, priority=1) -> int:
+        ''' Bump the priority of pending jobs for any of `txids`, so they run
+        before the rest. Returns the number of jobs affected. '''
+        return sum(job_mgr.prioritize(txids, priority) for job_mgr in self._get_job_mgrs())
+
     def stop_all_for_wallet(self, wallet, timeout=None) -> List[ValidationJob]:
         ''' Stops all extant jobs for a particular wallet. This method is
         intended to be called on wallet close so that all the work that
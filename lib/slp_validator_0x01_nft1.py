@@ -13,7 +13,7 @@ import weakref
 from .transaction import Transaction
 from . import slp
 from .slp import SlpMessage, SlpParsingError, SlpUnsupportedSlpTokenType, SlpInvalidOutputMessage
-from .slp_dagging import TokenGraph, ValidationJob, ValidationJobManager, ValidatorGeneric
+from .slp_dagging import TokenGraph, ValidationJob, ValidationJobManager, ValidatorGeneric, tx_fetcher
 from .bitcoin import TYPE_SCRIPT
 from .util import print_error
 from .slp_validator_0x01 import Validator_SLP1, GraphContext
@@ -36,7 +36,7 @@ class GraphContext_NFT1(GraphContext):
     def get_graph(self, token_id_hex, token_type) -> Tuple[TokenGraph, ValidationJobManager]:
         with self.graph_db_lock:
             try:
-                return self.graph_db[token_id_hex], self._get_or_make_mgr(token_id_hex)
+                return self._lookup_graph(token_id_hex), self._get_or_make_mgr(token_id_hex)
             except KeyError:
                 pass
 
@@ -47,7 +47,7 @@ class GraphContext_NFT1(GraphContext):
 
             graph = TokenGraph(val)
 
-            self.graph_db[token_id_hex] = graph
+            self._add_graph(token_id_hex, graph)
 
             return graph, self._get_or_make_mgr(token_id_hex)
 
@@ -173,6 +173,10 @@ class GraphContext_NFT1(GraphContext):
             raise RuntimeError('Invalid NFT type provided.')
 
         job.add_callback(done_callback)
+        job.add_callback(self._record_job_stats)
+        job.add_callback(self._check_graph_budget)
+        if callback_done:
+            job.add_callback(callback_done)
         job_mgr.add_job(job)
         return job
 
@@ -200,6 +204,7 @@ shared_context_nft1 = GraphContext_NFT1()
 
 class Validator_NFT1(ValidatorGeneric):
     prevalidation = True # indicate we want to check validation when some inputs still active.
+    undecided_waits = True # undecided while the NFT1 parent genesis is being validated.
 
     validity_states = {
         0: 'Unknown',
@@ -337,8 +342,7 @@ class Validator_NFT1(ValidatorGeneric):
                 nft_child_job.genesis_tx = tx
                 if done_callback:
                     done_callback(True)
-        requests = [('blockchain.transaction.get', [self.token_id_hex]), ]
-        nft_child_job.network.send(requests, dl_cb)
+        tx_fetcher.fetch(nft_child_job.network, self.token_id_hex, dl_cb)
 
     def download_nft_parent_tx(self, nft_child_job, done_callback):
         def dl_cb(resp):
@@ -373,8 +377,7 @@ class Validator_NFT1(ValidatorGeneric):
                 if done_callback:
                     done_callback(True)
         nft_parent_txid = nft_child_job.genesis_tx.inputs()[0]['prevout_hash']
-        requests = [('blockchain.transaction.get', [nft_parent_txid]), ]
-        nft_child_job.network.send(requests, dl_cb)
+        tx_fetcher.fetch(nft_child_job.network, nft_parent_txid, dl_cb)
 
     def start_NFT_parent_job(self, nft_child_job, done_callback):
         wallet = nft_child_job.ref()
@@ -410,6 +413,7 @@ class Validator_NFT1(ValidatorGeneric):
                 wallet.tx_tokinfo[nft_child_job.nft_parent_tx.txid_fast()]['validity'] = val
                 #wallet.tx_tokinfo[nft_child_job.genesis_tx.txid_fast()]['validity'] = val
                 wallet.save_transactions()
+            wallet.slp_validity_changed(nft_child_job.nft_parent_tx.txid_fast())
             slp_gs_mgr.slp_validity_signal.emit(txid, val)
             #slp_gs_mgr.slp_validity_signal.emit(nft_child_job.genesis_tx.txid_fast(), val)
             if done_callback:
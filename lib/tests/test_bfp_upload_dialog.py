@@ -0,0 +1,56 @@
+import unittest
+from unittest import mock
+
+try:
+    import PyQt5
+    from electroncash_gui.qt import bfp_upload_file_dialog
+except ImportError:
+    bfp_upload_file_dialog = None
+
+
+@unittest.skipIf(bfp_upload_file_dialog is None, "needs PyQt5 and the electroncash_gui package")
+class TestUploadDialogCallbacks(unittest.TestCase):
+    ''' Checks the wiring of the signing callbacks of the BFP upload dialog,
+    on a mock with the dialog's spec so that calls to methods the dialog
+    doesn't have fail like they would in the GUI. '''
+
+    def setUp(self):
+        self.Dialog = bfp_upload_file_dialog.BitcoinFilesUploadDialog
+        self.dialog = d = mock.Mock(spec=self.Dialog)
+        d.progress = mock.Mock()
+        d.progress_label = mock.Mock()
+        d.uploader = mock.Mock()
+        d.password = 'secret'
+
+    def test_funding_signed(self):
+        with mock.patch.object(bfp_upload_file_dialog, 'WaitingDialog') as WaitingDialog:
+            self.Dialog.funding_signed(self.dialog, True)
+        WaitingDialog.assert_called_once()
+        parent, msg, task, on_success, on_error = WaitingDialog.call_args[0]
+        self.assertIs(parent, self.dialog)
+        self.assertEqual(on_success, self.dialog.chain_signed)
+        self.assertEqual(on_error, self.dialog.on_error)
+        task()
+        self.dialog.uploader.build.assert_called_once_with('secret')
+
+    def test_funding_failed(self):
+        with mock.patch.object(bfp_upload_file_dialog, 'WaitingDialog') as WaitingDialog:
+            self.Dialog.funding_signed(self.dialog, False)
+        WaitingDialog.assert_not_called()
+
+    def test_on_error(self):
+        e = ValueError('boom')
+        with mock.patch.object(bfp_upload_file_dialog.traceback, 'print_exception'):
+            self.Dialog.on_error(self.dialog, (type(e), e, None))
+        self.dialog.show_error.assert_called_once_with('boom')
+        self.dialog.make_dirty.assert_called_once_with()
+
+    def test_on_error_cancelled(self):
+        e = bfp_upload_file_dialog.UserCancelled()
+        self.Dialog.on_error(self.dialog, (type(e), e, None))
+        self.dialog.show_error.assert_not_called()
+        self.dialog.make_dirty.assert_called_once_with()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,224 @@
+import hashlib
+import os
+import random
+import shutil
+import tempfile
+import threading
+import unittest
+
+from ..address import Address
+from ..bitcoin import TYPE_ADDRESS, public_key_from_private_key
+from ..bitcoinfiles import (BfpDownloader, BfpDownloadStopped, BfpHashMismatch, BfpUploader, BfpUploadError,
+                            make_bitcoinfile_chunk_opreturn, make_bitcoinfile_metadata_opreturn, parseOpreturnToChunks)
+from ..transaction import Transaction
+from .. import util
+
+ADDR = Address.from_string('1NNkttn1YvVGdqBW4PR6zvc3Zx3H5owKRf')
+PUBKEY = '02' + '11' * 32
+
+
+def make_tx(prevout_hash, prevout_n, op_return):
+    inputs = [{
+        'type': 'p2pkh', 'address': ADDR, 'prevout_hash': prevout_hash, 'prevout_n': prevout_n,
+        'value': 10000, 'num_sig': 1, 'signatures': [None],
+        'x_pubkeys': [PUBKEY], 'pubkeys': [PUBKEY], 'sequence': 0xffffffff,
+    }]
+    raw = Transaction.from_io(inputs, [op_return, (TYPE_ADDRESS, ADDR, 546)]).serialize()
+    return Transaction._txid(raw), raw
+
+
+def make_file(data, chunk_size=200, file_hash=None):
+    ''' Returns (metadata txid, {txid: raw}) of a file upload, with the last
+    chunk in the metadata tx. '''
+    chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+    txs = {}
+    prev, n = 'ab' * 32, 0
+    for chunk in chunks[:-1]:
+        prev, raw = make_tx(prev, n, make_bitcoinfile_chunk_opreturn(chunk))
+        txs[prev], n = raw, 1
+    if file_hash is None:
+        file_hash = hashlib.sha256(data).hexdigest()
+    meta = make_bitcoinfile_metadata_opreturn(1, len(chunks), chunks[-1], 'test', 'bin', len(data), file_hash)
+    txid, raw = make_tx(prev, n, meta)
+    txs[txid] = raw
+    return txid, txs
+
+
+class FakeNetwork:
+
+    def __init__(self, txs):
+        self.txs = txs
+        self.gets = 0
+
+    def synchronous_get(self, request, timeout=30):
+        method, params = request
+        if method == 'blockchain.scripthash.get_history':
+            return [{'tx_hash': txid, 'height': 1} for txid in self.txs]
+        self.gets += 1
+        if params[0] not in self.txs:
+            raise util.ServerError('not found')
+        return self.txs[params[0]]
+
+    def queue_request(self, method, params, interface=None, *, callback=None):
+        callback({'method': method, 'params': params, 'result': self.txs[params[0]]})
+
+    def cancel_requests(self, callback):
+        pass
+
+
+class TestBfpDownloader(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'file.bin')
+        self.data = os.urandom(1234)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_download(self):
+        txid, txs = make_file(self.data)
+        network = FakeNetwork(txs)
+        result = BfpDownloader(network, txid, self.path).run()
+        with open(self.path, 'rb') as f:
+            self.assertEqual(self.data, f.read())
+        self.assertTrue(result['hash_verified'])
+        self.assertEqual(len(self.data), result['size'])
+        self.assertEqual(['file.bin'], os.listdir(self.dir))
+        # the metadata tx and the last chunk, then the rest was prefetched
+        self.assertEqual(2, network.gets)
+
+    def test_resume(self):
+        txid, txs = make_file(self.data)
+        network = FakeNetwork(txs)
+        dl = BfpDownloader(network, txid, self.path, progress_callback=lambda done, total: done == 3 and dl.stop())
+        with self.assertRaises(BfpDownloadStopped):
+            dl.run()
+        self.assertEqual(3, len(dl._load_state()['lengths']))
+        with open(dl.part_path, 'ab') as f:
+            f.write(b'garbage')  # as if interrupted while writing a chunk
+        BfpDownloader(FakeNetwork(txs), txid, self.path).run()
+        with open(self.path, 'rb') as f:
+            self.assertEqual(self.data, f.read())
+
+    def test_hash_mismatch(self):
+        txid, txs = make_file(self.data, file_hash='00' * 32)
+        with self.assertRaises(BfpHashMismatch):
+            BfpDownloader(FakeNetwork(txs), txid, self.path).run()
+        self.assertEqual([], os.listdir(self.dir))
+
+
+SECRET = bytes(range(1, 33))
+SIGNING_PUBKEY = public_key_from_private_key(SECRET, True)
+SIGNING_ADDR = Address.from_pubkey(SIGNING_PUBKEY)
+
+
+class FakeWallet:
+
+    def get_local_height(self):
+        return 100
+
+    def is_schnorr_enabled(self):
+        return True
+
+    def get_keystores(self):
+        return []
+
+    def add_input_info_for_bitcoinfiles(self, txin):
+        txin.update({'type': 'p2pkh', 'num_sig': 1, 'signatures': [None],
+                     'x_pubkeys': [SIGNING_PUBKEY], 'pubkeys': [SIGNING_PUBKEY]})
+
+    def sign_transaction(self, tx, password, *, use_cache=False):
+        tx.sign({SIGNING_PUBKEY: (SECRET, True)}, use_cache=use_cache)
+
+
+class FakeBroadcastNetwork:
+    ''' Answers broadcasts in random order, refusing txs whose parent it
+    hasn't accepted yet. '''
+
+    def __init__(self, fail_after=None):
+        self.known = set()
+        self.pending = []
+        self.sent = 0
+        self.fail_after = fail_after
+
+    def queue_request(self, method, params, interface=None, *, callback=None):
+        self.pending.append((params, callback))
+        self.sent += 1
+
+    def cancel_requests(self, callback):
+        self.pending.clear()
+
+    def answer(self):
+        params, callback = self.pending.pop(random.randrange(len(self.pending)))
+        tx = Transaction(params[0])
+        if self.fail_after is not None and len(self.known) >= self.fail_after:
+            callback({'params': params, 'error': {'code': 1, 'message': 'the transaction was rejected by network rules.'}})
+        elif any(txin['prevout_hash'] not in self.known and txin['prevout_hash'] != 'ab' * 32 for txin in tx.inputs()):
+            callback({'params': params, 'error': {'code': 1, 'message': 'Missing inputs'}})
+        else:
+            self.known.add(tx.txid())
+            callback({'params': params, 'result': tx.txid()})
+
+
+class TestBfpUploader(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(1)
+        self.wallet = FakeWallet()
+        inputs = [{'prevout_hash': 'ab' * 32, 'prevout_n': 0, 'address': SIGNING_ADDR, 'value': 100000}]
+        self.wallet.add_input_info_for_bitcoinfiles(inputs[0])
+        self.funding_tx = Transaction.from_io(inputs, [(TYPE_ADDRESS, SIGNING_ADDR, 90000)])
+        self.wallet.sign_transaction(self.funding_tx, None)
+        self.data = os.urandom(1000)
+        self.metadata = {'filename': 'test', 'fileext': 'bin', 'filesize': len(self.data),
+                         'file_sha256': hashlib.sha256(self.data).hexdigest(), 'prev_file_sha256': None, 'uri': None}
+
+    def uploader(self):
+        uploader = BfpUploader(self.wallet, self.funding_tx, self.data, self.metadata)
+        uploader.build(None)
+        return uploader
+
+    def test_build(self):
+        txs = self.uploader().build(None)
+        self.assertEqual(6, len(txs))  # funding, 4 chunks, metadata with the last chunk
+        data = b''
+        for prev, tx in zip(txs, txs[1:]):
+            self.assertTrue(tx.is_complete())
+            self.assertEqual(prev.txid(), tx.inputs()[0]['prevout_hash'])
+            chunks = parseOpreturnToChunks(tx.outputs()[0][1].to_script(), allow_op_0=True, allow_op_number=False)
+            data += chunks[0] if len(chunks) == 1 else (chunks[-1] or b'')
+        self.assertEqual(self.data, data)
+        with self.assertRaises(BfpUploadError):
+            BfpUploader(self.wallet, self.funding_tx, bytes(220 * 256), self.metadata)
+
+    def run_broadcast(self, uploader, network):
+        done = []
+        def broadcast():
+            try:
+                done.append(uploader.broadcast(network, timeout=5))
+            except BfpUploadError as e:
+                done.append(e)
+        t = threading.Thread(target=broadcast, daemon=True)
+        t.start()
+        while t.is_alive():
+            if network.pending:
+                network.answer()
+            t.join(0.001)
+        return done[0]
+
+    def test_broadcast(self):
+        uploader = self.uploader()
+        network = FakeBroadcastNetwork()
+        self.assertEqual(uploader.file_txid, self.run_broadcast(uploader, network))
+        self.assertEqual({tx.txid() for tx in uploader.txs}, network.known)
+        self.assertGreater(network.sent, len(uploader.txs))  # some were sent again
+
+    def test_resume(self):
+        uploader = self.uploader()
+        network = FakeBroadcastNetwork(fail_after=3)
+        self.assertIsInstance(self.run_broadcast(uploader, network), BfpUploadError)
+        self.assertEqual(3, uploader.broadcast_count)
+        network.fail_after = None
+        self.assertEqual(uploader.file_txid, self.run_broadcast(uploader, network))
+        self.assertEqual(len(uploader.txs), len(network.known))
@@ -179,5 +179,20 @@ class TestCashAddrAddress(unittest.TestCase):
             self.assertEqual(kind, cashaddr.PUBKEY_TYPE)
             self.assertEqual(addr_hash, hashbytes)
 
+    def test_address_registry(self):
+        """Test that parsed addresses are shared and keep their string."""
+        from ..address import Address
+        strings = [Address(hashbytes, Address.ADDR_P2PKH).to_storage_string()
+                   for hashbytes in VALID_HASHES]
+        addrs = Address.from_strings(strings)
+        self.assertEqual(addrs, [Address.from_string(s) for s in strings])
+        self.assertTrue(all(a is b for a, b in zip(addrs, Address.from_strings(strings))))
+        self.assertEqual(strings, Address.to_strings(Address.FMT_LEGACY, addrs))
+        cash = VALID_PUBKEY_ADDRESSES[0]
+        addr = Address.from_cashaddr_string(cash)
+        self.assertEqual(cash, addr.to_full_string(Address.FMT_CASHADDR))
+        self.assertIs(addr, Address.from_cashaddr_string(cash))
+        self.assertEqual(addr, Address.from_string(cash.upper()))
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,7 +1,8 @@
 import unittest
+from unittest import mock
 from decimal import Decimal as PyDecimal
 
-from ..commands import Commands
+from ..commands import Commands, known_commands
 
 
 class TestCommands(unittest.TestCase):
@@ -31,3 +32,16 @@ class TestCommands(unittest.TestCase):
         self.assertEqual("2asd", Commands._setconfig_normalize_value('rpcpassword', '2asd'))
         self.assertEqual("['file:///var/www/','https://electrum.org']",
             Commands._setconfig_normalize_value('rpcpassword', "['file:///var/www/','https://electrum.org']"))
+
+    def test_read_only_commands(self):
+        for name in ('getbalance', 'history', 'listaddresses'):
+            self.assertTrue(known_commands[name].read_only, name)
+        for name in ('payto', 'setlabel', 'createnewaddress', 'slpvalidate'):
+            self.assertFalse(known_commands[name].read_only, name)
+
+    def test_bfp_download_relative_path(self):
+        config = mock.Mock(user_config={'slp_license_accepted': True})
+        cmds = Commands(config=config, wallet=None, network=mock.Mock())
+        with self.assertRaises(BaseException) as ctx:
+            cmds.bfp_download('00' * 32, 'file.bin')
+        self.assertIn('absolute path', str(ctx.exception))
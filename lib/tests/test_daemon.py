@@ -0,0 +1,167 @@
+import collections
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from ..daemon import Daemon
+from ..commands import known_commands
+
+
+class FakeWallet:
+
+    def __init__(self, path):
+        self.storage = mock.Mock(path=path)
+        self.stopped = False
+
+    def stop_threads(self):
+        self.stopped = True
+
+
+class TestDaemonWallets(unittest.TestCase):
+    ''' The lazily loaded wallets of RPC calls selecting them with the
+    'wallet' argument, on a daemon without network and RPC server. '''
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.tmpdir, 'wallets'))
+        self.daemon = d = Daemon.__new__(Daemon)
+        d.config = mock.Mock(path=self.tmpdir)
+        d.wallets = collections.OrderedDict()
+        d.lazy_wallets = set()
+        d.wallet_users = {}
+        d.max_lazy_wallets = 2
+        d.rpc_lock = threading.Lock()
+        d.wallet_locks = {}
+        d.wallet_load_locks = {}
+        d.daemon_cmd_lock = threading.RLock()
+        d.rpc_stats = {}
+        d.open_wallet = mock.Mock(side_effect=lambda path, password: FakeWallet(path))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def make_wallet_file(self, name):
+        with open(os.path.join(self.tmpdir, 'wallets', name), 'w'):
+            pass
+
+    def test_lazy_load(self):
+        self.make_wallet_file('w1')
+        path, wallet = self.daemon.acquire_wallet('w1')
+        self.assertIs(self.daemon.wallets[path], wallet)
+        self.assertIn(path, self.daemon.lazy_wallets)
+        self.assertEqual(self.daemon.wallet_users, {path: 1})
+        # already loaded
+        self.assertEqual(self.daemon.acquire_wallet('w1'), (path, wallet))
+        self.assertEqual(self.daemon.open_wallet.call_count, 1)
+        self.daemon.release_wallet(path)
+        self.daemon.release_wallet(path)
+        self.assertEqual(self.daemon.wallet_users, {})
+        self.assertEqual(self.daemon.wallet_load_locks, {})
+
+    def test_lazy_load_missing(self):
+        with self.assertRaises(Exception):
+            self.daemon.acquire_wallet('nope')
+        self.assertEqual(self.daemon.wallets, {})
+        self.assertEqual(self.daemon.wallet_load_locks, {})
+
+    def test_load_without_daemon_lock(self):
+        self.make_wallet_file('w1')
+        def open_wallet(path, password):
+            # another thread can take the daemon_cmd_lock during the load
+            t = threading.Thread(target=lambda: self.daemon.daemon_cmd_lock.acquire(timeout=5)
+                                 and self.daemon.daemon_cmd_lock.release())
+            t.start()
+            t.join(5)
+            self.assertFalse(t.is_alive())
+            return FakeWallet(path)
+        self.daemon.open_wallet = open_wallet
+        path, wallet = self.daemon.acquire_wallet('w1')
+        self.assertIs(self.daemon.wallets[path], wallet)
+
+    def test_concurrent_lazy_load(self):
+        self.make_wallet_file('w1')
+        def open_wallet(path, password):
+            time.sleep(0.05)
+            return FakeWallet(path)
+        self.daemon.open_wallet = mock.Mock(side_effect=open_wallet)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.daemon.acquire_wallet('w1')))
+                   for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(self.daemon.open_wallet.call_count, 1)
+        self.assertEqual(len({id(wallet) for path, wallet in results}), 1)
+        self.assertEqual(self.daemon.wallet_users, {results[0][0]: 4})
+
+    def test_lru_unload(self):
+        for name in ('w1', 'w2', 'w3'):
+            self.make_wallet_file(name)
+        path1, wallet1 = self.daemon.acquire_wallet('w1')
+        path2, wallet2 = self.daemon.acquire_wallet('w2')
+        self.daemon.get_wallet_lock(wallet1)
+        self.daemon.release_wallet(path1)
+        self.daemon.release_wallet(path2)
+        # w1 is the least recently used
+        path3, wallet3 = self.daemon.acquire_wallet('w3')
+        self.daemon.release_wallet(path3)
+        self.assertEqual(list(self.daemon.wallets), [path2, path3])
+        self.assertTrue(wallet1.stopped)
+        self.assertNotIn(path1, self.daemon.wallet_locks)
+        self.assertEqual(self.daemon.lazy_wallets, {path2, path3})
+
+    def test_lru_keeps_wallets_in_use(self):
+        for name in ('w1', 'w2', 'w3'):
+            self.make_wallet_file(name)
+        path1, wallet1 = self.daemon.acquire_wallet('w1')
+        path2, wallet2 = self.daemon.acquire_wallet('w2')
+        path3, wallet3 = self.daemon.acquire_wallet('w3')
+        self.daemon.release_wallet(path3)
+        # w1 and w2 are in use, so the idle w3 goes instead
+        self.assertEqual(list(self.daemon.wallets), [path1, path2])
+        self.assertTrue(wallet3.stopped)
+        self.assertFalse(wallet1.stopped)
+
+    def test_per_wallet_serialization(self):
+        wallet = FakeWallet('w1')
+        other = FakeWallet('w2')
+        running = collections.Counter()
+        overlaps = []
+        def func(w):
+            running[w] += 1
+            overlaps.append(running[w])
+            time.sleep(0.02)
+            running[w] -= 1
+        cmd = known_commands['setlabel']
+        def call(w):
+            self.daemon.call_command(cmd, w, func, w)
+        threads = [threading.Thread(target=call, args=(w,))
+                   for w in (wallet, wallet, wallet, other, other)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        # calls on the same wallet ran one at a time
+        self.assertEqual(max(overlaps), 1)
+        self.assertEqual(self.daemon.rpc_stats['setlabel']['count'], 5)
+
+    def test_read_only_not_serialized(self):
+        wallet = FakeWallet('w1')
+        barrier = threading.Barrier(2, timeout=5)
+        cmd = known_commands['getbalance']
+        threads = [threading.Thread(target=self.daemon.call_command, args=(cmd, wallet, barrier.wait))
+                   for i in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertFalse(barrier.broken)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+import time
+import unittest
+from datetime import datetime
+
+from ..exchange_rate import HistoryRates, day_ordinals
+
+
+class TestHistoryRates(unittest.TestCase):
+
+    def test_from_dict(self):
+        h = HistoryRates.from_dict({'2019-01-03': '130.5', '2019-01-01': 120.25, 'bad': 1})
+        self.assertEqual(3, len(h))
+        self.assertEqual(120.25, h.get(datetime(2019, 1, 1).toordinal()))
+        self.assertIsNone(h.get(datetime(2019, 1, 2).toordinal()))
+        self.assertEqual(130.5, h.get(datetime(2019, 1, 3).toordinal()))
+        self.assertIsNone(h.get(datetime(2019, 1, 4).toordinal()))
+        self.assertFalse(HistoryRates.from_dict({}))
+
+    def test_bytes_roundtrip(self):
+        h = HistoryRates.from_dict({'2019-01-03': 130.5, '2019-01-01': 120.25})
+        h2 = HistoryRates.from_bytes(h.to_bytes())
+        self.assertEqual(h.first_day, h2.first_day)
+        self.assertEqual(h.to_bytes(), h2.to_bytes())
+        with self.assertRaises(ValueError):
+            HistoryRates.from_bytes(h.to_bytes()[:-1])
+
+    def test_day_ordinals(self):
+        timestamps = [None] + [1514764800 + i * 3333.3 for i in range(1000)]
+        expected = [None] + [datetime.fromtimestamp(int(ts)).toordinal() for ts in timestamps[1:]]
+        self.assertEqual(expected, day_ordinals(timestamps))
@@ -0,0 +1,135 @@
+import http.client
+import threading
+import time
+import unittest
+
+import jsonrpclib
+
+from ..jsonrpc import VerifyingJSONRPCServer
+
+
+class TestRPCWorkerPool(unittest.TestCase):
+
+    def start_server(self, max_workers, max_queue):
+        self.server = server = VerifyingJSONRPCServer(
+            ('127.0.0.1', 0), logRequests=False, rpc_user='', rpc_password='',
+            max_workers=max_workers, max_queue=max_queue)
+        server.timeout = 0.05
+        self.port = server.socket.getsockname()[1]
+        self.serving = True
+        def serve():
+            while self.serving:
+                server.handle_request()
+        self.serve_thread = threading.Thread(target=serve)
+        self.serve_thread.start()
+
+    def stop_serving(self):
+        self.serving = False
+        self.serve_thread.join()
+
+    def tearDown(self):
+        if self.serving:
+            self.stop_serving()
+            self.server.server_close()
+
+    def call(self, method, *args):
+        return getattr(jsonrpclib.Server('http://127.0.0.1:%d' % self.port), method)(*args)
+
+    def call_async(self, method, *args):
+        ''' Returns the thread making the call, and a list that gets its
+        result or error. '''
+        results = []
+        def run():
+            try:
+                results.append(self.call(method, *args))
+            except jsonrpclib.jsonrpc.TransportError as e:
+                results.append(e.errcode)
+        t = threading.Thread(target=run)
+        t.start()
+        return t, results
+
+    def wait_stats(self, **expected):
+        for i in range(100):
+            stats = self.server.get_stats()
+            if all(stats[k] == v for k, v in expected.items()):
+                return
+            time.sleep(0.02)
+        self.fail('stats %r never reached %r' % (stats, expected))
+
+    def test_parallel(self):
+        self.start_server(max_workers=2, max_queue=0)
+        barrier = threading.Barrier(2, timeout=5)
+        self.server.register_function(lambda: barrier.wait() >= 0, 'meet')
+        calls = [self.call_async('meet') for i in range(2)]
+        for t, results in calls:
+            t.join()
+            self.assertEqual(results, [True])
+        self.assertFalse(barrier.broken)
+        self.assertEqual(self.server.get_stats()['requests'], 2)
+
+    def test_one_at_a_time(self):
+        self.start_server(max_workers=1, max_queue=4)
+        running = []
+        overlaps = []
+        def slow():
+            running.append(1)
+            overlaps.append(len(running))
+            time.sleep(0.02)
+            running.pop()
+            return True
+        self.server.register_function(slow, 'slow')
+        calls = [self.call_async('slow') for i in range(3)]
+        for t, results in calls:
+            t.join()
+            self.assertEqual(results, [True])
+        self.assertEqual(overlaps, [1, 1, 1])
+
+    def test_queue_full(self):
+        self.start_server(max_workers=1, max_queue=1)
+        release = threading.Event()
+        self.server.register_function(lambda: release.wait(5), 'block')
+        active = self.call_async('block')
+        self.wait_stats(active=1)
+        queued = self.call_async('block')
+        self.wait_stats(queued=1)
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=5)
+        conn.request('POST', '/', body='{"jsonrpc": "2.0", "method": "block", "id": 1}')
+        self.assertEqual(conn.getresponse().status, 503)
+        conn.close()
+        self.assertEqual(self.server.get_stats()['rejected'], 1)
+        release.set()
+        for t, results in (active, queued):
+            t.join()
+            self.assertEqual(results, [True])
+
+    def test_close_waits_for_workers(self):
+        self.start_server(max_workers=1, max_queue=1)
+        release = threading.Event()
+        done = []
+        def block():
+            release.wait(5)
+            done.append(1)
+            return True
+        self.server.register_function(block, 'block')
+        active = self.call_async('block')
+        self.wait_stats(active=1)
+        queued = self.call_async('block')
+        self.wait_stats(queued=1)
+        self.stop_serving()
+        closer = threading.Thread(target=self.server.server_close)
+        closer.start()
+        closer.join(0.1)
+        self.assertTrue(closer.is_alive())
+        release.set()
+        closer.join()
+        # the running request finished, the queued one was turned down
+        self.assertEqual(done, [1])
+        active[0].join()
+        self.assertEqual(active[1], [True])
+        queued[0].join()
+        self.assertEqual(queued[1], [503])
+        self.assertEqual(self.server.get_stats()['rejected'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,16 @@
+import threading
 import unittest
 from pprint import pprint
+from unittest import mock
 
 from .. import transaction
 from ..address import Address, ScriptOutput, PublicKey
-from ..bitcoin import TYPE_ADDRESS, TYPE_PUBKEY, TYPE_SCRIPT
+from ..bitcoin import (TYPE_ADDRESS, TYPE_PUBKEY, TYPE_SCRIPT, int_to_hex,
+                       public_key_from_private_key, var_int)
 
 from ..keystore import xpubkey_to_address
 
-from ..util import bh2u
+from ..util import bfh, bh2u
 
 unsigned_blob = '010000000149f35e43fefd22d8bb9e4b3ff294c6286154c25712baf6ab77b646e5074d6aed010000005701ff4c53ff0488b21e0000000000000000004f130d773e678a58366711837ec2e33ea601858262f8eaef246a7ebd19909c9a03c3b30e38ca7d797fee1223df1c9827b2a9f3379768f520910260220e0560014600002300feffffffd8e43201000000000118e43201000000001976a914e158fb15c888037fdc40fb9133b4c1c3c688706488ac5fbd0700'
 signed_blob = '010000000149f35e43fefd22d8bb9e4b3ff294c6286154c25712baf6ab77b646e5074d6aed010000006a473044022025bdc804c6fe30966f6822dc25086bc6bb0366016e68e880cf6efd2468921f3202200e665db0404f6d6d9f86f73838306ac55bb0d0f6040ac6047d4e820f24f46885412103b5bbebceeb33c1b61f649596b9c3611c6b2853a1f6b48bce05dd54f667fa2166feffffff0118e43201000000001976a914e158fb15c888037fdc40fb9133b4c1c3c688706488ac5fbd0700'
@@ -296,6 +299,108 @@ class TestTransaction(unittest.TestCase):
         self.assertEqual("", tx.outputs()[0][1].to_ui_string())
         self.assertEqual('50fa7bd4e5e2d3220fd2e84effec495b9845aba379d853408779d59a4b0b4f59', tx.txid())
 
+class TestSignTransaction(unittest.TestCase):
+    ''' Checks the phased signing of Transaction.sign against signing one
+    input at a time with _sign_txin. '''
+
+    secs = [bytes([n]) * 32 for n in range(1, 6)]
+    pubkeys = [public_key_from_private_key(sec, True) for sec in secs]
+
+    def _make_tx(self, sign_schnorr=False):
+        ''' A tx spending a p2pkh, a p2pk and a 2-of-3 p2sh input, the
+        latter already signed with one of its keys. '''
+        p0, p1, p2, p3, p4 = self.pubkeys
+        inputs = [
+            {'type': 'p2pkh', 'address': Address.from_pubkey(p0), 'num_sig': 1,
+             'pubkeys': [p0], 'x_pubkeys': [p0], 'signatures': [None]},
+            {'type': 'p2pk', 'address': PublicKey.from_string(p1), 'num_sig': 1,
+             'pubkeys': [p1], 'x_pubkeys': [p1], 'signatures': [None]},
+            {'type': 'p2sh', 'num_sig': 2,
+             'address': Address.from_multisig_script(bfh(transaction.multisig_script(sorted([p2, p3, p4]), 2))),
+             'pubkeys': sorted([p2, p3, p4]), 'x_pubkeys': sorted([p2, p3, p4]), 'signatures': [None] * 3},
+        ]
+        for n, txin in enumerate(inputs):
+            txin.update(prevout_hash='%064x' % (n + 1), prevout_n=n, value=100000 * (n + 1), sequence=0xfffffffe)
+        outputs = [(TYPE_ADDRESS, Address.from_pubkey(p0), 550000)]
+        tx = transaction.Transaction.from_io(inputs, outputs, locktime=600000, sign_schnorr=sign_schnorr)
+        j = tx.inputs()[2]['pubkeys'].index(p3)
+        tx._sign_txin(2, j, self.secs[3], True)
+        return tx
+
+    def _keypairs(self):
+        return {pubkey: (sec, True) for pubkey, sec in zip(self.pubkeys, self.secs)}
+
+    def _sign_per_input(self, tx, keypairs):
+        ''' Signs like Transaction.sign used to, one input at a time. '''
+        for i, txin in enumerate(tx.inputs()):
+            needed = txin['num_sig'] - len(list(filter(None, txin['signatures'])))
+            for j, pubkey in enumerate(txin['pubkeys']):
+                if needed > 0 and not txin['signatures'][j] and pubkey in keypairs:
+                    sec, compressed = keypairs[pubkey]
+                    tx._sign_txin(i, j, sec, compressed)
+                    needed -= 1
+        return tx.serialize()
+
+    def _preimage_hex(self, tx, i):
+        ''' The preimage, built from hex strings like serialize_preimage
+        used to. '''
+        txin = tx.inputs()[i]
+        preimage_script = tx.get_preimage_script(txin)
+        hashPrevouts = transaction.Hash(bfh(''.join(tx.serialize_outpoint(t) for t in tx.inputs())))
+        hashSequence = transaction.Hash(bfh(''.join(int_to_hex(t['sequence'], 4) for t in tx.inputs())))
+        hashOutputs = transaction.Hash(bfh(''.join(tx.serialize_output(o) for o in tx.outputs())))
+        return (int_to_hex(tx.version, 4) + bh2u(hashPrevouts) + bh2u(hashSequence)
+                + tx.serialize_outpoint(txin) + var_int(len(preimage_script) // 2) + preimage_script
+                + int_to_hex(txin['value'], 8) + int_to_hex(txin['sequence'], 4)
+                + bh2u(hashOutputs) + int_to_hex(tx.locktime, 4) + int_to_hex(0x41, 4))
+
+    def test_serialize_preimage_bytes(self):
+        tx = self._make_tx()
+        for i in range(len(tx.inputs())):
+            for use_cache in (False, True):
+                preimage = tx.serialize_preimage_bytes(i, use_cache=use_cache)
+                self.assertEqual(preimage, bfh(tx.serialize_preimage(i, use_cache=use_cache)))
+                self.assertEqual(preimage, bfh(self._preimage_hex(tx, i)))
+
+    def _check_sign(self, sign_schnorr):
+        tx = self._make_tx(sign_schnorr)
+        tx.sign(self._keypairs())
+        expected = self._sign_per_input(self._make_tx(sign_schnorr), self._keypairs())
+        self.assertTrue(tx.is_complete())
+        self.assertEqual(tx.serialize(), expected)
+        self.assertEqual(tx.ephemeral['sign_timings']['num_sigs'], 3)
+
+    def test_sign_ecdsa(self):
+        self._check_sign(False)
+
+    def test_sign_schnorr(self):
+        self._check_sign(True)
+
+    def test_sign_partial(self):
+        # no key for the p2pk input, the multisig one gets its second signature
+        keypairs = {self.pubkeys[n]: (self.secs[n], True) for n in (0, 4)}
+        tx = self._make_tx()
+        tx.sign(keypairs)
+        self.assertFalse(tx.is_complete())
+        self.assertEqual(tx.serialize(), self._sign_per_input(self._make_tx(), keypairs))
+
+    def test_sign_parallel(self):
+        threads = set()
+        sign_digest = transaction.Transaction._sign_digest
+        def _sign_digest(tx, *args):
+            threads.add(threading.current_thread().name)
+            return sign_digest(tx, *args)
+        for sign_schnorr in (False, True):
+            tx = self._make_tx(sign_schnorr)
+            with mock.patch.object(transaction.Transaction, 'SIGN_PARALLEL_MIN_SIGS', 2), \
+                 mock.patch.object(transaction.Transaction, '_can_sign_in_parallel', return_value=True), \
+                 mock.patch.object(transaction.Transaction, '_sign_digest', _sign_digest):
+                tx.sign(self._keypairs())
+            expected = self._sign_per_input(self._make_tx(sign_schnorr), self._keypairs())
+            self.assertEqual(tx.serialize(), expected)
+        self.assertTrue(threads)
+        self.assertTrue(all(name.startswith('TxSign') for name in threads))
+
 class NetworkMock(object):
 
     def __init__(self, unspent):
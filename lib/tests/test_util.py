@@ -1,9 +1,22 @@
+import os
+import subprocess
+import sys
 import unittest
 from ..util import format_satoshis
 from ..web import parse_URI
 
 class TestUtil(unittest.TestCase):
 
+    def test_import_first(self):
+        # each of these used to run into an import cycle with util when it
+        # was the first module of the package to be imported
+        package = __name__.rsplit('.', 2)[0]
+        cwd = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        for module in ('caches', 'slp_dagging', 'slp_proxying', 'util'):
+            proc = subprocess.run([sys.executable, '-c', 'import %s.%s' % (package, module)],
+                                  cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            self.assertEqual(0, proc.returncode, proc.stderr.decode(errors='replace'))
+
     def test_format_satoshis(self):
         result = format_satoshis(1234)
         expected = "0.00001234"
@@ -0,0 +1,161 @@
+import itertools
+import unittest
+from unittest import mock
+
+from .. import verifier
+from ..bitcoin import Hash, hash_decode, hash_encode
+from ..verifier import SPV
+
+
+class FakeBlockchain:
+
+    def __init__(self, headers):
+        self.headers = headers
+        self.reads = 0
+
+    def read_header(self, height):
+        self.reads += 1
+        return self.headers.get(height)
+
+
+class FakeInterface:
+
+    def __init__(self, blockchain):
+        self.blockchain = blockchain
+        self.server = 'fake'
+
+
+class FakeNetwork:
+
+    def __init__(self, blockchain, height):
+        self.interface = FakeInterface(blockchain)
+        self.blockchain = lambda: blockchain
+        self.interfaces = [self.interface]
+        self.height = height
+        self.requests = []
+        self.unanswered_requests = {}
+        self.message_id = 0
+
+    def get_local_height(self):
+        return self.height
+
+    def get_interfaces(self, *, interfaces=False):
+        return list(self.interfaces)
+
+    def get_merkle_for_transaction(self, tx_hash, tx_height, callback, max_qlen=10, interface=None):
+        self.message_id += 1
+        self.requests.append((tx_hash, tx_height, callback, interface, self.message_id))
+        self.unanswered_requests[self.message_id] = ['blockchain.transaction.get_merkle',
+                                                     [tx_hash, tx_height], callback]
+        return self.message_id
+
+    def trigger_callback(self, *args):
+        pass
+
+
+class FakeWallet:
+
+    def __init__(self, unverified):
+        self.unverified = unverified
+        self.verified = {}
+        self.saves = 0
+
+    def get_unverified_txs(self):
+        return dict(self.unverified)
+
+    def get_unverified_tx_pending_count(self):
+        return len(self.unverified)
+
+    def add_verified_tx(self, tx_hash, info):
+        self.unverified.pop(tx_hash)
+        self.verified[tx_hash] = info
+
+    def save_verified_tx(self, write=False):
+        self.saves += 1
+
+    def is_up_to_date(self):
+        return True
+
+
+class TestSPV(unittest.TestCase):
+
+    def setUp(self):
+        # 3 blocks of 2 txs each, at heights 101..103
+        self.txids, headers, self.proofs = {}, {}, {}
+        for height in (101, 102, 103):
+            a, b = ('%02x' % (height * 2 + i) * 32 for i in range(2))
+            root = hash_encode(Hash(hash_decode(a) + hash_decode(b)))
+            headers[height] = {'merkle_root': root, 'timestamp': height}
+            self.proofs[a] = {'block_height': height, 'pos': 0, 'merkle': [b]}
+            self.proofs[b] = {'block_height': height, 'pos': 1, 'merkle': [a]}
+            self.txids.update({a: height, b: height})
+        self.blockchain = FakeBlockchain(headers)
+        self.network = FakeNetwork(self.blockchain, 103)
+        self.wallet = FakeWallet(dict(self.txids))
+        self.spv = SPV(self.network, self.wallet)
+
+    def answer(self, bad=()):
+        for tx_hash, tx_height, callback, interface, msg_id in self.network.requests:
+            if not self.network.unanswered_requests.pop(msg_id, None):
+                continue
+            proof = dict(self.proofs[tx_hash])
+            if tx_hash in bad:
+                proof['pos'] ^= 1
+            callback({'params': [tx_hash, tx_height], 'result': proof})
+        self.network.requests.clear()
+
+    def test_grouped_by_block(self):
+        self.spv.run()
+        self.assertEqual(6, len(self.network.requests))
+        self.assertEqual(3, self.blockchain.reads)  # one per block
+        self.assertFalse(self.spv.is_up_to_date())
+        self.answer()
+        self.assertEqual(3, self.blockchain.reads)
+        self.assertEqual({h: (self.txids[h], self.txids[h], self.proofs[h]['pos']) for h in self.txids},
+                         self.wallet.verified)
+        self.assertTrue(self.spv.is_up_to_date())
+        self.assertEqual(1, self.wallet.saves)  # saved once, when done
+        self.assertEqual(6, self.spv.get_stats()['verified'])
+
+    def test_window_and_retry(self):
+        self.spv.max_pending = 4
+        self.spv.run()
+        self.assertEqual(4, len(self.network.requests))
+        self.assertEqual([101, 101, 102, 102], [r[1] for r in self.network.requests])
+        bad = self.network.requests[0][0]
+        self.answer(bad=[bad])
+        self.assertNotIn(bad, self.wallet.verified)
+        self.spv.run()
+        self.assertEqual(2, len(self.network.requests))  # the bad one isn't asked again yet
+        self.answer()
+        t, msg_id, interface = self.spv.requested_merkle[bad]
+        self.spv.requested_merkle[bad] = (t - self.spv.retry_timeout - 1, msg_id, interface)
+        self.spv.run()
+        self.assertEqual([bad], [r[0] for r in self.network.requests])
+        # the old request is dropped from the network's unanswered requests
+        self.assertNotIn(msg_id, self.network.unanswered_requests)
+        self.assertEqual(1, len(self.network.unanswered_requests))
+        self.answer()
+        self.assertEqual(6, len(self.wallet.verified))
+        self.assertTrue(self.spv.is_up_to_date())
+
+    def test_interface_gone(self):
+        other = FakeInterface(self.blockchain)
+        self.network.interfaces.append(other)
+        turns = itertools.count()
+        with mock.patch.object(verifier.random, 'choice', lambda seq: seq[next(turns) % len(seq)]):
+            self.spv.run()
+        self.assertEqual(6, len(self.network.unanswered_requests))
+        lost = {r[0] for r in self.network.requests if r[3] is other}
+        n = len(self.network.requests)
+        self.network.interfaces.remove(other)
+        self.spv.run()
+        # the requests sent to the interface that went away are asked
+        # again right away, on the remaining one
+        retried = self.network.requests[n:]
+        self.assertEqual(lost, {r[0] for r in retried})
+        self.assertTrue(all(r[3] is self.network.interface for r in retried))
+        self.assertEqual(6, len(self.network.unanswered_requests))
+        self.assertEqual(3, len(lost))
+        self.answer()
+        self.assertEqual(6, len(self.wallet.verified))
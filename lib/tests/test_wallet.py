@@ -4,6 +4,7 @@ import sys
 import unittest
 import os
 import json
+from unittest import mock
 
 from io import StringIO
 from ..storage import WalletStorage, FINAL_SEED_VERSION
@@ -68,3 +69,120 @@ class TestWalletStorage(WalletTestCase):
         with open(self.wallet_path, "r") as f:
             contents = f.read()
         self.assertEqual(some_dict, json.loads(contents))
+
+
+class TestWalletOutpoints(unittest.TestCase):
+
+    txid1 = 'aa' * 32
+    txid2 = 'bb' * 32
+    address = '1NNkttn1YvVGdqBW4PR6zvc3Zx3H5owKRf'
+
+    def test_outpoint_string_roundtrip(self):
+        op = wallet.outpoint_from_string(self.txid1 + ':7')
+        self.assertEqual((self.txid1, 7), op)
+        self.assertEqual(self.txid1 + ':7', wallet.outpoint_to_string(op))
+
+    @mock.patch.object(WalletStorage, '_write')
+    def test_storage_roundtrip(self, mock_write):
+        storage = WalletStorage('if_this_exists_mocking_failed_648151893')
+        storage.put('wallet_type', 'imported_addr')
+        storage.put('addresses', [self.address])
+        storage.put('txi', {self.txid2: {self.address: [[self.txid1 + ':0', 1000]]}})
+        storage.put('pruned_txo', {self.txid1 + ':3': self.txid2})
+        storage.put('frozen_coins', [self.txid1 + ':0'])
+        w = wallet.ImportedAddressWallet(storage)
+
+        self.assertEqual({(self.txid1, 3): self.txid2}, w.pruned_txo)
+        self.assertTrue(w.is_frozen_coin(self.txid1 + ':0'))
+        self.assertTrue(w.is_frozen_coin((self.txid1, 0)))
+        (addr, l), = w.txi[self.txid2].items()
+        self.assertEqual([((self.txid1, 0), 1000)], l)
+
+        w.save_transactions()
+        self.assertEqual({self.txid1 + ':3': self.txid2}, storage.get('pruned_txo'))
+        self.assertEqual([[self.txid1 + ':0', 1000]],
+                         [list(x) for x in storage.get('txi')[self.txid2][self.address]])
+
+    @mock.patch.object(WalletStorage, '_write')
+    def test_utxo_index(self, mock_write):
+        storage = WalletStorage('if_this_exists_mocking_failed_648151893')
+        storage.put('wallet_type', 'imported_addr')
+        storage.put('addresses', [self.address])
+        storage.put('addr_history', {self.address: [[self.txid1, 100], [self.txid2, 0]]})
+        storage.put('txo', {self.txid1: {self.address: [[0, 1000, False], [1, 2000, False]]},
+                            self.txid2: {self.address: [[0, 900, False]]}})
+        storage.put('txi', {self.txid2: {self.address: [[self.txid1 + ':0', 1000]]}})
+        w = wallet.ImportedAddressWallet(storage)
+
+        utxos = w.get_utxos()
+        self.assertEqual({(self.txid1, 1), (self.txid2, 0)},
+                         {(x['prevout_hash'], x['prevout_n']) for x in utxos})
+        self.assertEqual(1, len(w.get_utxos(confirmed_only=True)))
+        w.set_frozen_coin_state([self.txid1 + ':1'], True)
+        self.assertEqual([(self.txid2, 0)],
+                         [(x['prevout_hash'], x['prevout_n']) for x in w.get_utxos(exclude_frozen=True)])
+        self.assertEqual(set(w.get_addr_utxo(w.get_addresses()[0])),
+                         {(self.txid1, 1), (self.txid2, 0)})
+
+    @mock.patch.object(WalletStorage, '_write')
+    def test_slp_token_summary(self, mock_write):
+        token_id = 'cc' * 32
+        storage = WalletStorage('if_this_exists_mocking_failed_648151893')
+        storage.put('wallet_type', 'imported_addr')
+        storage.put('addresses', [self.address])
+        storage.put('addr_history', {self.address: [[self.txid1, 100], [self.txid2, 0]]})
+        storage.put('txo', {self.txid1: {self.address: [[1, 546, False], [2, 546, False]]},
+                            self.txid2: {self.address: [[1, 546, False]]}})
+        storage.put('slp_txo', {self.address: {
+            self.txid1: {'1': {'type': 'SLP1', 'token_id': token_id, 'qty': 50},
+                         '2': {'type': 'SLP1', 'token_id': token_id, 'qty': 'MINT_BATON'}},
+            self.txid2: {'1': {'type': 'SLP1', 'token_id': token_id, 'qty': 7}}}})
+        storage.put('tx_tokinfo', {
+            self.txid1: {'type': 'SLP1', 'transaction_type': 'MINT', 'token_id': token_id, 'validity': 1},
+            self.txid2: {'type': 'SLP1', 'transaction_type': 'SEND', 'token_id': token_id, 'validity': 0}})
+        storage.put('slp_data_version', 3)
+        w = wallet.ImportedAddressWallet(storage)
+
+        self.assertEqual(wallet.SlpTokenSummary(50, 7, 0, 0, 1), w.get_slp_token_summary(token_id))
+        self.assertEqual(wallet.SlpTokenSummary(50, 0, 0, 0, 1), w.get_slp_token_summary(token_id, confirmed_only=True))
+        self.assertEqual({token_id: wallet.SlpTokenSummary(50, 7, 0, 0, 1)}, w.get_slp_token_summaries())
+        w.set_frozen_coin_state([self.txid1 + ':1'], True)
+        w.tx_tokinfo[self.txid2]['validity'] = 3
+        w.slp_validity_changed(self.txid2)
+        self.assertEqual((50, 0, 7, 0, 50), w.get_slp_token_balance(token_id, {}))
+        w.receive_history_callback(w.get_addresses()[0], [(self.txid1, 100)], {})
+        self.assertEqual(wallet.SlpTokenSummary(50, 0, 0, 50, 1), w.get_slp_token_summary(token_id))
+        self.assertEqual(wallet.SlpTokenSummary(0, 0, 0, 0, 0), w.get_slp_token_summary('dd' * 32))
+        with self.assertRaises(wallet.SlpNoMintingBatonFound):
+            w.get_slp_token_baton('dd' * 32)
+
+    @mock.patch.object(WalletStorage, '_write')
+    def test_wallet_changes(self, mock_write):
+        storage = WalletStorage('if_this_exists_mocking_failed_648151893')
+        storage.put('wallet_type', 'imported_addr')
+        storage.put('addresses', [self.address])
+        storage.put('addr_history', {self.address: [[self.txid1, 100], [self.txid2, 0]]})
+        storage.put('txo', {self.txid1: {self.address: [[0, 1000, False], [1, 2000, False]]}})
+        w = wallet.ImportedAddressWallet(storage)
+        w.prepare_for_verifier()
+        addr = w.get_addresses()[0]
+        nothing = wallet.WalletDelta(set(), set(), set(), set())
+
+        woken = []
+        changes = w.watch_changes(lambda: woken.append(1))
+        self.assertIsNone(changes.take())  # everything, at first
+        self.assertEqual(nothing, changes.take())
+        self.assertFalse(changes.pending())
+        w.set_frozen_coin_state([self.txid1 + ':1'], True)
+        w.set_frozen_state([addr], True)
+        self.assertTrue(changes.pending())
+        self.assertEqual(1, len(woken))  # only when changes became pending
+        self.assertEqual(wallet.WalletDelta(set(), {addr}, {(self.txid1, 1)}, set()), changes.take())
+        w.receive_history_callback(addr, [(self.txid1, 100)], {})
+        self.assertEqual(wallet.WalletDelta({self.txid2}, {addr}, set(), set()), changes.take())
+        w.add_unverified_tx(self.txid1, 100)  # no change
+        w.add_unverified_tx(self.txid1, 101)  # as after a reorg
+        self.assertEqual(wallet.WalletDelta({self.txid1}, set(), set(), set()), changes.take())
+        w.unwatch_changes(changes)
+        w.set_frozen_state([addr], False)
+        self.assertEqual(nothing, changes.take())
@@ -0,0 +1,47 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+
+from .. import x509
+
+
+class TestCertificateStore(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.ca_path = os.path.join(self.dir, 'cacert.pem')
+        shutil.copy(requests.certs.where(), self.ca_path)
+        self.index_path = os.path.join(self.dir, 'cache', 'ca_index.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_index(self):
+        ca_list, ca_keyID = x509.load_certificates(self.ca_path)
+        store = x509.CertificateStore(self.ca_path, self.index_path)
+        self.assertTrue(os.path.exists(self.index_path))
+        self.assertEqual(ca_keyID, store.keyIDs)
+        self.assertEqual(set(ca_list), set(store))
+        with mock.patch.object(x509, 'X509', side_effect=AssertionError('parsed')):
+            store = x509.CertificateStore(self.ca_path, self.index_path)
+        self.assertEqual(ca_keyID, store.keyIDs)
+        fp = next(iter(ca_list))
+        self.assertEqual(ca_list[fp].get_common_name(), store[fp].get_common_name())
+        self.assertIs(store[fp], store[fp])
+
+    def test_invalidation(self):
+        x509.CertificateStore(self.ca_path, self.index_path)
+        with open(self.ca_path, 'r', encoding='utf-8') as f:
+            certs = f.read().split('-----END CERTIFICATE-----')
+        with open(self.ca_path, 'w', encoding='utf-8') as f:
+            f.write('-----END CERTIFICATE-----'.join(certs[1:]))
+        store = x509.CertificateStore(self.ca_path, self.index_path)
+        self.assertEqual(x509.load_certificates(self.ca_path)[1], store.keyIDs)
+        # touched but unchanged: the index is reused
+        os.utime(self.ca_path, (0, 0))
+        with mock.patch.object(x509, 'X509', side_effect=AssertionError('parsed')):
+            x509.CertificateStore(self.ca_path, self.index_path)
@@ -34,9 +34,13 @@ from .bitcoin import *
 from .address import (PublicKey, Address, Script, ScriptOutput, hash160,
                       UnknownAddress, OpCodes as opcodes,
                       P2PKH_prefix, P2PKH_suffix, P2SH_prefix, P2SH_suffix)
+from . import ecc_fast
 from . import schnorr
 from . import util
+from concurrent.futures import ThreadPoolExecutor
+import os
 import struct
+import time
 import warnings
 
 #
@@ -699,6 +703,10 @@ class Transaction:
     def serialize_outpoint(self, txin):
         return bh2u(bfh(txin['prevout_hash'])[::-1]) + int_to_hex(txin['prevout_n'], 4)
 
+    @staticmethod
+    def _serialize_outpoint_bytes(txin):
+        return bytes.fromhex(txin['prevout_hash'])[::-1] + struct.pack('<I', txin['prevout_n'])
+
     @classmethod
     def serialize_input(self, txin, script, estimate_size=False):
         # Prev hash and index
@@ -775,8 +783,8 @@ class Transaction:
                 else:
                     del cmeta, res, self._cached_sighash_tup
 
-        hashPrevouts = Hash(bfh(''.join(self.serialize_outpoint(txin) for txin in inputs)))
-        hashSequence = Hash(bfh(''.join(int_to_hex(txin.get('sequence', 0xffffffff - 1), 4) for txin in inputs)))
+        hashPrevouts = Hash(b''.join(self._serialize_outpoint_bytes(txin) for txin in inputs))
+        hashSequence = Hash(b''.join(struct.pack('<I', txin.get('sequence', 0xffffffff - 1)) for txin in inputs))
         hashOutputs = Hash(bfh(''.join(self.serialize_output(o) for o in outputs)))
 
         res = hashPrevouts, hashSequence, hashOutputs
@@ -786,28 +794,43 @@ class Transaction:
         return res
 
     def serialize_preimage(self, i, nHashType=0x00000041, use_cache = False):
-        """ See `.calc_common_sighash` for explanation of use_cache feature """
+        """ See `.calc_common_sighash` for explanation of use_cache feature.
+        Returns the preimage as a hex string; see `serialize_preimage_bytes`
+        for the raw bytes version. """
+        return self.serialize_preimage_bytes(i, nHashType, use_cache=use_cache).hex()
+
+    def serialize_preimage_bytes(self, i, nHashType=0x00000041, use_cache = False):
+        """ Like `serialize_preimage` but returns bytes, avoiding the hex
+        round-trip. See `.calc_common_sighash` for explanation of use_cache
+        feature """
+        return self._preimage_bytes(i, nHashType, self.calc_common_sighash(use_cache = use_cache))
+
+    def _preimage_bytes(self, i, nHashType, common_sighash):
         if (nHashType & 0xff) != 0x41:
             raise ValueError("other hashtypes not supported; submit a PR to fix this!")
 
-        nVersion = int_to_hex(self.version, 4)
-        nHashType = int_to_hex(nHashType, 4)
-        nLocktime = int_to_hex(self.locktime, 4)
-
         txin = self.inputs()[i]
-        outpoint = self.serialize_outpoint(txin)
-        preimage_script = self.get_preimage_script(txin)
-        scriptCode = var_int(len(preimage_script) // 2) + preimage_script
+        preimage_script = bfh(self.get_preimage_script(txin))
         try:
-            amount = int_to_hex(txin['value'], 8)
+            amount = struct.pack('<Q', txin['value'])
         except KeyError:
             raise InputValueMissing
-        nSequence = int_to_hex(txin.get('sequence', 0xffffffff - 1), 4)
-
-        hashPrevouts, hashSequence, hashOutputs = self.calc_common_sighash(use_cache = use_cache)
 
-        preimage = nVersion + bh2u(hashPrevouts) + bh2u(hashSequence) + outpoint + scriptCode + amount + nSequence + bh2u(hashOutputs) + nLocktime + nHashType
-        return preimage
+        hashPrevouts, hashSequence, hashOutputs = common_sighash
+
+        return b''.join((
+            struct.pack('<I', self.version),
+            hashPrevouts,
+            hashSequence,
+            self._serialize_outpoint_bytes(txin),
+            bfh(var_int(len(preimage_script))),
+            preimage_script,
+            amount,
+            struct.pack('<I', txin.get('sequence', 0xffffffff - 1)),
+            hashOutputs,
+            struct.pack('<I', self.locktime),
+            struct.pack('<I', nHashType),
+        ))
 
     def serialize(self, estimate_size=False):
         nVersion = int_to_hex(self.version, 4)
@@ -959,13 +982,33 @@ class Transaction:
         return sig
 
 
+    # Transactions with at least this many signatures to produce are signed
+    # on a small thread pool, if libsecp256k1 is available (its ctypes calls
+    # release the GIL, so threads actually run concurrently).
+    SIGN_PARALLEL_MIN_SIGS = 16
+    SIGN_MAX_WORKERS = 8
+
     def sign(self, keypairs, *, use_cache=False):
+        ''' Sign all inputs we have keys for. This is done in phases: first
+        the (input, key) pairs to sign are collected, then the sighash digests
+        are computed (once per input, sharing the common sighash), then the
+        digests are signed (concurrently for big txs, see
+        `SIGN_PARALLEL_MIN_SIGS`), and finally the signatures are added to the
+        inputs. Per-phase timings end up in `self.ephemeral['sign_timings']`. '''
+        nHashType = 0x00000041 # hardcoded, perhaps should be taken from unsigned input dict
+        t0 = time.time()
+        jobs = []  # [(i, j, sec, compressed)]
         for i, txin in enumerate(self.inputs()):
+            if self.is_txin_complete(txin):
+                # txin is complete
+                continue
+            needed = txin.get('num_sig', 1) - len(list(filter(None, txin['signatures'])))
             pubkeys, x_pubkeys = self.get_sorted_pubkeys(txin)
             for j, (pubkey, x_pubkey) in enumerate(zip(pubkeys, x_pubkeys)):
-                if self.is_txin_complete(txin):
-                    # txin is complete
+                if needed <= 0:
                     break
+                if txin['signatures'][j]:
+                    continue
                 if pubkey in keypairs:
                     _pubkey = pubkey
                     kname = 'pubkey'
@@ -976,16 +1019,73 @@ class Transaction:
                     continue
                 print_error(f"adding signature for input#{i} sig#{j}; {kname}: {_pubkey} schnorr: {self._sign_schnorr}")
                 sec, compressed = keypairs.get(_pubkey)
-                self._sign_txin(i, j, sec, compressed, use_cache=use_cache)
+                jobs.append((i, j, sec, compressed))
+                needed -= 1
+
+        t1 = time.time()
+        pre_hashes = {}
+        if jobs:
+            # The signing below doesn't touch the non-signature parts of the
+            # tx, so the common sighash can be shared by all inputs even if
+            # use_cache is False.
+            common_sighash = self.calc_common_sighash(use_cache=use_cache)
+            for i, *_ in jobs:
+                if i not in pre_hashes:
+                    pre_hashes[i] = Hash(self._preimage_bytes(i, nHashType, common_sighash))
+
+        t2 = time.time()
+        def do_sign(job):
+            i, j, sec, compressed = job
+            return self._sign_digest(i, j, sec, compressed, pre_hashes[i])
+        if len(jobs) >= self.SIGN_PARALLEL_MIN_SIGS and self._can_sign_in_parallel():
+            with ThreadPoolExecutor(max_workers=min(self.SIGN_MAX_WORKERS, os.cpu_count() or 1),
+                                    thread_name_prefix='TxSign') as executor:
+                results = list(executor.map(do_sign, jobs))
+        else:
+            results = [do_sign(job) for job in jobs]
+
+        t3 = time.time()
+        for (i, j, sec, compressed), res in zip(jobs, results):
+            if res is None:
+                continue
+            pubkey, sig = res
+            txin = self._inputs[i]
+            txin['signatures'][j] = bh2u(sig + bytes((nHashType & 0xff,)))
+            txin['pubkeys'][j] = pubkey # needed for fd keys
         print_error("is_complete", self.is_complete())
         self.raw = self.serialize()
 
+        t4 = time.time()
+        self.ephemeral['sign_timings'] = timings = {
+            'collect': t1 - t0, 'preimage': t2 - t1, 'sign': t3 - t2,
+            'serialize': t4 - t3, 'num_sigs': len(jobs),
+        }
+        print_error("sign timings: {num_sigs} sigs, collect {collect:.3f}s, preimage {preimage:.3f}s,"
+                    " sign {sign:.3f}s, serialize {serialize:.3f}s".format(**timings))
+
+    def _can_sign_in_parallel(self):
+        if self._sign_schnorr:
+            return schnorr.has_fast_sign()
+        return ecc_fast.is_using_fast_ecc()
+
     def _sign_txin(self, i, j, sec, compressed, *, use_cache=False):
         '''Note: precondition is self._inputs is valid (ie: tx is already deserialized)'''
-        pubkey = public_key_from_private_key(sec, compressed)
-        # add signature
         nHashType = 0x00000041 # hardcoded, perhaps should be taken from unsigned input dict
-        pre_hash = Hash(bfh(self.serialize_preimage(i, nHashType, use_cache=use_cache)))
+        pre_hash = Hash(self.serialize_preimage_bytes(i, nHashType, use_cache=use_cache))
+        res = self._sign_digest(i, j, sec, compressed, pre_hash)
+        if res is None:
+            return None
+        pubkey, sig = res
+        txin = self._inputs[i]
+        txin['signatures'][j] = bh2u(sig + bytes((nHashType & 0xff,)))
+        txin['pubkeys'][j] = pubkey # needed for fd keys
+        return txin
+
+    def _sign_digest(self, i, j, sec, compressed, pre_hash):
+        ''' Signs pre_hash, returning (pubkey_hex, sig_bytes), or None if the
+        signature failed to verify. Doesn't modify the tx, so it is safe to
+        call from several threads at once. '''
+        pubkey = public_key_from_private_key(sec, compressed)
         if self._sign_schnorr:
             sig = self._schnorr_sign(pubkey, sec, pre_hash)
         else:
@@ -994,10 +1094,7 @@ class Transaction:
         if not self.verify_signature(bfh(pubkey), sig, pre_hash, reason=reason):
             print_error(f"Signature verification failed for input#{i} sig#{j}, reason: {str(reason)}")
             return None
-        txin = self._inputs[i]
-        txin['signatures'][j] = bh2u(sig + bytes((nHashType & 0xff,)))
-        txin['pubkeys'][j] = pubkey # needed for fd keys
-        return txin
+        return pubkey, sig
 
     def get_outputs(self):
         """convert pubkeys to addresses"""
@@ -489,16 +489,19 @@ def format_satoshis_plain(x, decimal_point = 8):
     return "{:.8f}".format(PyDecimal(x) / scale_factor).rstrip('0').rstrip('.')
 
 _cached_dp = None
-from .caches import ExpiringCache
 # This cache will eat about ~6MB of memory per 20,000 items, but it does make
-# format_satoshis() run over 3x faster.
-_fmt_sats_cache = ExpiringCache(maxlen=20000, name='format_satoshis cache')
+# format_satoshis() run over 3x faster. It is created on first use because
+# caches.py imports this module.
+_fmt_sats_cache = None
 def format_satoshis(x, num_zeros=0, decimal_point=8, precision=None, is_diff=False, whitespaces=False):
-    global _cached_dp
+    global _cached_dp, _fmt_sats_cache
     if x is None:
         return _('Unknown')
     if precision is None:
         precision = decimal_point
+    if _fmt_sats_cache is None:
+        from .caches import ExpiringCache
+        _fmt_sats_cache = ExpiringCache(maxlen=20000, name='format_satoshis cache')
     cache_key = (x,num_zeros,decimal_point,precision,is_diff,whitespaces)
     result = _fmt_sats_cache.get(cache_key)
     if result is not None:
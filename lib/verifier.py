@@ -20,6 +20,11 @@
 # ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
+import bisect
+import collections
+import random
+import time
+
 from .util import ThreadJob, bh2u
 from .bitcoin import Hash, hash_decode, hash_encode
 from . import networks
@@ -28,15 +33,25 @@ from .transaction import Transaction
 class SPV(ThreadJob):
     """ Simple Payment Verification """
 
+    max_pending = 100  # max number of merkle requests in flight, spread over the connected interfaces
+    retry_timeout = 60.0  # seconds after which an unanswered merkle request is made again
+    save_interval = 10.0  # seconds; how often verified_tx gets persisted while catching up
+    rate_window = 10.0  # seconds; verification rate is averaged over this window
+
     def __init__(self, network, wallet):
         self.wallet = wallet
         self.network = network
         self.blockchain = network.blockchain()
         self.merkle_roots = {}  # txid -> merkle root (once it has been verified)
-        self.requested_merkle = set()  # txid set of pending requests
+        self.requested_merkle = {}  # txid -> (time requested, message id, interface), of pending requests
+        self.headers = {}  # (blockchain, height) -> header, read at most once per block per tick
         self.qbusy = False
         self.cleaned_up = False
         self._need_release = False
+        self._need_save = False  # verified_tx has changed since it was last persisted
+        self._last_save = time.time()
+        self._verify_times = collections.deque()  # times of the verifications of the last rate_window seconds
+        self._num_verified = 0
 
     def _release(self):
         ''' Called from the Network (DaemonThread) -- to prevent race conditions
@@ -46,17 +61,31 @@ class SPV(ThreadJob):
         self.cleaned_up = True
         self.network.cancel_requests(self.verify_merkle)
         self.network.remove_jobs([self])
+        if self._need_save:
+            self._save()
 
     def release(self):
         ''' Called from main thread, enqueues a 'release' to happen in the
         Network thread. '''
         self._need_release = True
 
+    def read_header(self, blockchain, height):
+        ''' Returns the header at height, reading it from blockchain only the
+        first time it's asked for during the current tick. '''
+        key = (blockchain, height)
+        try:
+            return self.headers[key]
+        except KeyError:
+            header = self.headers[key] = blockchain.read_header(height)
+            return header
+
     def run(self):
         if self._need_release:
             self._release()
         if self.cleaned_up:
             return
+        self.headers.clear()
+        self._maybe_save()
         interface = self.network.interface
         if not interface:
             self.spam_error("v.no interface")
@@ -67,46 +96,79 @@ class SPV(ThreadJob):
             self.spam_error("v.no blockchain", interface.server)
             return
 
+        now = time.time()
+        interfaces = self.network.get_interfaces(interfaces=True) or [interface]
+        live = set(interfaces)
+        for tx_hash, (t, msg_id, iface) in list(self.requested_merkle.items()):
+            if now - t > self.retry_timeout or iface not in live:
+                # unanswered for too long, or the interface it went to has
+                # gone away: forget the request, so that it's asked again
+                self.forget_request(tx_hash)
+
         local_height = self.network.get_local_height()
-        unverified = self.wallet.get_unverified_txs()
-        for tx_hash, tx_height in unverified.items():
+        # group the txs by block, so each block's header is read once and
+        # its txs are requested together, lowest blocks first
+        by_height = collections.defaultdict(list)
+        for tx_hash, tx_height in self.wallet.get_unverified_txs().items():
             # do not request merkle branch if we already requested it
             if tx_hash in self.requested_merkle or tx_hash in self.merkle_roots:
                 continue
             # or before headers are available
             if tx_height <= 0 or tx_height > local_height:
                 continue
+            by_height[tx_height].append(tx_hash)
 
+        self.qbusy = False
+        chunks_requested = set()
+        for tx_height in sorted(by_height):
+            if len(self.requested_merkle) >= self.max_pending:
+                self.qbusy = True
+                break
             # if it's in the checkpoint region, we still might not have the header
-            header = blockchain.read_header(tx_height)
+            header = self.read_header(blockchain, tx_height)
             if header is None:
-                if tx_height <= networks.net.VERIFICATION_BLOCK_HEIGHT:
+                index = tx_height // 2016
+                if tx_height <= networks.net.VERIFICATION_BLOCK_HEIGHT and index not in chunks_requested:
                     # Per-header requests might be a lot heavier.
                     # Also, they're not supported as header requests are
                     # currently designed for catching up post-checkpoint headers.
-                    index = tx_height // 2016
+                    chunks_requested.add(index)
                     if self.network.request_chunk(interface, index):
                         interface.print_error("verifier requesting chunk {} for height {}".format(index, tx_height))
                 continue
-            # enqueue request
-            msg_id = self.network.get_merkle_for_transaction(tx_hash, tx_height,
-                                                             self.verify_merkle)
-            self.qbusy = msg_id is None
-            if self.qbusy:
-                # interface queue busy, will try again later
-                break
-            self.print_error('requested merkle', tx_hash)
-            self.requested_merkle.add(tx_hash)
+            tx_hashes = by_height[tx_height][:self.max_pending - len(self.requested_merkle)]
+            for tx_hash in tx_hashes:
+                # enqueue request, on any of the connected interfaces since
+                # the proofs are checked against our own headers
+                iface = random.choice(interfaces)
+                msg_id = self.network.get_merkle_for_transaction(tx_hash, tx_height,
+                                                                 self.verify_merkle,
+                                                                 max_qlen=None,
+                                                                 interface=iface)
+                if msg_id is None:
+                    self.qbusy = True
+                    break
+                self.requested_merkle[tx_hash] = (now, msg_id, iface)
+            self.print_error('requested {} merkle(s) for height {}'.format(len(tx_hashes), tx_height))
 
         if self.network.blockchain() != self.blockchain:
             self.blockchain = self.network.blockchain()
             self.undo_verifications()
 
+    def forget_request(self, tx_hash):
+        ''' Drops the pending merkle request for tx_hash, and its entry in
+        the network's unanswered requests, so that an answer that comes
+        late gets ignored. '''
+        req = self.requested_merkle.pop(tx_hash, None)
+        if req:
+            self.network.unanswered_requests.pop(req[1], None)
+
     def verify_merkle(self, response):
         if self.cleaned_up:
             return  # we have been killed, this was just an orphan callback
         if response.get('error'):
-            # FIXME: tx will never verify now until server reconnect.
+            # The request is retried after retry_timeout, likely on another
+            # interface.
             self.print_error('received an error:', response)
             return
         params = response['params']
@@ -122,10 +184,9 @@ class SPV(ThreadJob):
             self.print_error(f"exception while verifying tx {tx_hash}: {repr(e)}")
             return
 
-        header = self.network.blockchain().read_header(tx_height)
-        # FIXME: if verification fails below,
-        # we should make a fresh connection to a server to
-        # recover from this, as this TX will now never verify
+        header = self.read_header(self.network.blockchain(), tx_height)
+        # if verification fails below, the request is made again after
+        # retry_timeout (from a random interface, so likely another server)
         if not header:
             self.print_error(
                 "merkle verification failed for {} (missing header {})"
@@ -140,13 +201,52 @@ class SPV(ThreadJob):
         self.merkle_roots[tx_hash] = merkle_root
         # note: we could pop in the beginning, but then we would request
         # this proof again in case of verification failure from the same server
-        self.requested_merkle.discard(tx_hash)
+        self.requested_merkle.pop(tx_hash, None)
         self.print_error("verified %s" % tx_hash)
         self.wallet.add_verified_tx(tx_hash, (tx_height, header.get('timestamp'), pos))
+        self._need_save = True
+        now = time.time()
+        self._num_verified += 1
+        self._verify_times.append(now)
+        self._trim_verify_times(now)
         if self.is_up_to_date() and self.wallet.is_up_to_date() and not self.qbusy:
-            self.wallet.save_verified_tx(write=True)
+            self._save()
             self.network.trigger_callback('wallet_updated', self.wallet)  # This callback will happen very rarely.. mostly right as the last tx is verified. It's to ensure GUI is updated fully.
 
+    def _maybe_save(self):
+        ''' While catching up, persist verified_tx every save_interval seconds
+        rather than on every verification. '''
+        if self._need_save and time.time() - self._last_save >= self.save_interval:
+            self._save()
+
+    def _save(self):
+        self._need_save = False
+        self._last_save = time.time()
+        self.wallet.save_verified_tx(write=True)
+
+    def _trim_verify_times(self, now):
+        ''' Drops the verification times older than rate_window seconds.
+        Only called from the network thread, which appends them. '''
+        cutoff = now - self.rate_window
+        times = self._verify_times
+        while times and times[0] < cutoff:
+            times.popleft()
+
+    def get_verification_rate(self):
+        ''' Returns the number of txs verified per second, averaged over the
+        last rate_window seconds. '''
+        cutoff = time.time() - self.rate_window
+        times = list(self._verify_times)  # copy, as the network thread modifies it
+        return (len(times) - bisect.bisect_left(times, cutoff)) / self.rate_window
+
+    def get_stats(self):
+        return {
+            'pending': len(self.requested_merkle),
+            'unverified': self.wallet.get_unverified_tx_pending_count(),
+            'verified': self._num_verified,
+            'rate': round(self.get_verification_rate(), 2),
+        }
+
     @classmethod
     def hash_merkle_root(cls, merkle_s, target_hash, pos):
         h = hash_decode(target_hash)
@@ -185,7 +285,7 @@ class SPV(ThreadJob):
 
     def remove_spv_proof_for_tx(self, tx_hash):
         self.merkle_roots.pop(tx_hash, None)
-        self.requested_merkle.discard(tx_hash)
+        self.forget_request(tx_hash)
 
     def is_up_to_date(self):
         return not self.requested_merkle
@@ -29,15 +29,17 @@
 
 
 import copy
+import csv
 import errno
 import json
 import os
 import queue
 import random
 import re
+import sys
 import time
 import threading
-from collections import defaultdict
+from collections import defaultdict, namedtuple
 from functools import partial
 
 from .i18n import ngettext
@@ -83,6 +85,18 @@ from .i18n import _
 
 DEFAULT_CONFIRMED_ONLY = False
 
+def outpoint_from_string(ser):
+    ''' Converts a legacy "prevout_hash:n" string to the (prevout_hash, n)
+    tuple the wallet uses internally to key outpoints. The txid string is
+    interned so that all outpoints of the same tx share a single copy. '''
+    prevout_hash, n = ser.rsplit(':', 1)
+    return sys.intern(prevout_hash), int(n)
+
+def outpoint_to_string(outpoint):
+    ''' The inverse of outpoint_from_string. Used at the storage and RPC
+    boundaries only. '''
+    return '{}:{}'.format(*outpoint)
+
 def relayfee(network):
     RELAY_FEE = 5000
     MAX_RELAY_FEE = 50000
@@ -170,6 +184,71 @@ def sweep(privkeys, network, config, recipient, fee=None, imax=100, sign_schnorr
     return tx
 
 
+WalletDelta = namedtuple('WalletDelta', 'txs addresses coins tokens')
+
+# The unspent coins of a token in a wallet: the quantities of valid, not yet
+# validated and invalid tokens, of the valid ones which are frozen, and the
+# number of valid minting batons.
+SlpTokenSummary = namedtuple('SlpTokenSummary', 'valid unvalidated invalid frozen batons')
+
+
+class WalletChanges:
+    ''' A coalescing feed of what changed in a wallet since it was last taken,
+    as collected for whoever called Abstract_Wallet.watch_changes() (such as
+    a GUI list that only updates the rows of those):
+      - txs: the hashes of the txs added, removed, (un)verified or whose SLP
+        validity was determined,
+      - addresses: the addresses whose history, balance or frozen state
+        changed,
+      - coins: the (prevout_hash, n) whose frozen state changed,
+      - tokens: the token ids whose txs, validity or details changed.
+    However many times something changes between two takes it is reported
+    once, so subscribers can apply the changes at whatever rate suits them.
+
+    If given, on_change is called (from whichever thread made the change)
+    when something changes while there were no changes pending, so that a
+    subscriber need not poll. '''
+
+    def __init__(self, on_change=None):
+        self.lock = threading.Lock()
+        self.on_change = on_change
+        self.txs = set()
+        self.addresses = set()
+        self.coins = set()  # (prevout_hash, n)
+        self.tokens = set()
+        self.everything = True
+
+    def pending(self):
+        return bool(self.everything or self.txs or self.addresses or self.coins or self.tokens)
+
+    def add(self, *, txs=(), addresses=(), coins=(), tokens=()):
+        with self.lock:
+            was_pending = self.pending()
+            self.txs.update(txs)
+            self.addresses.update(addresses)
+            self.coins.update(coins)
+            self.tokens.update(tokens)
+            wake = not was_pending and self.pending()
+        if wake and self.on_change:
+            self.on_change()
+
+    def add_everything(self):
+        with self.lock:
+            wake = not self.pending()
+            self.everything = True
+        if wake and self.on_change:
+            self.on_change()
+
+    def take(self):
+        ''' Returns a WalletDelta of what changed, or None if everything may
+        have changed, and starts collecting anew. '''
+        with self.lock:
+            ret = None if self.everything else WalletDelta(self.txs, self.addresses, self.coins, self.tokens)
+            self.txs, self.addresses, self.coins, self.tokens = set(), set(), set(), set()
+            self.everything = False
+            return ret
+
+
 class Abstract_Wallet(PrintError):
     """
     Wallet classes are created to handle various address generation methods.
@@ -205,6 +284,28 @@ class Abstract_Wallet(PrintError):
         # Python's GIL makes thread-safe implicitly).
         self._addr_bal_cache = {}
 
+        # Per-address UTXO index: Address -> dict of
+        # (prevout_hash, n) -> (height, value, is_coinbase, is_slp) for the
+        # coins of that address which are still unspent. It is invalidated
+        # alongside self._addr_bal_cache (whenever a tx involving the address
+        # is added or removed, or its history changes) and is (re)built under
+        # self.lock by _get_addr_utxo_index. get_addr_utxo, get_utxos and
+        # friends read from it rather than re-walking self.txo/self.txi.
+        self._addr_utxo_cache = {}
+
+        # Per-token sums of the unspent SLP coins, see get_slp_token_summary.
+        # They are kept up to date address by address: the addresses whose
+        # coins, frozen state or coin validities change are marked dirty
+        # (from any thread, hence the lock) and their sums are recomputed on
+        # next use.
+        self._slp_sums_lock = threading.Lock()
+        self._slp_sums_reset()
+
+        # The WalletChanges of those who watch_changes(), told about every tx,
+        # address, coin and token of ours whose state changes. Replaced rather
+        # than modified so that it can be iterated from any thread.
+        self._wallet_changes = ()
+
         # We keep a set of the wallet and receiving addresses so that is_mine()
         # checks are O(logN) rather than O(N). This creates/resets that cache.
         self.invalidate_address_set_cache()
@@ -216,12 +317,12 @@ class Abstract_Wallet(PrintError):
         self.labels                = storage.get('labels', {})
         # Frozen addresses
         frozen_addresses = storage.get('frozen_addresses',[])
-        self.frozen_addresses = set(Address.from_string(addr)
-                                    for addr in frozen_addresses)
+        self.frozen_addresses = set(Address.from_strings(frozen_addresses))
         # Frozen coins (UTXOs) -- note that we have 2 independent levels of "freezing": address-level and coin-level.
         # The two types of freezing are flagged independently of each other and 'spendable' is defined as a coin that satisfies
         # BOTH levels of freezing.
-        self.frozen_coins = set(storage.get('frozen_coins', []))
+        self.frozen_coins = set(outpoint_from_string(ser)
+                                for ser in storage.get('frozen_coins', []))
         # address -> list(txid, height)
         history = storage.get('addr_history',{})
         self._history = self.to_Address_dict(history)
@@ -278,13 +379,12 @@ class Abstract_Wallet(PrintError):
     @classmethod
     def to_Address_dict(cls, d):
         '''Convert a dict of strings to a dict of Adddress objects.'''
-        return {Address.from_string(text): value for text, value in d.items()}
+        return dict(zip(Address.from_strings(d), d.values()))
 
     @classmethod
     def from_Address_dict(cls, d):
         '''Convert a dict of Address objects to a dict of strings.'''
-        return {addr.to_storage_string(): value
-                for addr, value in d.items()}
+        return dict(zip(Address.to_strings(Address.FMT_LEGACY, d), d.values()))
 
     def diagnostic_name(self):
         return self.basename()
@@ -298,7 +398,9 @@ class Abstract_Wallet(PrintError):
     @profiler
     def load_transactions(self):
         txi = self.storage.get('txi', {})
-        self.txi = {tx_hash: self.to_Address_dict(value)
+        self.txi = {tx_hash: dict(zip(Address.from_strings(value),
+                                      ([(outpoint_from_string(ser), v) for ser, v in l]
+                                       for l in value.values())))
                     for tx_hash, value in txi.items()
                     # skip empty entries to save memory and disk space
                     if value}
@@ -308,7 +410,8 @@ class Abstract_Wallet(PrintError):
                     # skip empty entries to save memory and disk space
                     if value}
         self.tx_fees = self.storage.get('tx_fees', {})
-        self.pruned_txo = self.storage.get('pruned_txo', {})
+        self.pruned_txo = {outpoint_from_string(ser): tx_hash
+                           for ser, tx_hash in self.storage.get('pruned_txo', {}).items()}
         self.pruned_txo_values = set(self.pruned_txo.values())
         tx_list = self.storage.get('transactions', {})
 
@@ -323,6 +426,7 @@ class Abstract_Wallet(PrintError):
         self.slpv1_validity = self.storage.get('slpv1_validity', {})
         self.token_types = self.storage.get('token_types', {})
         self.tx_tokinfo = self.storage.get('tx_tokinfo', {})
+        self._slp_ledger_reset()
 
         # load up slp_txo as defaultdict-of-defaultdict-of-dicts
         self._slp_txo = defaultdict(lambda: defaultdict(dict))
@@ -342,7 +446,9 @@ class Abstract_Wallet(PrintError):
             for k,v in self.transactions.items():
                 tx[k] = str(v)
             self.storage.put('transactions', tx)
-            txi = {tx_hash: self.from_Address_dict(value)
+            txi = {tx_hash: dict(zip(Address.to_strings(Address.FMT_LEGACY, value),
+                                     ([(outpoint_to_string(op), v) for op, v in l]
+                                      for l in value.values())))
                    for tx_hash, value in self.txi.items()
                    # skip empty entries to save memory and disk space
                    if value}
@@ -353,7 +459,7 @@ class Abstract_Wallet(PrintError):
             self.storage.put('txi', txi)
             self.storage.put('txo', txo)
             self.storage.put('tx_fees', self.tx_fees)
-            self.storage.put('pruned_txo', self.pruned_txo)
+            self._save_pruned_txo()
             history = self.from_Address_dict(self._history)
             self.storage.put('addr_history', history)
 
@@ -368,6 +474,11 @@ class Abstract_Wallet(PrintError):
             if write:
                 self.storage.write()
 
+    def _save_pruned_txo(self):
+        ''' Callers are expected to hold self.lock '''
+        self.storage.put('pruned_txo', {outpoint_to_string(op): tx_hash
+                                        for op, tx_hash in self.pruned_txo.items()})
+
     def activate_slp(self):
         # This gets called in two situations:
         # - Upon wallet startup, it checks config to see if SLP should be enabled.
@@ -392,6 +503,7 @@ class Abstract_Wallet(PrintError):
         with self.lock:
             self.token_types[token_id] = dict(entry)
             self.storage.put('token_types', self.token_types)
+            self._notify_changes(tokens=(token_id,))
             for tx_hash, tti in self.tx_tokinfo.items():
                 # Fire up validation on unvalidated txes of matching token_id
                 try:
@@ -514,9 +626,10 @@ class Abstract_Wallet(PrintError):
             self.pruned_txo = {}
             self.pruned_txo_values = set()
             self.save_transactions()
-            self._addr_bal_cache = {}
+            self._invalidate_all_addresses()
             self._history = {}
             self.tx_addr_hist = defaultdict(set)
+            self._slp_ledger_reset()
 
     @profiler
     def build_reverse_history(self):
@@ -697,8 +810,9 @@ class Abstract_Wallet(PrintError):
                     self.verifier.merkle_roots.pop(tx_hash, None)
 
             # tx will be verified only if height > 0
-            if tx_hash not in self.verified_tx:
+            if tx_hash not in self.verified_tx and self.unverified_tx.get(tx_hash) != tx_height:
                 self.unverified_tx[tx_hash] = tx_height
+                self._notify_changes(txs=(tx_hash,))
 
     def add_verified_tx(self, tx_hash, info):
         # Remove from the unverified map and add to the verified map and
@@ -706,6 +820,7 @@ class Abstract_Wallet(PrintError):
             self.unverified_tx.pop(tx_hash, None)
             self.verified_tx[tx_hash] = info  # (tx_height, timestamp, pos)
             height, conf, timestamp = self.get_tx_height(tx_hash)
+        self._notify_changes(txs=(tx_hash,))
         self.network.trigger_callback('verified2', self, tx_hash, height, conf, timestamp)
 
     def get_unverified_txs(self):
@@ -732,7 +847,8 @@ class Abstract_Wallet(PrintError):
                         self.verified_tx.pop(tx_hash, None)
                         txs.add(tx_hash)
         if txs:
-            self._addr_bal_cache = {}  # this is probably not necessary -- as the receive_history_callback will invalidate bad cache items -- but just to be paranoid we clear the whole balance cache on reorg anyway as a safety measure
+            self._notify_changes(txs=txs)
+            self._invalidate_all_addresses()  # this is probably not necessary -- as the receive_history_callback will invalidate bad cache items -- but just to be paranoid we clear the whole balance cache on reorg anyway as a safety measure
         return txs
 
     def get_local_height(self):
@@ -894,7 +1010,7 @@ class Abstract_Wallet(PrintError):
         for tx_hash, height in h:
             l = self.txo.get(tx_hash, {}).get(address, [])
             for n, v, is_cb in l:
-                received[tx_hash + ':%d'%n] = (height, v, is_cb)
+                received[(tx_hash, n)] = (height, v, is_cb)
         for tx_hash, height in h:
             l = self.txi.get(tx_hash, {}).get(address, [])
             for txi, v in l:
@@ -906,6 +1022,8 @@ class Abstract_Wallet(PrintError):
             return self.tx_tokinfo[tokenid]
 
     def get_slp_token_baton(self, slpTokenId, cache=True):
+        if not self.get_slp_token_summary(slpTokenId).batons:
+            raise SlpNoMintingBatonFound()
         with self.lock:
             slp_txos = copy.deepcopy(self._slp_txo)
 
@@ -924,34 +1042,81 @@ class Abstract_Wallet(PrintError):
                         return baton_utxo
         raise SlpNoMintingBatonFound()
 
+    def watch_changes(self, on_change=None):
+        ''' Returns a WalletChanges which will collect what changes in this
+        wallet from now on, to update what is displayed of it. It starts out
+        as if everything changed. '''
+        changes = WalletChanges(on_change)
+        self._wallet_changes += (changes,)
+        return changes
+
+    def unwatch_changes(self, changes):
+        self._wallet_changes = tuple(c for c in self._wallet_changes if c is not changes)
+
+    def _notify_changes(self, **kwargs):
+        for changes in self._wallet_changes:
+            changes.add(**kwargs)
+
+    def slp_validity_changed(self, tx_hash):
+        ''' Called after the validity of tx_hash was set in self.tx_tokinfo,
+        which changes the value of the coins it created. '''
+        self._slp_sums_mark_dirty(self.tx_addr_hist.get(tx_hash, ()))
+        self._notify_tx_changed(tx_hash)
+
+    def _notify_tx_changed(self, tx_hash):
+        token_id = self.tx_tokinfo.get(tx_hash, {}).get('token_id')
+        self._notify_changes(txs=(tx_hash,), tokens=(token_id,) if token_id else ())
+
+    def _invalidate_address(self, address):
+        ''' Called whenever the history of address changes: drops its cached
+        balance and coins, and tells those watching address changes. '''
+        self._addr_bal_cache.pop(address, None)
+        self._addr_utxo_cache.pop(address, None)
+        self._slp_sums_mark_dirty((address,))
+        self._notify_changes(addresses=(address,))
+
+    def _invalidate_all_addresses(self):
+        self._addr_bal_cache = {}
+        self._addr_utxo_cache = {}
+        self._slp_sums_reset()
+        for changes in self._wallet_changes:
+            changes.add_everything()
+
+    def _get_addr_utxo_index(self, address):
+        ''' Returns the (cached) dict of (prevout_hash, n) ->
+        (height, value, is_coinbase, is_slp) for the unspent coins of
+        `address`. The returned dict must not be modified by the caller. '''
+        d = self._addr_utxo_cache.get(address)
+        if d is not None:
+            return d
+        with self.lock:
+            coins, spent = self.get_addr_io(address)
+            # removes spent coins
+            for txi in spent:
+                coins.pop(txi, None)
+                # cleanup/detect if the 'frozen coin' was spent and remove it from the frozen coin set
+                self.frozen_coins.discard(txi)
+            addrdict = self._slp_txo.get(address, {})
+            d = {txo: (tx_height, value, is_cb, txo[1] in addrdict.get(txo[0], ()))
+                 for txo, (tx_height, value, is_cb) in coins.items()}
+            self._addr_utxo_cache[address] = d
+        return d
+
     # This method is updated for SLP to prevent tokens from being spent
     # in normal txn or txns with token_id other than the one specified
     def get_addr_utxo(self, address, *, exclude_slp = True):
-        coins, spent = self.get_addr_io(address)
-        # removes spent coins
-        for txi in spent:
-            coins.pop(txi)
-            # cleanup/detect if the 'frozen coin' was spent and remove it from the frozen coin set
-            self.frozen_coins.discard(txi)
-
         """
-        SLP -- removes ALL SLP UTXOs that are either unrelated, or unvalidated
+        SLP -- if exclude_slp, removes ALL SLP UTXOs that are either unrelated, or unvalidated
         """
-        if exclude_slp:
-            with self.lock:
-                addrdict = self._slp_txo.get(address,{})
-                for txid, txdict in addrdict.items():
-                    for idx, txo in txdict.items():
-                        coins.pop(txid + ":" + str(idx), None)
-
         out = {}
-        for txo, v in coins.items():
-            tx_height, value, is_cb = v
-            prevout_hash, prevout_n = txo.split(':')
+        for txo, (tx_height, value, is_cb, is_slp) in self._get_addr_utxo_index(address).items():
+            if exclude_slp and is_slp:
+                continue
+            prevout_hash, prevout_n = txo
             x = {
                 'address':address,
                 'value':value,
-                'prevout_n':int(prevout_n),
+                'prevout_n':prevout_n,
                 'prevout_hash':prevout_hash,
                 'height':tx_height,
                 'coinbase':is_cb,
@@ -963,22 +1128,15 @@ class Abstract_Wallet(PrintError):
     """ SLP -- keeps ONLY SLP UTXOs that are either unrelated, or unvalidated """
     def get_slp_addr_utxo(self, address, slpTokenId, slp_include_invalid=False, slp_include_baton=False, ):
         with self.lock:
-            coins, spent = self.get_addr_io(address)
+            coins = {txo: v[:3] for txo, v in self._get_addr_utxo_index(address).items() if v[3]}
             addrdict = copy.deepcopy(self._slp_txo.get(address,{}))
 
-        # removes spent coins
-        for txi in spent:
-            coins.pop(txi)
-            # cleanup/detect if the 'frozen coin' was spent and remove it from the frozen coin set
-            self.frozen_coins.discard(txi)
-
         coins_to_pop = []
         for coin in coins.items():
             if coin != None:
-                txid = coin[0].split(":")[0]
-                idx = coin[0].split(":")[1]
+                txid, idx = coin[0]
                 try:
-                    slp_txo = addrdict[txid][int(idx)]
+                    slp_txo = addrdict[txid][idx]
                     with self.lock:
                         slp_tx_info = self.tx_tokinfo[txid]
                     # handle special burning modes
@@ -1001,18 +1159,18 @@ class Abstract_Wallet(PrintError):
         out = {}
         for txo, v in coins.items():
             tx_height, value, is_cb = v
-            prevout_hash, prevout_n = txo.split(':')
+            prevout_hash, prevout_n = txo
             with self.lock:
                 val = self.tx_tokinfo[prevout_hash]['validity']
             x = {
                 'address': address,
                 'value': value,
-                'prevout_n': int(prevout_n),
+                'prevout_n': prevout_n,
                 'prevout_hash': prevout_hash,
                 'height': tx_height,
                 'coinbase': is_cb,
                 'is_frozen_coin': txo in self.frozen_coins,
-                'token_value': addrdict[prevout_hash][int(prevout_n)]['qty'],
+                'token_value': addrdict[prevout_hash][prevout_n]['qty'],
                 'token_validation_state': val
             }
             out[txo] = x
@@ -1105,23 +1263,108 @@ class Abstract_Wallet(PrintError):
         return self.get_slp_utxos(slpTokenId, domain=domain, exclude_frozen=False, confirmed_only=confirmed_only)
 
     def get_slp_token_balance(self, slpTokenId, config):
-        valid_token_bal = 0
-        unvalidated_token_bal = 0
-        invalid_token_bal = 0
-        unfrozen_valid_token_bal = 0
-        slp_coins = self.get_slp_coins(slpTokenId, None, config)
-        for coin in slp_coins:
-            txid = coin['prevout_hash']
-            validity = self.tx_tokinfo[txid]['validity']
-            if validity == 1: # Valid DAG
-                valid_token_bal += coin['token_value']
-                if not coin['is_frozen_coin'] and coin['address'] not in self.frozen_addresses:
-                    unfrozen_valid_token_bal += coin['token_value']
-            elif validity > 1: # Invalid DAG (2=bad slpmessage, 3=inputs lack enough tokens / missing mint baton, 4=change token_type or bad NFT parent)
-                invalid_token_bal += coin['token_value']
-            elif validity == 0: # Unknown DAG status (should be in processing queue)
-                unvalidated_token_bal += coin['token_value']
-        return (valid_token_bal, unvalidated_token_bal, invalid_token_bal, unfrozen_valid_token_bal, valid_token_bal - unfrozen_valid_token_bal)
+        s = self.get_slp_token_summary(slpTokenId, confirmed_only=config.get('confirmed_only', False))
+        return (s.valid, s.unvalidated, s.invalid, s.valid - s.frozen, s.frozen)
+
+    def get_slp_token_summary(self, token_id, *, confirmed_only=False):
+        ''' Returns the SlpTokenSummary of the unspent coins of token_id. '''
+        with self.lock:
+            self._slp_sums_refresh()
+            sums = self._slp_token_sums.get(token_id)
+        return self._slp_summary(sums, confirmed_only)
+
+    def get_slp_token_summaries(self, *, confirmed_only=False):
+        ''' Returns a dict of token_id -> SlpTokenSummary for the tokens of
+        which the wallet has unspent coins, in time proportional to the
+        number of tokens rather than of coins. '''
+        with self.lock:
+            self._slp_sums_refresh()
+            return {token_id: self._slp_summary(sums, confirmed_only)
+                    for token_id, sums in self._slp_token_sums.items()}
+
+    @staticmethod
+    def _slp_summary(sums, confirmed_only):
+        if sums is None:
+            return SlpTokenSummary(0, 0, 0, 0, 0)
+        if confirmed_only:
+            return SlpTokenSummary(*sums[:5])
+        return SlpTokenSummary(*(a + b for a, b in zip(sums[:5], sums[5:])))
+
+    def _slp_sums_reset(self):
+        ''' (Re)initialize the per-token sums of the unspent SLP coins. They
+        are rebuilt lazily on next use. '''
+        with self._slp_sums_lock:
+            self._slp_addr_sums = {}  # Address -> dict of token_id -> list of 10 sums, see _slp_addr_token_sums
+            self._slp_token_sums = {}  # token_id -> list of 10 sums, those of all addresses
+            self._slp_sums_dirty = None  # set of Address, None means "rebuild everything"
+
+    def _slp_sums_mark_dirty(self, addresses):
+        with self._slp_sums_lock:
+            dirty = self._slp_sums_dirty
+            if dirty is not None:
+                dirty.update(addresses)
+
+    def _slp_sums_refresh(self):
+        ''' Recompute the sums of all dirty addresses. Callers are expected
+        to hold self.lock. '''
+        with self._slp_sums_lock:
+            dirty = self._slp_sums_dirty
+            if dirty is None:
+                self._slp_addr_sums, self._slp_token_sums = {}, {}
+                dirty = list(self._slp_txo)
+            elif not dirty:
+                return
+            self._slp_sums_dirty = set()
+            addr_sums, token_sums = self._slp_addr_sums, self._slp_token_sums
+        for addr in dirty:
+            for token_id, sums in addr_sums.pop(addr, {}).items():
+                total = token_sums[token_id]
+                for i, x in enumerate(sums):
+                    total[i] -= x
+                if not any(total):
+                    del token_sums[token_id]
+            new = self._slp_addr_token_sums(addr)
+            if new:
+                addr_sums[addr] = new
+                for token_id, sums in new.items():
+                    total = token_sums.setdefault(token_id, [0] * 10)
+                    for i, x in enumerate(sums):
+                        total[i] += x
+
+    def _slp_addr_token_sums(self, addr):
+        ''' Returns a dict of token_id -> list of the sums of the unspent
+        coins of addr: the SlpTokenSummary fields of its confirmed coins,
+        followed by those of the unconfirmed ones. Callers are expected to
+        hold self.lock. '''
+        addrslptxo = self._slp_txo.get(addr)
+        if not addrslptxo or not self.is_mine(addr):
+            return {}
+        frozen_addr = addr in self.frozen_addresses
+        ret = {}
+        for txo, (tx_height, value, is_cb, is_slp) in self._get_addr_utxo_index(addr).items():
+            if not is_slp:
+                continue
+            d = addrslptxo.get(txo[0], {}).get(txo[1])
+            validity = self.tx_tokinfo.get(txo[0], {}).get('validity')
+            if not d or validity is None:
+                continue
+            sums = ret.get(d['token_id'])
+            if sums is None:
+                sums = ret[d['token_id']] = [0] * 10
+            k = 0 if tx_height > 0 else 5
+            qty = d['qty']
+            if qty == 'MINT_BATON':
+                if validity == 1:
+                    sums[k + 4] += 1
+            elif validity == 1:
+                sums[k] += qty
+                if frozen_addr or txo in self.frozen_coins:
+                    sums[k + 3] += qty
+            elif validity == 0:
+                sums[k + 1] += qty
+            else:
+                sums[k + 2] += qty
+        return ret
 
     def get_utxos(self, *, domain = None, exclude_frozen = False, mature = False, confirmed_only = False, exclude_slp = True):
         ''' Note that exclude_frozen = True checks for BOTH address-level and coin-level frozen status. '''
@@ -1130,17 +1373,28 @@ class Abstract_Wallet(PrintError):
             domain = self.get_addresses()
         if exclude_frozen:
             domain = set(domain) - self.frozen_addresses
+        frozen_coins = self.frozen_coins
+        local_height = self.get_local_height() if mature else 0
         for addr in domain:
-            utxos = self.get_addr_utxo(addr, exclude_slp=exclude_slp)
-            for x in utxos.values():
-                if exclude_frozen and x['is_frozen_coin']:
+            for txo, (tx_height, value, is_cb, is_slp) in self._get_addr_utxo_index(addr).items():
+                if exclude_slp and is_slp:
                     continue
-                if confirmed_only and x['height'] <= 0:
+                is_frozen_coin = txo in frozen_coins
+                if exclude_frozen and is_frozen_coin:
                     continue
-                if mature and x['coinbase'] and x['height'] + COINBASE_MATURITY > self.get_local_height():
+                if confirmed_only and tx_height <= 0:
                     continue
-                coins.append(x)
-                continue
+                if mature and is_cb and tx_height + COINBASE_MATURITY > local_height:
+                    continue
+                coins.append({
+                    'address':addr,
+                    'value':value,
+                    'prevout_n':txo[1],
+                    'prevout_hash':txo[0],
+                    'height':tx_height,
+                    'coinbase':is_cb,
+                    'is_frozen_coin':is_frozen_coin
+                })
         return coins
 
     def get_slp_utxos(self, slpTokenId, *, domain = None, exclude_frozen = False, confirmed_only = False, slp_include_invalid=False, slp_include_baton=False):
@@ -1183,7 +1437,7 @@ class Abstract_Wallet(PrintError):
                 _, spent = self.get_addr_io(addr)
                 for txid, txdict in addrdict.items():
                     for idx, txo in txdict.items():
-                        if (txid + ":" + str(idx)) in spent:
+                        if (txid, idx) in spent:
                             continue
                         try:
                             for i, a, _ in self.txo[txid][addr]:
@@ -1220,14 +1474,8 @@ class Abstract_Wallet(PrintError):
         self.pruned_txo. This is necessary for handling tx's with esoteric p2sh
         scriptSigs and detecting balance changes properly for txins
         containing such scriptSigs. See #895. '''
-        def deser(ser):
-            prevout_hash, prevout_n = ser.split(':')
-            prevout_n = int(prevout_n)
-            return prevout_hash, prevout_n
-        def mkser(prevout_hash, prevout_n):
-            return f'{prevout_hash}:{prevout_n}'
-        def rm(ser, pruned_too=True, *, tup = None):
-            h, n = tup or deser(ser)  # tup arg is for performance when caller already knows the info (avoid a redundant .split on ':')
+        def rm(ser, pruned_too=True):
+            h, n = ser
             s = txid_n[h]
             s.discard(n)
             if not s:
@@ -1237,7 +1485,7 @@ class Abstract_Wallet(PrintError):
                     tx_hash = self.pruned_txo.pop(ser, None)
                     self.pruned_txo_values.discard(tx_hash)
         def add(ser):
-            prevout_hash, prevout_n = deser(ser)
+            prevout_hash, prevout_n = ser
             txid_n[prevout_hash].add(prevout_n)
         def keep_running():
             return bool(self.network and self.pruned_txo_cleaner_thread is me)
@@ -1253,22 +1501,22 @@ class Abstract_Wallet(PrintError):
             with self.lock:
                 # Setup -- grab whatever was already in pruned_txo at thread
                 # start
-                for ser in self.pruned_txo:
-                    h, n = deser(ser)
+                for h, n in self.pruned_txo:
                     txid_n[h].add(n)
             while keep_running():
                 try:
-                    ser = q.get(timeout=5.0 if can_do_work() else 20.0)
-                    if ser is None:
+                    item = q.get(timeout=5.0 if can_do_work() else 20.0)
+                    if item is None:
                         # quit thread
                         return
-                    if ser.startswith('r_'):
+                    removed, ser = item
+                    if removed:
                         # remove requested
-                        rm(ser[2:], False)
+                        rm(ser, False)
                     else:
                         # ser was added
                         add(ser)
-                    del ser
+                    del item, removed, ser
                 except queue.Empty:
                     pass
                 if not can_do_work():
@@ -1280,12 +1528,12 @@ class Abstract_Wallet(PrintError):
                 defunct_ct = 0
                 for prevout_hash, s in txid_n.copy().items():
                     for prevout_n in s.copy():
-                        ser = mkser(prevout_hash, prevout_n)
+                        ser = (prevout_hash, prevout_n)
                         with self.lock:
                             defunct = ser not in self.pruned_txo
                         if defunct:
                             #self.print_error(f"{me.name}: skipping already-cleaned", ser)
-                            rm(ser, False, tup=(prevout_hash, prevout_n))
+                            rm(ser, False)
                             defunct_ct += 1
                             continue
                 if defunct_ct and debug:
@@ -1318,12 +1566,12 @@ class Abstract_Wallet(PrintError):
                     if not keep_running():
                         return
                     for prevout_n in s.copy():
-                        ser = mkser(prevout_hash, prevout_n)
+                        ser = (prevout_hash, prevout_n)
                         try:
                             txo = tx.outputs()[prevout_n]
                         except IndexError:
-                            self.print_error(f"{me.name}: ERROR -- could not find output", ser)
-                            rm(ser, True, tup=(prevout_hash, prevout_n))
+                            self.print_error(f"{me.name}: ERROR -- could not find output", outpoint_to_string(ser))
+                            rm(ser, True)
                             continue
                         _typ, addr, v = txo
                         rm_pruned_too = False
@@ -1332,16 +1580,16 @@ class Abstract_Wallet(PrintError):
                             if not mine and ser in self.pruned_txo:
                                 ct += 1
                                 rm_pruned_too = True
-                        rm(ser, rm_pruned_too, tup=(prevout_hash, prevout_n))
+                        rm(ser, rm_pruned_too)
                         if rm_pruned_too and debug:
-                            self.print_error(f"{me.name}: DEBUG removed", ser)
+                            self.print_error(f"{me.name}: DEBUG removed", outpoint_to_string(ser))
                 if ct:
                     with self.lock:
                         # Save changes to storage -- this is cheap and doesn't
                         # actually write to file yet, just flags storage as
                         # 'dirty' for when wallet.storage.write() is called
                         # later.
-                        self.storage.put('pruned_txo', self.pruned_txo)
+                        self._save_pruned_txo()
                     self.print_error(f"{me.name}: removed", ct,
                                      "(non-relevant) pruned_txo's in",
                                      f'{time.time()-t0:3.2f}', "seconds")
@@ -1358,6 +1606,7 @@ class Abstract_Wallet(PrintError):
             self.print_error("add_transaction: WARNING a tx came in from the network with 0 inputs! Bad server? Ignoring tx:", tx_hash)
             return
         is_coinbase = tx.inputs()[0]['type'] == 'coinbase'
+        tx_hash = sys.intern(tx_hash)  # shared with the outpoint tuples keyed on this tx
         with self.lock:
             # HELPER FUNCTIONS
             def add_to_self_txi(tx_hash, addr, ser, v):
@@ -1382,21 +1631,21 @@ class Abstract_Wallet(PrintError):
                             return addr2, v
                 return (None, None)
             def txin_get_info(txin):
-                prevout_hash = txi['prevout_hash']
+                prevout_hash = sys.intern(txi['prevout_hash'])
                 prevout_n = txi['prevout_n']
-                ser = prevout_hash + ':%d'%prevout_n
+                ser = (prevout_hash, prevout_n)
                 return prevout_hash, prevout_n, ser
             def put_pruned_txo(ser, tx_hash):
                 self.pruned_txo[ser] = tx_hash
                 self.pruned_txo_values.add(tx_hash)
                 t = self.pruned_txo_cleaner_thread
-                if t and t.q: t.q.put(ser)
+                if t and t.q: t.q.put((False, ser))
             def pop_pruned_txo(ser):
                 next_tx = self.pruned_txo.pop(ser, None)
                 if next_tx:
                     self.pruned_txo_values.discard(next_tx)
                     t = self.pruned_txo_cleaner_thread
-                    if t and t.q: t.q.put('r_' + ser)  # notify of removal
+                    if t and t.q: t.q.put((True, ser))  # notify of removal
                 return next_tx
             # /HELPER FUNCTIONS
 
@@ -1419,7 +1668,7 @@ class Abstract_Wallet(PrintError):
                         # the spend for when the receive tx will arrive into
                         # this function later.
                         put_pruned_txo(ser, tx_hash)
-                    self._addr_bal_cache.pop(addr, None)  # invalidate cache entry
+                    self._invalidate_address(addr)  # invalidate cache entry
                     del dd, prevout_hash, prevout_n, ser
                 elif addr is None:
                     # Unknown/unparsed address.. may be a strange p2sh scriptSig
@@ -1430,7 +1679,7 @@ class Abstract_Wallet(PrintError):
                     addr2, v = find_in_self_txo(prevout_hash, prevout_n)
                     if addr2 is not None and self.is_mine(addr2):
                         add_to_self_txi(tx_hash, addr2, ser, v)
-                        self._addr_bal_cache.pop(addr2, None)  # invalidate cache entry
+                        self._invalidate_address(addr2)  # invalidate cache entry
                     else:
                         # Not found in self.txo. It may still be one of ours
                         # however since tx's can come in out of order due to
@@ -1457,7 +1706,7 @@ class Abstract_Wallet(PrintError):
             # add outputs
             self.txo[tx_hash] = d = {}
             for n, txo in enumerate(tx.outputs()):
-                ser = tx_hash + ':%d'%n
+                ser = (tx_hash, n)
                 _type, addr, v = txo
                 mine = False
                 if self.is_mine(addr):
@@ -1468,11 +1717,12 @@ class Abstract_Wallet(PrintError):
                         d[addr] = l = []
                     l.append((n, v, is_coinbase))
                     del l
-                    self._addr_bal_cache.pop(addr, None)  # invalidate cache entry
+                    self._invalidate_address(addr)  # invalidate cache entry
                 # give v to txi that spends me
                 next_tx = pop_pruned_txo(ser)
                 if next_tx is not None and mine:
                     add_to_self_txi(next_tx, addr, ser, v)
+                    self._slp_ledger_mark_dirty(next_tx)
             # don't keep empty entries in self.txo
             if not d:
                 self.txo.pop(tx_hash, None)
@@ -1483,6 +1733,8 @@ class Abstract_Wallet(PrintError):
 
             ### SLP: Handle incoming SLP transaction outputs here
             self.handleSlpTransaction(tx_hash, tx)
+            self._slp_ledger_mark_dirty(tx_hash)
+            self._notify_tx_changed(tx_hash)
 
     """
     Callers are expected to take lock(s). We take no locks
@@ -1612,6 +1864,7 @@ class Abstract_Wallet(PrintError):
                 (txid,node), = job.nodes.items()
                 val = node.validity
                 tti['validity'] = val
+                self.slp_validity_changed(txid)
                 slp_gs_mgr.slp_validity_signal.emit(txid, val)
 
             if tti['type'] in ['SLP1']:
@@ -1629,6 +1882,17 @@ class Abstract_Wallet(PrintError):
                 # it impacted performance. SLP validation can create a *lot* of jobs!
                 #finalization_print_error(job, f"[{self.basename()}] Job for {tx_hash} type {tti['type']} finalized")
 
+    def slp_prioritize_validation(self, txids):
+        """ Ask the SLP validators to validate these txids (if still pending)
+        ahead of the others, e.g. because they are shown in the GUI. """
+        graphs = (self.slp_graph_0x01, self.slp_graph_0x01_nft)
+        if not any(graphs):
+            return
+        txids = list(txids)
+        for graph in graphs:
+            if graph:
+                graph.prioritize(txids)
+
     def rebuild_slp(self,):
         """Wipe away old SLP transaction data and rerun on the entire tx set.
 
@@ -1636,6 +1900,8 @@ class Abstract_Wallet(PrintError):
         with self.lock:
             self._slp_txo = defaultdict(lambda: defaultdict(dict))
             self.tx_tokinfo = {}
+            self._invalidate_all_addresses()  # is_slp flags need recomputing
+            self._slp_ledger_reset()
             for txid, tx in self.transactions.items():
                 self.handleSlpTransaction(txid, tx)
 
@@ -1656,12 +1922,13 @@ class Abstract_Wallet(PrintError):
                     ll = l[:]
                     for item in ll:
                         ser, v = item
-                        prev_hash, prev_n = ser.split(':')
+                        prev_hash, prev_n = ser
                         if prev_hash == tx_hash:
-                            self._addr_bal_cache.pop(addr, None)  # invalidate cache entry
+                            self._invalidate_address(addr)  # invalidate cache entry
                             l.remove(item)
                             self.pruned_txo[ser] = next_tx
                             self.pruned_txo_values.add(next_tx)
+                            self._slp_ledger_mark_dirty(next_tx)
                     if l == []:
                         dd.pop(addr)
                     else:
@@ -1670,16 +1937,19 @@ class Abstract_Wallet(PrintError):
             # invalidate addr_bal_cache for outputs involving this tx
             d = self.txo.get(tx_hash, {})
             for addr in d:
-                self._addr_bal_cache.pop(addr, None)  # invalidate cache entry
+                self._invalidate_address(addr)  # invalidate cache entry
 
             self.txi.pop(tx_hash, None)
             self.txo.pop(tx_hash, None)
             self.tx_fees.pop(tx_hash, None)
+            self._notify_tx_changed(tx_hash)
             self.tx_tokinfo[tx_hash] = {}
 
             for addr, addrdict in self._slp_txo.items():
                 if tx_hash in addrdict: addrdict[tx_hash] = {}
 
+            self._slp_ledger_mark_dirty(tx_hash)
+
     def receive_tx_callback(self, tx_hash, tx, tx_height):
         self.add_transaction(tx_hash, tx)
         self.add_unverified_tx(tx_hash, tx_height)
@@ -1692,6 +1962,7 @@ class Abstract_Wallet(PrintError):
                     s = self.tx_addr_hist.get(tx_hash)
                     if s:
                         s.discard(addr)
+                        self._slp_ledger_mark_dirty(tx_hash)
                     if not s:
                         # if no address references this tx anymore, kill it
                         # from txi/txo dicts.
@@ -1702,14 +1973,17 @@ class Abstract_Wallet(PrintError):
                         # storage, it merely removes it from the self.txi
                         # and self.txo dicts
                         self.remove_transaction(tx_hash)
-            self._addr_bal_cache.pop(addr, None)  # unconditionally invalidate cache entry
+            self._invalidate_address(addr)  # unconditionally invalidate cache entry
             self._history[addr] = hist
 
             for tx_hash, tx_height in hist:
                 # add it in case it was previously unconfirmed
                 self.add_unverified_tx(tx_hash, tx_height)
                 # add reference in tx_addr_hist
-                self.tx_addr_hist[tx_hash].add(addr)
+                s = self.tx_addr_hist[tx_hash]
+                if addr not in s:
+                    s.add(addr)
+                    self._slp_ledger_mark_dirty(tx_hash)
                 # if addr is new, we have to recompute txi and txo
                 tx = self.transactions.get(tx_hash)
                 if tx is not None and self.txi.get(tx_hash, {}).get(addr) is None and self.txo.get(tx_hash, {}).get(addr) is None:
@@ -1721,62 +1995,83 @@ class Abstract_Wallet(PrintError):
         if self.network:
             self.network.trigger_callback('on_history', self)
 
-    def get_slp_history(self, domain=None, validities_considered=(None,0,1)):
+    def get_slp_history(self, domain=None, validities_considered=(None,0,1), *,
+                        token_id=None, offset=0, limit=None):
+        ''' Returns a flat list of (tx_hash, height, conf, timestamp, delta,
+        token_id) tuples, newest first. Optionally restricted to a single
+        `token_id`, and paged via `offset` and `limit`. '''
         history = []
-        histories = self.get_slp_histories(domain=domain, validities_considered=validities_considered)
+        histories = self.get_slp_histories(domain=domain, validities_considered=validities_considered,
+                                           token_ids=None if token_id is None else (token_id,))
         # Take separate token histories and flatten them, then sort them.
         for token_id,t_history in histories.items():
             for tx_hash, height, conf, timestamp, delta in t_history:
                 history.append((tx_hash, height, conf, timestamp, delta, token_id))
         history.sort(key = lambda x: self.get_txpos(x[0]), reverse=True)
 
+        if offset or limit is not None:
+            history = history[offset:None if limit is None else offset + limit]
         return history
 
-    def get_slp_histories(self, domain=None, validities_considered=(0,1)):
+    def get_slp_histories(self, domain=None, validities_considered=(0,1), *, token_ids=None):
         # Based on get_history.
         # We return a dict of histories, one history per token_id.
-
-        # get domain
-        if domain is None:
-            domain = self.get_addresses()
-
-        #1. Big iteration to find all deltas and put them in the right place.
-        token_tx_deltas = defaultdict(lambda: defaultdict(int)) # defaultdict of defaultdicts of ints :)
-        for addr in domain:
-            h = self.get_address_history(addr)
-            with self.lock:
-                addrslptxo = self._slp_txo[addr]
-
-                for tx_hash, height in h:
-                    if tx_hash in self.pruned_txo.values():
+        # If `token_ids` is specified, only those tokens are returned.
+        with self.lock:
+            if domain is None:
+                # Fast path: use the maintained per-token ledger
+                self._slp_ledger_refresh()
+                ledger = self._slp_ledger
+                if token_ids is None:
+                    token_ids = list(self._slp_token_txs)
+                token_txs = ((token_id, self._slp_token_txs.get(token_id, ()))
+                             for token_id in token_ids)
+                contribs = lambda tx_hash: ledger[tx_hash]
+            else:
+                # Slow path: compute the contributions for just the
+                # requested domain
+                domain = set(domain)
+                ledger = {}
+                for addr in domain:
+                    for tx_hash, height in self.get_address_history(addr):
+                        if tx_hash not in ledger:
+                            ledger[tx_hash] = self._slp_tx_contributions(
+                                tx_hash, self.tx_addr_hist.get(tx_hash, set()) & domain)
+                by_token = defaultdict(list)
+                for tx_hash, d in ledger.items():
+                    for token_id in d:
+                        by_token[token_id].append(tx_hash)
+                if token_ids is None:
+                    token_ids = list(by_token)
+                token_txs = ((token_id, by_token.get(token_id, ()))
+                             for token_id in token_ids)
+                contribs = lambda tx_hash: ledger[tx_hash]
+
+            #1. Sum up the deltas, filtering by the *current* validity of
+            #   the tx that each contribution came from.
+            token_tx_deltas = {}
+            for token_id, tx_hashes in token_txs:
+                tx_deltas = {}
+                for tx_hash in tx_hashes:
+                    if tx_hash in self.pruned_txo_values:
                         continue
-                    tti = self.tx_tokinfo.get(tx_hash)
-                    if tti and tti['validity'] in validities_considered:
-                        txdict = addrslptxo.get(tx_hash,{})
-
-                        for idx,d in txdict.items():
-                            if isinstance(d['qty'],int):
-                                token_tx_deltas[d['token_id']][tx_hash] += d['qty']  # received!
-
-                    # scan over all txi's, trying to find if they were tokens, which tokens, and how much
-                    # (note that non-SLP txes can spend (burn) SLP --- and SLP of tokenA can burn tokenB)
-                    for n, _ in self.txi.get(tx_hash, {}).get(addr, ()):
-                        prevtxid, prevout_str = n.rsplit(':',1)
-                        tti = self.tx_tokinfo.get(prevtxid)
-                        if not (tti and tti['validity'] in validities_considered):
-                            continue
-                        prevout = int(prevout_str)
-
-                        d = addrslptxo.get(prevtxid,{}).get(prevout,{})
-                        if isinstance(d.get('qty',None),int):
-                            token_tx_deltas[d['token_id']][tx_hash] -= d['qty']  # received!
+                    counted = False
+                    delta = 0
+                    for src_txid, qty in contribs(tx_hash)[token_id]:
+                        tti = self.tx_tokinfo.get(src_txid)
+                        if tti and tti['validity'] in validities_considered:
+                            counted = True
+                            delta += qty
+                    if counted:
+                        tx_deltas[tx_hash] = delta
+                if tx_deltas:
+                    token_tx_deltas[token_id] = tx_deltas
 
         # 2. create history (no sorting needed since balances won't be computed)
         histories = {}
         for token_id, tx_deltas in token_tx_deltas.items():
             history = histories[token_id] = []
-            for tx_hash in tx_deltas:
-                delta = tx_deltas[tx_hash]
+            for tx_hash, delta in tx_deltas.items():
                 height, conf, timestamp = self.get_tx_height(tx_hash)
                 history.append((tx_hash, height, conf, timestamp, delta))
 
@@ -1784,6 +2079,72 @@ class Abstract_Wallet(PrintError):
 
         return histories
 
+    def _slp_tx_contributions(self, tx_hash, addrs):
+        ''' Returns a dict of token_id -> list of (src_txid, qty) describing
+        how `tx_hash` changes the token balances of `addrs`. Received tokens
+        have src_txid == tx_hash and positive qty, spent (or burned) tokens
+        carry the txid of the spent coin and negative qty. The validity of
+        src_txid decides whether a contribution counts, which is checked at
+        query time so that validation results need no recomputation here.
+
+        Callers are expected to hold self.lock. '''
+        contribs = defaultdict(list)
+        for addr in addrs:
+            addrslptxo = self._slp_txo.get(addr)
+            if addrslptxo is None:
+                continue
+            for d in addrslptxo.get(tx_hash, {}).values():
+                if isinstance(d['qty'], int):
+                    contribs[d['token_id']].append((tx_hash, d['qty']))  # received!
+            # scan over all txi's, trying to find if they were tokens, which tokens, and how much
+            # (note that non-SLP txes can spend (burn) SLP --- and SLP of tokenA can burn tokenB)
+            for (prevtxid, prevout_n), _ in self.txi.get(tx_hash, {}).get(addr, ()):
+                d = addrslptxo.get(prevtxid, {}).get(prevout_n)
+                if d and isinstance(d.get('qty'), int):
+                    contribs[d['token_id']].append((prevtxid, -d['qty']))  # spent!
+        return contribs
+
+    def _slp_ledger_reset(self):
+        ''' (Re)initialize the per-token SLP delta ledger used by
+        get_slp_histories. The ledger is rebuilt lazily on next use. '''
+        self._slp_ledger = {}  # tx_hash -> dict of token_id -> list of (src_txid, qty)
+        self._slp_token_txs = defaultdict(set)  # token_id -> set of tx_hash
+        self._slp_ledger_dirty = None  # None means "rebuild everything"
+
+    def _slp_ledger_mark_dirty(self, tx_hash):
+        ''' Flag the ledger entry for tx_hash as needing recomputation.
+        Callers are expected to hold self.lock. '''
+        dirty = self._slp_ledger_dirty
+        if dirty is not None:
+            dirty.add(tx_hash)
+
+    def _slp_ledger_refresh(self):
+        ''' Recompute the ledger entries of all dirty txs. Callers are
+        expected to hold self.lock. '''
+        dirty = self._slp_ledger_dirty
+        if dirty is None:
+            self._slp_ledger.clear()
+            self._slp_token_txs.clear()
+            dirty = list(self.tx_addr_hist)
+        elif not dirty:
+            return
+        ledger, token_txs = self._slp_ledger, self._slp_token_txs
+        for tx_hash in dirty:
+            old = ledger.pop(tx_hash, None)
+            if old:
+                for token_id in old:
+                    s = token_txs.get(token_id)
+                    if s is not None:
+                        s.discard(tx_hash)
+                        if not s:
+                            del token_txs[token_id]
+            new = self._slp_tx_contributions(tx_hash, self.tx_addr_hist.get(tx_hash, ()))
+            if new:
+                ledger[tx_hash] = new
+                for token_id in new:
+                    token_txs[token_id].add(tx_hash)
+        self._slp_ledger_dirty = set()
+
     def get_history(self, domain=None, *, reverse=False):
         # get domain
         if domain is None:
@@ -1826,22 +2187,38 @@ class Abstract_Wallet(PrintError):
     def export_history(self, domain=None, from_timestamp=None, to_timestamp=None, fx=None,
                        show_addresses=False, decimal_point=8,
                        *, fee_calc_timeout=10.0, download_inputs=False,
-                       progress_callback=None):
-        ''' Export history. Used by RPC & GUI.
+                       progress_callback=None, offset=0, limit=None):
+        ''' Export history. Used by RPC & GUI. Returns the list of items
+        yielded by iter_history_export(), see that function for the args. '''
+        return list(self.iter_history_export(domain, from_timestamp, to_timestamp, fx,
+                                             show_addresses, decimal_point,
+                                             fee_calc_timeout=fee_calc_timeout,
+                                             download_inputs=download_inputs,
+                                             progress_callback=progress_callback,
+                                             offset=offset, limit=limit))
+
+    def iter_history_export(self, domain=None, from_timestamp=None, to_timestamp=None, fx=None,
+                            show_addresses=False, decimal_point=8,
+                            *, fee_calc_timeout=10.0, download_inputs=False,
+                            progress_callback=None, offset=0, limit=None,
+                            batch_size=100):
+        ''' Generator yielding the exported history items (dicts), newest
+        first. History is processed in batches of `batch_size` txs, and only
+        the txs of the current batch are kept deserialized, so memory use
+        doesn't grow with the size of the history.
 
         Arg notes:
-        - `fee_calc_timeout` is used when computing the fee (which is done
-          asynchronously in another thread) to limit the total amount of time in
-          seconds spent waiting for fee calculation. The timeout is a total time
-          allotment for this function call. (The reason the fee calc can take a
-          long time is for some pathological tx's, it is very slow to calculate
-          fee as it involves deserializing prevout_tx from the wallet, for each
-          input).
+        - `offset` and `limit` select a page of the history, after the
+          timestamp filtering. Only the txs of the page are examined.
+        - `fee_calc_timeout` limits the total amount of time in seconds spent
+          waiting for prevout txs from the network to calculate fees.
         - `download_inputs`, if True, will allow for more accurate fee data to
-          be exported with the history by using the Transaction class input
-          fetcher to download *all* prevout_hash tx's for inputs (even for
-          inputs not in wallet). This feature requires self.network (ie, we need
-          to be online) otherwise it will behave as if download_inputs=False.
+          be exported with the history by downloading the prevout txs of
+          inputs that are neither in the wallet nor in the Transaction class
+          cache, for fees that can't be calculated otherwise. All prevout txs
+          needed by a batch are requested at once, spread over the connected
+          servers. This feature requires self.network (ie, we need to be
+          online) otherwise it will behave as if download_inputs=False.
         - `progress_callback`, if specified, is a callback which receives a
           single float argument in the range [0.0,1.0] indicating how far along
           the history export is going. This is intended for interop with GUI
@@ -1851,86 +2228,21 @@ class Abstract_Wallet(PrintError):
 
         Note on side effects: This function may update self.tx_fees. Rationale:
         it will spend some time trying very hard to calculate accurate fees by
-        examining prevout_tx's (leveraging the fetch_input_data code in the
-        Transaction class). As such, it is worthwhile to cache the results in
-        self.tx_fees, which gets saved to wallet storage. This is not very
+        examining prevout_tx's. As such, it is worthwhile to cache the results
+        in self.tx_fees, which gets saved to wallet storage. This is not very
         demanding on storage as even for very large wallets with huge histories,
         tx_fees does not use more than a few hundred kb of space. '''
-        from .util import timestamp_to_datetime
-        # we save copies of tx's we deserialize to this temp dict because we do
-        # *not* want to deserialize tx's in wallet.transactoins since that
-        # wastes memory
-        local_tx_cache = {}
-        # some helpers for this function
         t0 = time.time()
         def time_remaining(): return max(fee_calc_timeout - (time.time()-t0), 0)
-        class MissingTx(RuntimeError):
-            ''' Can happen in rare circumstances if wallet history is being
-            radically reorged by network thread while we are in this code. '''
-        def get_tx(tx_hash):
-            ''' Try to get a tx from wallet, then from the Transaction class
-            cache if that fails. In either case it deserializes the copy and
-            puts the deserialized tx in local stack dict local_tx_cache. The
-            reason we don't deserialize the tx's from self.transactions is that
-            we do not want to keep deserialized tx's in memory. The
-            self.transactions dict should contain just raw tx's (not
-            deserialized). Deserialized tx's eat on the order of 10x the memory
-            because because of the Python lists, dict, etc they contain, per
-            instance. '''
-            tx = local_tx_cache.get(tx_hash)
-            if tx:
-                return tx
-            tx = Transaction.tx_cache_get(tx_hash)
-            if not tx:
-                tx = copy.deepcopy(self.transactions.get(tx_hash))
-            if tx:
-                tx.deserialize()
-                local_tx_cache[tx_hash] = tx
-            else:
-                raise MissingTx(f'txid {tx_hash} dropped out of wallet history while exporting')
-            return tx
-        def try_calc_fee(tx_hash):
-            ''' Try to calc fee from cheapest to most expensive calculation.
-            Ultimately asks the transaction class to look at prevouts in wallet and uses
-            that scheme as a last (more CPU intensive) resort. '''
-            fee = self.tx_fees.get(tx_hash)
-            if fee is not None:
-                return fee
-            def do_get_fee(tx_hash):
-                tx = get_tx(tx_hash)
-                def try_get_fee(tx):
-                    try: return tx.get_fee()
-                    except InputValueMissing: pass
-                fee = try_get_fee(tx)
-                t_remain = time_remaining()
-                if fee is None and t_remain:
-                    q = queue.Queue()
-                    def done():
-                        q.put(1)
-                    tx.fetch_input_data(self, use_network=bool(download_inputs), done_callback=done)
-                    try: q.get(timeout=t_remain)
-                    except queue.Empty: pass
-                    fee = try_get_fee(tx)
-                return fee
-            fee = do_get_fee(tx_hash)
-            if fee is not None:
-                self.tx_fees[tx_hash] = fee  # save fee to wallet if we bothered to dl/calculate it.
-            return fee
         def fmt_amt(v, is_diff):
             if v is None:
                 return '--'
             return format_satoshis(v, decimal_point=decimal_point,
                                    is_diff=is_diff)
 
-        # grab history
-        h = self.get_history(domain, reverse=True)
-        out = []
-
-        n, l = 0, max(1, float(len(h)))
-        for tx_hash, height, conf, timestamp, value, balance in h:
-            if progress_callback:
-                progress_callback(n/l)
-            n += 1
+        # grab history, and select the rows to export
+        rows = []
+        for tx_hash, height, conf, timestamp, value, balance in self.get_history(domain, reverse=True):
             timestamp_safe = timestamp
             if timestamp is None:
                 timestamp_safe = time.time()  # set it to "now" so below code doesn't explode.
@@ -1938,55 +2250,210 @@ class Abstract_Wallet(PrintError):
                 continue
             if to_timestamp and timestamp_safe >= to_timestamp:
                 continue
-            try:
-                fee = try_calc_fee(tx_hash)
-            except MissingTx as e:
-                self.print_error(str(e))
-                continue
-            item = {
-                'txid'          : tx_hash,
-                'height'        : height,
-                'confirmations' : conf,
-                'timestamp'     : timestamp_safe,
-                'value'         : fmt_amt(value, is_diff=True),
-                'fee'           : fmt_amt(fee, is_diff=False),
-                'balance'       : fmt_amt(balance, is_diff=False),
-            }
-            if item['height'] > 0:
-                date_str = format_time(timestamp) if timestamp is not None else _("unverified")
-            else:
-                date_str = _("unconfirmed")
-            item['date'] = date_str
-            try:
-                # Defensive programming.. sanitize label.
-                # The below ensures strings are utf8-encodable. We do this
-                # as a paranoia measure.
-                item['label'] = self.get_label(tx_hash).encode(encoding='utf-8', errors='replace').decode(encoding='utf-8', errors='replace')
-            except UnicodeError:
-                self.print_error(f"Warning: could not export label for {tx_hash}, defaulting to ???")
-                item['label'] = "???"
-            if show_addresses:
-                tx = get_tx(tx_hash)
-                input_addresses = []
-                output_addresses = []
-                for x in tx.inputs():
-                    if x['type'] == 'coinbase': continue
-                    addr = x.get('address')
-                    if addr == None: continue
-                    input_addresses.append(addr.to_ui_string())
-                for _type, addr, v in tx.outputs():
-                    output_addresses.append(addr.to_ui_string())
-                item['input_addresses'] = input_addresses
-                item['output_addresses'] = output_addresses
+            rows.append((tx_hash, height, conf, timestamp, timestamp_safe, value, balance))
+        rows = rows[offset:offset + limit if limit else None]
+
+        n, l = 0, max(1, float(len(rows)))
+        for b in range(0, len(rows), batch_size):
+            batch = rows[b:b + batch_size]
+            # we deserialize copies of the batch's tx's, since we do *not*
+            # want to deserialize tx's in wallet.transactions: deserialized
+            # tx's eat on the order of 10x the memory of raw ones.
+            txs = {}
+            for tx_hash, *_ in batch:
+                tx = Transaction.tx_cache_get(tx_hash) or self.transactions.get(tx_hash)
+                if tx:
+                    tx = Transaction(tx.raw)
+                    tx.deserialize()
+                    txs[tx_hash] = tx
+                else:
+                    # Can happen in rare circumstances if wallet history is
+                    # being radically reorged by network thread while we are in
+                    # this code.
+                    self.print_error(f'txid {tx_hash} dropped out of wallet history while exporting')
+            fees = self._calc_export_fees(txs, download_inputs and time_remaining())
             if fx is not None:
-                date = timestamp_to_datetime(timestamp_safe)
-                item['fiat_value'] = fx.historical_value_str(value, date)
-                item['fiat_balance'] = fx.historical_value_str(balance, date)
-                item['fiat_fee'] = fx.historical_value_str(fee, date)
-            out.append(item)
+                timestamps = [row[4] for row in batch]
+                fiat = zip(fx.historical_value_strs([row[5] for row in batch], timestamps),
+                           fx.historical_value_strs([row[6] for row in batch], timestamps),
+                           fx.historical_value_strs([fees.get(row[0]) for row in batch], timestamps))
+            else:
+                fiat = [None] * len(batch)
+            for (tx_hash, height, conf, timestamp, timestamp_safe, value, balance), fiat_strs in zip(batch, fiat):
+                if progress_callback:
+                    progress_callback(n/l)
+                n += 1
+                tx = txs.get(tx_hash)
+                if not tx:
+                    continue
+                fee = fees.get(tx_hash)
+                item = {
+                    'txid'          : tx_hash,
+                    'height'        : height,
+                    'confirmations' : conf,
+                    'timestamp'     : timestamp_safe,
+                    'value'         : fmt_amt(value, is_diff=True),
+                    'fee'           : fmt_amt(fee, is_diff=False),
+                    'balance'       : fmt_amt(balance, is_diff=False),
+                }
+                if item['height'] > 0:
+                    date_str = format_time(timestamp) if timestamp is not None else _("unverified")
+                else:
+                    date_str = _("unconfirmed")
+                item['date'] = date_str
+                try:
+                    # Defensive programming.. sanitize label.
+                    # The below ensures strings are utf8-encodable. We do this
+                    # as a paranoia measure.
+                    item['label'] = self.get_label(tx_hash).encode(encoding='utf-8', errors='replace').decode(encoding='utf-8', errors='replace')
+                except UnicodeError:
+                    self.print_error(f"Warning: could not export label for {tx_hash}, defaulting to ???")
+                    item['label'] = "???"
+                if show_addresses:
+                    input_addresses = []
+                    output_addresses = []
+                    for x in tx.inputs():
+                        if x['type'] == 'coinbase': continue
+                        addr = x.get('address')
+                        if addr == None: continue
+                        input_addresses.append(addr.to_ui_string())
+                    for _type, addr, v in tx.outputs():
+                        output_addresses.append(addr.to_ui_string())
+                    item['input_addresses'] = input_addresses
+                    item['output_addresses'] = output_addresses
+                if fiat_strs is not None:
+                    item['fiat_value'], item['fiat_balance'], item['fiat_fee'] = fiat_strs
+                yield item
         if progress_callback:
             progress_callback(1.0)  # indicate done, just in case client code expects a 1.0 in order to detect completion
-        return out
+
+    def _calc_export_fees(self, txs, timeout):
+        ''' Returns {tx_hash: fee} for the deserialized txs, from cheapest to
+        most expensive calculation: self.tx_fees, then the input values in
+        the tx, then the prevout txs from the wallet and the Transaction class
+        cache, and finally (if timeout) the prevout txs downloaded from the
+        network, waiting at most timeout seconds. Fees that can't be
+        calculated are left out. '''
+        fees, missing = {}, {}
+        for tx_hash, tx in txs.items():
+            fee = self.tx_fees.get(tx_hash)
+            if fee is None:
+                try:
+                    fee = tx.get_fee()
+                except InputValueMissing:
+                    missing[tx_hash] = tx
+                    continue
+            fees[tx_hash] = fee
+        if not missing:
+            return fees
+
+        # prevout_hash -> list of output values, for the prevouts we need
+        prevout_values = {}
+        need_dl = set()
+        for tx in missing.values():
+            for txin in tx.inputs():
+                h = txin['prevout_hash']
+                if txin.get('value') is not None or h in prevout_values or h in need_dl:
+                    continue
+                ptx = Transaction.tx_cache_get(h) or self.transactions.get(h)
+                if ptx and ptx.raw:
+                    try:
+                        prevout_values[h] = [v for _typ, _addr, v in Transaction(ptx.raw).outputs()]
+                    except Exception as e:
+                        self.print_error("export: failed to deserialize", h, repr(e))
+                else:
+                    need_dl.add(h)
+        if need_dl and timeout and self.network:
+            prevout_values.update(self._download_prevout_values(need_dl, timeout))
+
+        for tx_hash, tx in missing.items():
+            try:
+                input_value = 0
+                for txin in tx.inputs():
+                    v = txin.get('value')
+                    if v is None:
+                        v = prevout_values[txin['prevout_hash']][txin['prevout_n']]
+                    input_value += v
+            except (KeyError, IndexError):
+                continue
+            fees[tx_hash] = self.tx_fees[tx_hash] = input_value - tx.output_value()  # save fee to wallet since we bothered to dl/calculate it.
+        return fees
+
+    def _download_prevout_values(self, txids, timeout):
+        ''' Downloads txids in parallel, spread over the connected servers,
+        waiting at most timeout seconds. Returns {txid: list of output
+        values} for the txs that got downloaded. The txs are also put in the
+        Transaction class cache. '''
+        q = queue.Queue()
+        for txid in txids:
+            self.network.queue_request('blockchain.transaction.get', [txid],
+                                       interface='random', callback=q.put)
+        ret = {}
+        deadline = time.time() + timeout
+        try:
+            for i in range(len(txids)):
+                try:
+                    r = q.get(timeout=max(deadline - time.time(), 0.001))
+                except queue.Empty:
+                    self.print_error(f"export: timed out fetching prevout txs, got {len(ret)} of {len(txids)}")
+                    break
+                try:
+                    txid = r['params'][0]
+                    tx = Transaction(r['result'])
+                    assert txid == Transaction._txid(tx.raw), "txid-is-sane-check"  # protection against phony responses
+                    Transaction.tx_cache_put(tx=tx, txid=txid)
+                    ret[txid] = [v for _typ, _addr, v in tx.outputs()]
+                except Exception as e:
+                    self.print_error("export: bad prevout tx response:", repr(e))
+        finally:
+            # force-cancel any extant requests -- this is especially crucial
+            # on timeout.
+            self.network.cancel_requests(q.put)
+        return ret
+
+    def write_history(self, f, items, *, is_csv, include_addresses=True, fiat_currency=None):
+        ''' Writes the history items (an iterable, as returned by
+        iter_history_export()) to the text file f as they come, in CSV or
+        JSON format. Fiat columns are written if fiat_currency is specified.
+        Returns the number of items written. '''
+        count = 0
+        if is_csv:
+            writer = csv.writer(f, lineterminator='\n')
+            cols = ["transaction_hash", "label", "confirmations", "value", "fee", "timestamp"]
+            if fiat_currency:
+                cols += [f"fiat_value_{fiat_currency}", f"fiat_balance_{fiat_currency}", f"fiat_fee_{fiat_currency}"]  # in CSV mode, we use column names eg fiat_value_USD, etc
+            if include_addresses:
+                cols += ["input_addresses", "output_addresses"]
+            writer.writerow(cols)
+            for item in items:
+                cols = [item['txid'], item.get('label', ''), item['confirmations'], item['value'], item['fee'], item['date']]
+                if fiat_currency:
+                    cols += [item['fiat_value'], item['fiat_balance'], item['fiat_fee']]
+                if include_addresses:
+                    inaddrs_filtered = (x for x in (item.get('input_addresses') or [])
+                                        if Address.is_valid(x))
+                    outaddrs_filtered = (x for x in (item.get('output_addresses') or [])
+                                         if Address.is_valid(x))
+                    cols.append( ','.join(inaddrs_filtered) )
+                    cols.append( ','.join(outaddrs_filtered) )
+                writer.writerow(cols)
+                count += 1
+        else:
+            # same output as json.dumps(list(items), indent=4), one item at
+            # a time
+            for item in items:
+                if fiat_currency:
+                    item['fiat_currency'] = fiat_currency  # add the currency to each entry in the json. this wastes space but json is bloated anyway so this won't hurt too much, we hope
+                else:
+                    # No need to include these fields as they will always be 'No Data'
+                    item.pop('fiat_value', None)
+                    item.pop('fiat_balance', None)
+                    item.pop('fiat_fee', None)
+                f.write(',\n' if count else '[\n')
+                f.write('\n'.join('    ' + line for line in json.dumps(item, indent=4).split('\n')))
+                count += 1
+            f.write('\n]' if count else '[]')
+        return count
 
     def get_label(self, tx_hash):
         label = self.labels.get(tx_hash, '')
@@ -2235,15 +2702,17 @@ class Abstract_Wallet(PrintError):
         return addr in self.frozen_addresses
 
     def is_frozen_coin(self, utxo):
-        ''' 'coin' level frozen query. `utxo' is a prevout:n string, or a dict as returned from get_utxos().
+        ''' 'coin' level frozen query. `utxo' is a prevout:n string, a (prevout_hash, n) tuple, or a dict as returned from get_utxos().
             Note: this is set/unset independent of 'address' level freezing. '''
-        assert isinstance(utxo, (str, dict))
+        assert isinstance(utxo, (str, tuple, dict))
         if isinstance(utxo, dict):
-            ret = ("{}:{}".format(utxo['prevout_hash'], utxo['prevout_n'])) in self.frozen_coins
+            ret = (utxo['prevout_hash'], utxo['prevout_n']) in self.frozen_coins
             if ret != utxo['is_frozen_coin']:
                 self.print_error("*** WARNING: utxo has stale is_frozen_coin flag")
                 utxo['is_frozen_coin'] = ret # update stale flag
             return ret
+        if isinstance(utxo, str):
+            utxo = outpoint_from_string(utxo)
         return utxo in self.frozen_coins
 
     def set_frozen_state(self, addrs, freeze):
@@ -2258,33 +2727,42 @@ class Abstract_Wallet(PrintError):
             frozen_addresses = [addr.to_storage_string()
                                 for addr in self.frozen_addresses]
             self.storage.put('frozen_addresses', frozen_addresses)
+            self._slp_sums_mark_dirty(addrs)
+            self._notify_changes(addresses=addrs)
             return True
         return False
 
     def set_frozen_coin_state(self, utxos, freeze):
         ''' Set frozen state of the COINS to FREEZE, True or False.
-            utxos is a (possibly mixed) list of either "prevout:n" strings and/or coin-dicts as returned from get_utxos().
-            Note that if passing prevout:n strings as input, 'is_mine()' status is not checked for the specified coin.
+            utxos is a (possibly mixed) list of either "prevout:n" strings, (prevout_hash, n) tuples and/or coin-dicts as returned from get_utxos().
+            Note that if passing prevout:n strings or tuples as input, 'is_mine()' status is not checked for the specified coin.
             Also note that coin-level freezing is set/unset independent of address-level freezing, however both must
             be satisfied for a coin to be defined as spendable. '''
         ok = 0
+        txos = []
         for utxo in utxos:
-            if isinstance(utxo, str):
+            if isinstance(utxo, (str, tuple)):
+                txo = outpoint_from_string(utxo) if isinstance(utxo, str) else utxo
                 if freeze:
-                    self.frozen_coins |= { utxo }
+                    self.frozen_coins |= { txo }
                 else:
-                    self.frozen_coins -= { utxo }
+                    self.frozen_coins -= { txo }
+                txos.append(txo)
                 ok += 1
             elif isinstance(utxo, dict) and self.is_mine(utxo['address']):
-                txo = "{}:{}".format(utxo['prevout_hash'], utxo['prevout_n'])
+                txo = (sys.intern(utxo['prevout_hash']), utxo['prevout_n'])
                 if freeze:
                     self.frozen_coins |= { txo }
                 else:
                     self.frozen_coins -= { txo }
                 utxo['is_frozen_coin'] = bool(freeze)
+                txos.append(txo)
                 ok += 1
         if ok:
-            self.storage.put('frozen_coins', list(self.frozen_coins))
+            self.storage.put('frozen_coins', [outpoint_to_string(op) for op in self.frozen_coins])
+            for prevout_hash, n in txos:
+                self._slp_sums_mark_dirty(self.tx_addr_hist.get(prevout_hash, ()))
+            self._notify_changes(coins=txos)
         return ok
 
     def prepare_for_verifier(self):
@@ -2434,7 +2912,7 @@ class Abstract_Wallet(PrintError):
         else:
             return
         coins = self.get_addr_utxo(address)
-        item = coins.get(txid+':%d'%i)
+        item = coins.get((txid, i))
         if not item:
             return
         self.add_input_info(item)
@@ -2449,9 +2927,12 @@ class Abstract_Wallet(PrintError):
         if self.is_mine(address):
             txin['type'] = self.get_txin_type(address)
             # Bitcoin Cash needs value to sign
-            received, spent = self.get_addr_io(address)
-            item = received.get(txin['prevout_hash']+':%d'%txin['prevout_n'])
-            tx_height, value, is_cb = item
+            item = self._get_addr_utxo_index(address).get((txin['prevout_hash'], txin['prevout_n']))
+            if item is None:
+                # not (or no longer) a utxo -- fall back to the full io scan
+                received, spent = self.get_addr_io(address)
+                item = received.get((txin['prevout_hash'], txin['prevout_n']))
+            value = item[1]
             txin['value'] = value
             self.add_input_sig_info(txin, address)
 
@@ -2582,7 +3063,7 @@ class Abstract_Wallet(PrintError):
         l = []
         for txo, x in received.items():
             h, v, is_cb = x
-            txid, n = txo.split(':')
+            txid, n = txo
             info = self.verified_tx.get(txid)
             if info:
                 tx_height, timestamp, pos = info
@@ -2823,7 +3304,7 @@ class Abstract_Wallet(PrintError):
 
     def add_address(self, address):
         assert isinstance(address, Address)
-        self._addr_bal_cache.pop(address, None)  # paranoia, not really necessary -- just want to maintain the invariant that when we modify address history below we invalidate cache.
+        self._invalidate_address(address)  # paranoia, not really necessary -- just want to maintain the invariant that when we modify address history below we invalidate cache.
         self.invalidate_address_set_cache()
         if address not in self._history:
             self._history[address] = []
@@ -3005,6 +3486,7 @@ class ImportedWalletBase(Simple_Wallet):
                     for tx_hash, height in details:
                         transactions_to_remove.add(tx_hash)
                         self.tx_addr_hist[tx_hash].discard(address)
+                        self._slp_ledger_mark_dirty(tx_hash)
                         if not self.tx_addr_hist.get(tx_hash):
                             self.tx_addr_hist.pop(tx_hash, None)
                 else:
@@ -3019,7 +3501,7 @@ class ImportedWalletBase(Simple_Wallet):
                 self.verified_tx.pop(tx_hash, None)
                 self.unverified_tx.pop(tx_hash, None)
                 self.transactions.pop(tx_hash, None)
-                self._addr_bal_cache.pop(address, None)  # not strictly necessary, above calls also have this side-effect. but here to be safe. :)
+                self._invalidate_address(address)  # not strictly necessary, above calls also have this side-effect. but here to be safe. :)
                 if self.verifier:
                     # TX is now gone. Toss its SPV proof in case we have it
                     # in memory. This allows user to re-add PK again and it
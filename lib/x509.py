@@ -293,12 +293,18 @@ class X509(object):
     def check_ca(self):
         return self.CA
 
-    def check_date(self):
+    def get_validity(self):
+        ''' Returns the (not before, not after) timestamps. '''
         import time
-        now = time.time()
         TIMESTAMP_FMT = '%y%m%d%H%M%SZ'
         not_before = time.mktime(time.strptime(self.notBefore.decode('ascii'), TIMESTAMP_FMT))
         not_after = time.mktime(time.strptime(self.notAfter.decode('ascii'), TIMESTAMP_FMT))
+        return not_before, not_after
+
+    def check_date(self):
+        import time
+        now = time.time()
+        not_before, not_after = self.get_validity()
         if not_before > now:
             raise CertificateError('Certificate for {} has not yet entered its valid date range. ({})'
                                    .format(self.get_common_name(),
@@ -338,6 +344,114 @@ def load_certificates(ca_path):
     return ca_list, ca_keyID
 
 
+class CertificateStore(util.PrintError):
+    ''' The trusted CA certificates of a PEM bundle, as a read-only mapping of
+    fingerprint -> X509 like the ca_list load_certificates() returns.
+    keyIDs is the matching ca_keyID.
+
+    Building the fingerprint and keyID index requires parsing every
+    certificate of the bundle, so the index is saved to index_path (if not
+    None) along with the bundle's mtime, size and sha256, and reused until
+    the bundle changes. Certificates are then only parsed when looked up. '''
+
+    def __init__(self, ca_path, index_path=None):
+        self.ca_path = ca_path
+        self.index_path = index_path
+        self.ders = {}  # fingerprint -> DER bytes, of the certificates valid now
+        self.keyIDs = {}  # keyID -> fingerprint
+        self.certs = {}  # fingerprint -> X509, as they get looked up
+        self.load()
+
+    def __contains__(self, fingerprint):
+        return fingerprint in self.ders
+
+    def __len__(self):
+        return len(self.ders)
+
+    def __iter__(self):
+        return iter(self.ders)
+
+    def __getitem__(self, fingerprint):
+        x = self.certs.get(fingerprint)
+        if x is None:
+            x = self.certs[fingerprint] = X509(self.ders[fingerprint])
+        return x
+
+    def get(self, fingerprint, default=None):
+        return self[fingerprint] if fingerprint in self.ders else default
+
+    def read_index(self):
+        import json
+        if not self.index_path:
+            return None
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get('ca_path') == self.ca_path:
+                return index
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            self.print_error("could not read index:", repr(e))
+        return None
+
+    def write_index(self, index):
+        import json, os
+        if not self.index_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            tmp = self.index_path + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(index, f)
+            os.replace(tmp, self.index_path)
+        except Exception as e:
+            self.print_error("could not write index:", repr(e))
+
+    @staticmethod
+    def index_bundle(s):
+        ''' Returns the index entries of the PEM certificates in s. '''
+        from . import pem
+        entries = []
+        for b in pem.dePemList(s, "CERTIFICATE"):
+            try:
+                x = X509(b)
+                not_before, not_after = x.get_validity()
+            except BaseException as e:
+                util.print_error("cert error:", e)
+                continue
+            entries.append({
+                'fingerprint': bh2u(x.getFingerprint()),
+                'keyID': x.get_keyID(),
+                'not_before': not_before,
+                'not_after': not_after,
+                'der': bh2u(x.bytes),
+            })
+        return entries
+
+    @profiler
+    def load(self):
+        import os, time
+        st = os.stat(self.ca_path)
+        index = self.read_index()
+        if not index or index['mtime'] != st.st_mtime or index['size'] != st.st_size:
+            with open(self.ca_path, 'rb') as f:
+                data = f.read()
+            sha256 = hashlib.sha256(data).hexdigest()
+            if not index or index['sha256'] != sha256:
+                self.print_error("indexing", self.ca_path)
+                index = {'ca_path': self.ca_path, 'sha256': sha256,
+                         'certs': self.index_bundle(data.decode('utf-8'))}
+            index.update(mtime=st.st_mtime, size=st.st_size)
+            self.write_index(index)
+        now = time.time()
+        for entry in index['certs']:
+            if entry['not_before'] <= now < entry['not_after']:
+                fp = bytes.fromhex(entry['fingerprint'])
+                self.ders[fp] = bytes.fromhex(entry['der'])
+                self.keyIDs[entry['keyID']] = fp
+
+
 if __name__ == "__main__":
     import requests
 
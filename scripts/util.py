@@ -80,3 +80,76 @@ def send_request(peers, method, params):
     results = dict(zip(responses.keys(), [t[0][1].get('result') for t in responses.values()]))
     print("%d answers"%len(results))
     return results
+
+
+# Helpers for running SLP validation outside of the GUI, against txes held
+# in memory (see slp_replay_dag).
+
+class StubConfig:
+    '''Minimal stand-in for SimpleConfig and for the gui object that
+    slp_graph_search expects to be bound to.'''
+    def __init__(self, d=None):
+        self.d = dict(d or {})
+        self.config = self
+        self.slp_validity_signal = self
+        self.slp_validation_fetch_signal = self
+    def get(self, key, default=None):
+        return self.d.get(key, default)
+    def set_key(self, key, value, save=True):
+        self.d[key] = value
+    def emit(self, *args):
+        pass
+
+def setup_offline_slp(config=None):
+    '''Installs a StubConfig as the app config and graph search gui, with
+    graph search disabled. Returns it.'''
+    from electroncash import simple_config
+    from electroncash.slp_graph_search import slp_gs_mgr
+    config = config or StubConfig()
+    simple_config.set_config(config)
+    slp_gs_mgr.bind_gui(lambda: config)
+    return config
+
+class StubWallet:
+    '''The parts of a wallet that GraphContext.make_job uses.'''
+    def __init__(self):
+        import threading
+        self.lock = threading.RLock()
+        self.transactions = {}
+        self.slpv1_validity = {}
+        self.tx_tokinfo = {}
+        self.token_types = {}
+    def add_token_type(self, token_id, entry, check_validation=True):
+        self.token_types[token_id] = entry
+    def save_transactions(self):
+        pass
+    def slp_validity_changed(self, tx_hash):
+        pass
+
+class FakeTxNetwork:
+    '''Answers blockchain.transaction.get requests from a dict of
+    txid -> raw tx hex, on a background thread, after `latency` seconds.'''
+    def __init__(self, txs, latency=0.0):
+        import threading
+        self.txs = txs
+        self.latency = latency
+        self.requests = 0
+        self.q = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+    def send(self, messages, callback):
+        for method, params in messages:
+            self.requests += 1
+            self.q.put((time.time() + self.latency, method, params, callback))
+    def _run(self):
+        while True:
+            when, method, params, callback = self.q.get()
+            delay = when - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            resp = {'method': method, 'params': params}
+            raw = self.txs.get(params[0]) if method == 'blockchain.transaction.get' else None
+            if raw is None:
+                resp['error'] = 'not found'
+            else:
+                resp['result'] = raw
+            callback(resp)